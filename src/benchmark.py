@@ -0,0 +1,1121 @@
+import sys
+import os
+import getopt
+import time
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict
+from colorama import Fore, Style
+
+
+usage = '''\
+Usage:
+    python3 benchmark.py <benchmark> [<arguments> ...]
+
+Benchmarks:
+    extract [-n <repeat>] [<page> ...]
+        Compares the streaming link/text extractor against the BeautifulSoup
+        tree it replaced. <page> is a saved HTML file or a directory of them;
+        without any, synthetic pages are generated.
+    ingest [-n <repeat>] [-d <documents>] [--batch <size>]
+        Compares writing websites into the index one at a time against
+        writing them in batches (index.py --batch), using <documents>
+        made-up websites (default is 1000, as many as data/links/cnn-news.txt
+        lists).
+    update [-n <repeat>] [-d <documents>] [-u <updates>]
+        Compares indexing <documents> made-up texts (default is 2000) again
+        from scratch after <updates> of them (default is 100) have had a
+        few of their words changed, against updating the index in place
+        (index.py --update), which skips the texts that haven't changed and
+        writes only the postings that have. Also times deleting the
+        changed websites and compacting the index (index.py --delete).
+    query [-n <repeat>] [-d <documents>] [-q <queries>] [-k <count>]
+          [--ranker <ranker>]
+        Compares the python and numpy scorers of index.py on an index of
+        <documents> made-up websites (default is 10000), running <queries>
+        made-up queries (default is 20) with each, and finding only the best
+        <count> websites of each (index.py -k, default is 10). Websites are
+        ranked with <ranker> (index.py --ranker, default is tfidf).
+    boolean [-n <repeat>] [-d <documents>] [-q <queries>]
+        Compares ranking the websites containing any of three words (as every
+        query used to), the best 10 of them (index.py -k 10), those
+        containing all three (AND) and those containing them as a phrase
+        ("..."), for <queries> runs of three words (default is 20) taken
+        from <documents> made-up texts (default is 2000), and counts the
+        websites each way scores. Also compares the size of the index with
+        and without the positions phrases need.
+    serve [-n <repeat>] [-d <documents>] [-q <queries>]
+        Compares running index.py -q for each query, as driver.py used to,
+        against asking a query server (index.py --serve) in the same process
+        and over a Unix socket, on an index of <documents> made-up websites
+        (default is 1000) with <queries> made-up queries (default is 10).
+    segment [-n <repeat>] [-d <documents>] [-q <queries>] [-k <count>]
+        Compares answering queries from the database against answering them
+        from a segment written by segment.py (index.py --segment), with each
+        scorer, on an index of <documents> made-up websites (default is
+        10000) and the query benchmark's <queries>. Also compares running
+        index.py -q from start to finish.
+    shards [-n <repeat>] [-d <documents>] [-q <queries>] [-s <shards>]
+        Compares writing <documents> made-up texts (default is 5000) into
+        one database against splitting them into <shards> shards (index.py
+        --shards, default is 4), and answering <queries> made-up queries
+        (default is 20) from each, for every website and the best 10. Shards
+        are queried in one thread each.
+    results [-n <repeat>] [-d <documents>] [-q <queries>] [-r <requests>]
+        Compares a query server (index.py --serve) answering <requests>
+        requests (default is 2000) without remembering results, with a new
+        result cache (what --serve does) and with results kept in the
+        database by an earlier run (--persist-results). Requests are for
+        <queries> made-up queries (default is 200), a few asked far more
+        often than the rest, on an index of <documents> made-up websites
+        (default is 10000). Also prints the hit rate.
+    postings [-n <repeat>] [-d <documents>] [-q <queries>] [-b <megabytes>]
+        Compares a query server (index.py --serve) reading every stem's
+        postings from the database against keeping those of common stems in
+        a posting cache of <megabytes> (index.py --posting-cache, default is
+        32), for <queries> different made-up queries (default is 200) which
+        share common stems, on an index of <documents> made-up websites
+        (default is 10000). Also prints how the cache did.
+    stem [-n <repeat>] [-d <documents>] [<document> ...]
+        Compares turning documents into stems (index.py's get_stem_dict) with
+        nltk's Porter stemmer alone, with a new stem cache in front of it
+        (what index.py does) and with a stem cache saved by an earlier run
+        (index.py --stem-cache). <document> is a text file or a directory of
+        them; without any, <documents> made-up ones are used (default is
+        200).
+    workers [-n <repeat>] [-d <documents>] [-p <processes>]
+        Compares index.py -w on a file of <documents> made-up text files
+        (default is 500) in one process against stemming them in 1, 2, 4 ...
+        up to <processes> worker processes (index.py --workers, default is
+        one per core).
+    startup [-n <repeat>]
+        Times importing index.py (with python3 -X importtime), listing what
+        it imports from the slowest, and running index.py -q from start to
+        finish.
+'''
+
+
+# Prints to stderr instead of stdout.
+#   <do_color>: whether or not to color the output red. Default is True
+def eprint(*args, **kwargs):
+	if 'do_color' in kwargs:
+		do_color = kwargs['do_color']
+		kwargs.pop('do_color')
+	else:
+		do_color = True
+
+	if do_color:
+		print(Fore.RED, end='', flush=True) # Flushing required here
+
+	print(*args, file=sys.stderr, **kwargs)
+
+	if do_color:
+		print(Style.RESET_ALL, end='', flush=True)
+
+
+# Returns the fastest of <repeat> runs of <function>, in seconds.
+def time_it(function, repeat):
+	best = None
+	for _ in range(repeat):
+		start = time.perf_counter()
+		function()
+		elapsed = time.perf_counter() - start
+		best = elapsed if best is None else min(best, elapsed)
+	return best
+
+
+# Prints a table of (name, seconds) results, relative to the first one.
+def print_results(results):
+	baseline = results[0][1]
+	for name, seconds in results:
+		speedup = baseline / seconds if seconds > 0 else float('inf')
+		print('    %-24s %10.4f s %8.2fx' % (name, seconds, speedup))
+
+
+# Parses the options common to every benchmark (plus <short>/<long> ones),
+# returning the repeat count (<repeat> unless given), a dictionary of the other
+# options given, and the remaining arguments.
+def parse_args(args, short='', long=[], repeat=5):
+	try:
+		options, rest = getopt.gnu_getopt(args, 'n:' + short, long)
+	except getopt.GetoptError as ex:
+		eprint(f'Error: unrecognized argument specified "{ex.opt}"\n')
+		eprint(usage, do_color=False)
+		sys.exit(1)
+
+	extra = {}
+	for option, value in options:
+		if option == '-n':
+			try:
+				repeat = int(value)
+			except ValueError:
+				repeat = 0
+			if repeat <= 0:
+				eprint(f'Error: repeat must be a positive integer, "{value}"\n')
+				eprint(usage, do_color=False)
+				sys.exit(1)
+		else:
+			extra[option] = value
+	return repeat, extra, rest
+
+
+# Returns a list of <count> made-up HTML pages that look roughly like the news
+# pages in data/links: lots of links, navigation, scripts and paragraphs.
+def synthetic_pages(count=20, seed=0):
+	rng = random.Random(seed)
+	words = ['news', 'world', 'computer', 'science', 'game', 'politics',
+	         'market', 'travel', 'health', 'sport', 'weather', 'video',
+	         'election', 'economy', 'research', 'history', 'climate', 'art']
+	pages = []
+	for _ in range(count):
+		parts = ['<!DOCTYPE html><html><head><title>Page</title>',
+		         '<script>var data = {"a": 1, "b": [1, 2, 3]};</script>',
+		         '<style>.x { color: red; }</style></head><body><nav>']
+		for i in range(300):
+			word = rng.choice(words)
+			parts.append(f'<a href="/{word}/{i}.html">{word.title()}</a> ')
+		parts.append('</nav>')
+		for _ in range(200):
+			sentence = ' '.join(rng.choice(words) for _ in range(30))
+			parts.append(f'<div class="c"><p>{sentence} <b>{sentence[:20]}</b>'
+			             f' &amp; more</p></div>')
+		parts.append('</body></html>')
+		pages.append(''.join(parts).encode('utf-8'))
+	return pages
+
+
+# Reads every saved page named by <paths> (files, or directories of files).
+def saved_pages(paths):
+	pages = []
+	for path in paths:
+		names = [path]
+		if os.path.isdir(path):
+			names = [os.path.join(path, x) for x in sorted(os.listdir(path))]
+		for name in names:
+			with open(name, 'rb') as page:
+				pages.append(page.read())
+	return pages
+
+
+def benchmark_extract(args):
+	repeat, _, paths = parse_args(args)
+	try:
+		pages = saved_pages(paths) if paths else synthetic_pages()
+	except OSError as ex:
+		eprint(f'Error: cannot read page "{ex.filename}"\n')
+		sys.exit(1)
+
+	import extract
+	from bs4 import BeautifulSoup
+
+	# What crawl.py and index.py did with every page before the streaming
+	# extractor: build a whole tree, then walk it for links and text.
+	def soup():
+		for page in pages:
+			tree = BeautifulSoup(page, 'html.parser')
+			[link.get('href') for link in tree.find_all('a')]
+			' '.join(t.strip() for t in tree.find_all(string=True))
+
+	def streaming(backend):
+		def run():
+			for page in pages:
+				list(extract.extract(page, backend))
+		return run
+
+	size = sum(len(x) for x in pages) / 1024 / 1024
+	print(f'Extracting links and text from {len(pages)} pages ({size:.1f} MB)')
+	results = [('BeautifulSoup', time_it(soup, repeat)),
+	           ('html.parser stream', time_it(streaming('html.parser'), repeat))]
+	if extract.etree is not None:
+		results.append(('lxml stream', time_it(streaming('lxml'), repeat)))
+	print_results(results)
+
+
+# Returns a made-up vocabulary of stems, and how often each is used relative
+# to the others: a few stems are very common and most are rare. The hundred
+# most common words of English are left out, as index.py drops them as stop
+# words.
+def synthetic_vocabulary(seed=0):
+	rng = random.Random(seed)
+	letters = 'abcdefghijklmnopqrstuvwxyz'
+	vocabulary = [''.join(rng.choice(letters) for _ in range(rng.randint(3, 9)))
+	              for _ in range(20000)]
+	weights = [1 / (rank + 101) for rank in range(len(vocabulary))]
+	return vocabulary, weights
+
+
+# Returns <count> made-up (url, stems) documents, as get_stem_dict would give
+# for news pages: a few hundred distinct stems each, drawn from
+# synthetic_vocabulary().
+def synthetic_documents(count, seed=0):
+	rng = random.Random(seed)
+	vocabulary, weights = synthetic_vocabulary()
+	documents = []
+	for i in range(count):
+		stems = {}
+		for stem in rng.choices(vocabulary, weights, k=800):
+			stems[stem] = stems.get(stem, 0) + 1
+		documents.append((f'https://www.example.com/news/{i}.html', stems))
+	return documents
+
+
+# Returns <count> made-up texts of 800 words each, drawn from
+# synthetic_vocabulary().
+def synthetic_texts(count, seed=0):
+	rng = random.Random(seed)
+	vocabulary, weights = synthetic_vocabulary()
+	return [' '.join(rng.choices(vocabulary, weights, k=800))
+	        for _ in range(count)]
+
+
+def benchmark_ingest(args):
+	repeat, extra, _ = parse_args(args, 'd:', ['batch='], repeat=1)
+	try:
+		count = int(extra.get('-d', 1000))
+		batch_size = int(extra.get('--batch', 100))
+	except ValueError:
+		count = batch_size = 0
+	if count <= 0 or batch_size <= 0:
+		eprint('Error: documents and batch size must be positive integers\n')
+		eprint(usage, do_color=False)
+		sys.exit(1)
+	documents = synthetic_documents(count)
+
+	import index
+
+	# Runs <ingest> on a new, empty database
+	def fresh(ingest):
+		def run():
+			with tempfile.TemporaryDirectory() as directory:
+				database = os.path.join(directory, 'ingest.db')
+				con = sqlite3.connect(database)
+				ingest(con, database)
+				con.close()
+		return run
+
+	# What index.py -w did for every website before batching
+	def single(con, database):
+		cur = con.cursor()
+		lexicon = index.Lexicon(cur)
+		for url, stems in documents:
+			index.index_document(cur, database, url, stems, False, lexicon)
+		con.commit()
+
+	def batched(con, database):
+		indexer = index.BulkIndexer(con, batch_size)
+		for url, stems in documents:
+			indexer.add(url, stems)
+		indexer.flush()
+
+	stems = sum(len(x[1]) for x in documents)
+	print(f'Indexing {count} documents ({stems} postings)')
+	print_results([('one at a time', time_it(fresh(single), repeat)),
+	               (f'batches of {batch_size}', time_it(fresh(batched), repeat))])
+
+
+def benchmark_update(args):
+	repeat, extra, _ = parse_args(args, 'd:u:', repeat=3)
+	try:
+		count = int(extra.get('-d', 2000))
+		updates = int(extra.get('-u', 100))
+	except ValueError:
+		count = updates = 0
+	if count <= 0 or not 0 < updates <= count:
+		message =  'Error: documents and updates must be positive integers, '
+		message += 'with no more updates than documents\n'
+		eprint(message)
+		eprint(usage, do_color=False)
+		sys.exit(1)
+
+	import index
+	import stopwords
+	from cache import StemCache
+	stop_words = set(stopwords.words('english'))
+	stemmer = StemCache(index.load_stemmer())
+	texts = synthetic_texts(count)
+
+	# Each changed text has 50 of its words replaced, as an edited page would
+	rng = random.Random(1)
+	vocabulary, weights = synthetic_vocabulary()
+	changed = rng.sample(range(count), updates)
+	new_texts = list(texts)
+	for i in changed:
+		words = new_texts[i].split()
+		start = rng.randrange(len(words) - 50)
+		words[start:start + 50] = rng.choices(vocabulary, weights, k=50)
+		new_texts[i] = ' '.join(words)
+
+	# Texts are turned into stems beforehand, as either way needs them
+	def document(text):
+		positions = defaultdict(list)
+		stems = index.get_stem_dict(text, stop_words, stemmer, positions)
+		return stems, positions, index.content_hash(text)
+	documents = [document(x) for x in texts]
+	new_documents = [document(x) for x in new_texts]
+
+	def write(database, documents):
+		con = sqlite3.connect(database)
+		indexer = index.BulkIndexer(con, 1000)
+		for i, (stems, positions, text_hash) in enumerate(documents):
+			indexer.add(str(i), stems, positions, text_hash)
+		indexer.flush()
+		con.close()
+
+	with tempfile.TemporaryDirectory() as directory:
+		database = os.path.join(directory, 'update.db')
+		print(f'Indexing {count} documents ... ', end='', flush=True)
+		write(database, documents)
+		print('done')
+
+		def rebuild():
+			fresh = os.path.join(directory, 'fresh.db')
+			write(fresh, new_documents)
+			os.remove(fresh)
+
+		# Both undo what they did (before committing), so that every run
+		# starts from the same index
+		con = sqlite3.connect(database)
+		cur = con.cursor()
+		lexicon = index.Lexicon(cur)
+
+		def update():
+			for i, (stems, positions, text_hash) in enumerate(new_documents):
+				index.update_document(cur, database, str(i), stems, False,
+				                      lexicon, positions, text_hash)
+			con.rollback()
+
+		def delete():
+			for i in changed:
+				index.website_delete(cur, str(i))
+			index.compact(cur)
+			con.rollback()
+
+		print(f'Indexing again after {updates} documents changed')
+		print_results([('from scratch', time_it(rebuild, repeat)),
+		               ('in place (--update)', time_it(update, repeat)),
+		               ('delete and compact', time_it(delete, repeat))])
+		con.close()
+
+
+def benchmark_query(args):
+	repeat, extra, _ = parse_args(args, 'd:q:k:', ['ranker='])
+	try:
+		count = int(extra.get('-d', 10000))
+		query_count = int(extra.get('-q', 20))
+		k = int(extra.get('-k', 10))
+	except ValueError:
+		count = query_count = k = 0
+	if count <= 0 or query_count <= 0 or k <= 0:
+		eprint('Error: documents, queries and count must be positive '
+		       'integers\n')
+		eprint(usage, do_color=False)
+		sys.exit(1)
+
+	import index
+	if not index.have_numpy:
+		eprint('Error: the query benchmark needs NumPy to be installed')
+		sys.exit(1)
+	if extra.get('--ranker', 'tfidf') not in index.rankers:
+		eprint(f'Error: unknown ranker "{extra["--ranker"]}"\n')
+		eprint(usage, do_color=False)
+		sys.exit(1)
+	ranker = index.rankers[extra.get('--ranker', 'tfidf')]()
+
+	# Queries of a few stems each, mostly common ones (whose postings are
+	# long) as in real queries
+	rng = random.Random(1)
+	vocabulary, weights = synthetic_vocabulary()
+	queries = []
+	for _ in range(query_count):
+		queries.append(rng.choices(vocabulary[:2000], weights[:2000], k=4))
+
+	with tempfile.TemporaryDirectory() as directory:
+		database = os.path.join(directory, 'query.db')
+		con = sqlite3.connect(database)
+		print(f'Indexing {count} documents ... ', end='', flush=True)
+		indexer = index.BulkIndexer(con, 1000)
+		for url, stems in synthetic_documents(count):
+			indexer.add(url, stems)
+		indexer.flush()
+		print('done')
+		cur = con.cursor()
+		lexicon = index.Lexicon(cur)
+		queries = [lexicon.ids(x) for x in queries]
+
+		read = total = 0
+		for stem_ids in queries:
+			expected = index.score_python(cur, stem_ids, ranker)
+			websites, postings = index.score_top_k(cur, stem_ids, k, ranker)
+			if index.score_numpy(cur, stem_ids, ranker) != expected or \
+			   websites != expected[:k]:
+				eprint('Error: the scorers ranked websites differently')
+				sys.exit(1)
+			read += postings
+			total += sum(cur.execute('SELECT df FROM token WHERE stem = ?',
+			                         (x,)).fetchone()[0] for x in stem_ids)
+
+		def scorer(score):
+			def run():
+				for stem_ids in queries:
+					score(cur, stem_ids, ranker)
+			return run
+
+		def top_k():
+			for stem_ids in queries:
+				index.score_top_k(cur, stem_ids, k, ranker)
+
+		# The slowest query matters as much as the total
+		def slowest(run):
+			def time_each():
+				return max(time_it(lambda: run(cur, stem_ids, ranker), 1)
+				           for stem_ids in queries)
+			return min(time_each() for _ in range(repeat))
+
+		print(f'Running {query_count} queries (same results from all)')
+		print_results([('python', time_it(scorer(index.score_python), repeat)),
+		               ('numpy', time_it(scorer(index.score_numpy), repeat)),
+		               (f'top {k}', time_it(top_k, repeat))])
+		print('Slowest single query')
+		print_results([('python', slowest(index.score_python)),
+		               ('numpy', slowest(index.score_numpy)),
+		               (f'top {k}', slowest(lambda cur, stem_ids, ranker:
+		                                    index.score_top_k(cur, stem_ids, k,
+		                                                      ranker)))])
+		print(f'Top {k} read {read} of {total} postings '
+		      f'({read / total:.1%})')
+		con.close()
+
+
+def benchmark_boolean(args):
+	repeat, extra, _ = parse_args(args, 'd:q:', repeat=3)
+	try:
+		count = int(extra.get('-d', 2000))
+		query_count = int(extra.get('-q', 20))
+	except ValueError:
+		count = query_count = 0
+	if count <= 0 or query_count <= 0:
+		eprint('Error: documents and queries must be positive integers\n')
+		eprint(usage, do_color=False)
+		sys.exit(1)
+
+	import index
+	import stopwords
+	from cache import StemCache
+	stop_words = set(stopwords.words('english'))
+	stemmer = StemCache(index.load_stemmer())
+	texts = synthetic_texts(count)
+
+	# Runs of three words from the texts, so that some websites have them
+	rng = random.Random(1)
+	runs = []
+	for _ in range(query_count):
+		words = rng.choice(texts).split()
+		start = rng.randrange(len(words) - 2)
+		runs.append(words[start:start + 3])
+
+	with tempfile.TemporaryDirectory() as directory:
+		print(f'Indexing {count} documents ... ', end='', flush=True)
+		sizes = []
+		for keep_positions in (False, True):
+			database = os.path.join(directory, f'{keep_positions}.db')
+			con = sqlite3.connect(database)
+			indexer = index.BulkIndexer(con, 1000)
+			for i, text in enumerate(texts):
+				positions = defaultdict(list) if keep_positions else None
+				stems = index.get_stem_dict(text, stop_words, stemmer,
+				                            positions)
+				indexer.add(str(i), stems, positions)
+			indexer.flush()
+			con.execute('VACUUM')
+			sizes.append(os.path.getsize(database))
+		print('done')
+		cur = con.cursor()
+		lexicon = index.Lexicon(cur)
+		lexicon.load()
+
+		ways = [('any word', lambda x: ' '.join(x), None),
+		        ('any word, top 10', lambda x: ' '.join(x), 10),
+		        ('AND', lambda x: ' AND '.join(x), None),
+		        ('phrase', lambda x: '"' + ' '.join(x) + '"', None)]
+
+		def rank(make_query, k):
+			def run():
+				for words in runs:
+					index.rank_websites(cur, make_query(words), stop_words,
+					                    stemmer, False, 'python', k,
+					                    lexicon=lexicon)
+			return run
+
+		print(f'Ranking {query_count} queries')
+		print_results([(name, time_it(rank(make_query, k), repeat))
+		               for name, make_query, k in ways])
+
+		scored = {'any word': 0, 'AND': 0, 'phrase': 0}
+		for words in runs:
+			stem_ids = lexicon.ids(index.get_stem_dict(' '.join(words),
+			                                           stop_words, stemmer))
+			scored['any word'] += len(index.score_python(cur, stem_ids))
+			for name, make_query, _ in ways[2:]:
+				clauses = index.parse_query(make_query(words), stop_words,
+				                            stemmer)
+				scored[name] += index.score_boolean(cur, clauses, lexicon)[1]
+		print('Websites scored: ' + ', '.join(f'{x} {y}' for x, y in
+		                                       scored.items()))
+		print(f'Index size: {sizes[0]} bytes without positions, {sizes[1]} '
+		      f'with ({sizes[1] / sizes[0]:.2f}x)')
+		con.close()
+
+
+def benchmark_serve(args):
+	repeat, extra, _ = parse_args(args, 'd:q:', repeat=1)
+	try:
+		count = int(extra.get('-d', 1000))
+		query_count = int(extra.get('-q', 10))
+	except ValueError:
+		count = query_count = 0
+	if count <= 0 or query_count <= 0:
+		eprint('Error: documents and queries must be positive integers\n')
+		eprint(usage, do_color=False)
+		sys.exit(1)
+
+	import index
+	program = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+	                       'index.py')
+	rng = random.Random(1)
+	vocabulary, weights = synthetic_vocabulary()
+	queries = [' '.join(rng.choices(vocabulary[:2000], weights[:2000], k=3))
+	           for _ in range(query_count)]
+
+	with tempfile.TemporaryDirectory() as directory:
+		database = os.path.join(directory, 'serve.db')
+		con = sqlite3.connect(database, check_same_thread=False)
+		indexer = index.BulkIndexer(con, 1000)
+		for url, stems in synthetic_documents(count):
+			indexer.add(url, stems)
+		indexer.flush()
+
+		def processes():
+			for query in queries:
+				subprocess.run([sys.executable, program, '-q', query, '-b',
+				                database, '-k', '5'], check=True,
+				               stdout=subprocess.DEVNULL,
+				               stderr=subprocess.DEVNULL)
+
+		def ask(server):
+			def run():
+				for query in queries:
+					server.answer({'query': query, 'k': 5})
+			return run
+
+		server = index.QueryServer(con, set(index.stopwords.words('english')),
+		                           index.load_stemmer())
+		path = os.path.join(directory, 'serve.sock')
+		listener = server.listen(path)
+		thread = threading.Thread(target=listener.serve_forever)
+		thread.start()
+		client = index.QueryClient(path)
+		try:
+			print(f'Running {query_count} queries on {count} documents')
+			print_results([('index.py -q', time_it(processes, repeat)),
+			               ('in process', time_it(ask(server), repeat)),
+			               ('unix socket', time_it(ask(client), repeat))])
+		finally:
+			client.close()
+			listener.shutdown()
+			listener.server_close()
+			thread.join()
+			con.close()
+
+
+def benchmark_shards(args):
+	repeat, extra, _ = parse_args(args, 'd:q:s:', repeat=3)
+	try:
+		count = int(extra.get('-d', 5000))
+		query_count = int(extra.get('-q', 20))
+		shard_count = int(extra.get('-s', 4))
+	except ValueError:
+		count = query_count = shard_count = 0
+	if count <= 0 or query_count <= 0 or shard_count <= 0:
+		eprint('Error: documents, queries and shards must be positive '
+		       'integers\n')
+		eprint(usage, do_color=False)
+		sys.exit(1)
+
+	import index
+	import shard
+	import stopwords
+	from cache import StemCache
+	stop_words = set(stopwords.words('english'))
+	stemmer = StemCache(index.load_stemmer())
+	print(f'Stemming {count} documents ... ', end='', flush=True)
+	documents = []
+	for i, text in enumerate(synthetic_texts(count)):
+		positions = defaultdict(list)
+		stems = index.get_stem_dict(text, stop_words, stemmer, positions)
+		documents.append((str(i), stems, positions))
+	print('done')
+
+	rng = random.Random(1)
+	vocabulary, weights = synthetic_vocabulary()
+	queries = [' '.join(rng.choices(vocabulary[:2000], weights[:2000], k=4))
+	           for _ in range(query_count)]
+
+	with tempfile.TemporaryDirectory() as directory:
+		database = os.path.join(directory, 'one', 'shards.db')
+		shards = os.path.join(directory, 'shards', 'shards.db')
+
+		# Each way writes into a directory of its own, emptied first
+		def write(sharded):
+			def run():
+				path = shards if sharded else database
+				shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+				os.mkdir(os.path.dirname(path))
+				if sharded:
+					connections = [sqlite3.connect(shard.shard_file(path, x))
+					               for x in range(shard_count)]
+					indexer = shard.ShardedIndexer(connections, 1000)
+				else:
+					connections = [sqlite3.connect(database)]
+					indexer = index.BulkIndexer(connections[0], 1000)
+				for url, stems, positions in documents:
+					indexer.add(url, stems, positions)
+				indexer.flush()
+				for con in connections:
+					con.close()
+			return run
+
+		print(f'Writing {count} documents')
+		print_results([('one database', time_it(write(False), repeat)),
+		               (f'{shard_count} shards', time_it(write(True), repeat))])
+
+		con = sqlite3.connect(database)
+		cur = con.cursor()
+		sharded = shard.ShardedIndex(shards, shard_count)
+		lexicon = index.Lexicon(cur)
+		lexicon.load()
+		for query in queries:
+			expected = index.rank_websites(cur, query, stop_words, stemmer,
+			                               k=10, lexicon=lexicon)
+			websites = sharded.rank(query, stop_words, stemmer, k=10)
+			if [round(x[1], 9) for x in websites] != \
+			   [round(x[1], 9) for x in expected]:
+				eprint('Error: the shards ranked websites differently')
+				sys.exit(1)
+
+		def rank(k):
+			def run():
+				for query in queries:
+					index.rank_websites(cur, query, stop_words, stemmer,
+					                    k=k, lexicon=lexicon)
+			return run
+
+		def rank_shards(k):
+			def run():
+				for query in queries:
+					sharded.rank(query, stop_words, stemmer, k=k)
+			return run
+
+		print(f'Running {query_count} queries (same scores from both) on '
+		      f'{os.cpu_count()} cores')
+		for name, k in (('all', None), ('top 10', 10)):
+			print_results([(f'{name}, one database', time_it(rank(k), repeat)),
+			               (f'{name}, {shard_count} shards',
+			                time_it(rank_shards(k), repeat))])
+		sharded.close()
+		con.close()
+
+
+def benchmark_results(args):
+	repeat, extra, _ = parse_args(args, 'd:q:r:', repeat=3)
+	try:
+		count = int(extra.get('-d', 10000))
+		query_count = int(extra.get('-q', 200))
+		request_count = int(extra.get('-r', 2000))
+	except ValueError:
+		count = query_count = request_count = 0
+	if count <= 0 or query_count <= 0 or request_count <= 0:
+		eprint('Error: documents, queries and requests must be positive '
+		       'integers\n')
+		eprint(usage, do_color=False)
+		sys.exit(1)
+
+	import index
+	from cache import ResultCache
+	rng = random.Random(1)
+	vocabulary, weights = synthetic_vocabulary()
+	queries = [' '.join(rng.choices(vocabulary[:2000], weights[:2000], k=3))
+	           for _ in range(query_count)]
+	# The n-th most asked query is asked about 1/n as often as the first
+	requests = rng.choices(queries, [1 / (x + 1) for x in range(query_count)],
+	                       k=request_count)
+
+	with tempfile.TemporaryDirectory() as directory:
+		database = os.path.join(directory, 'results.db')
+		con = sqlite3.connect(database)
+		indexer = index.BulkIndexer(con, 1000)
+		for url, stems in synthetic_documents(count):
+			indexer.add(url, stems)
+		indexer.flush()
+		stop_words = set(index.stopwords.words('english'))
+		stemmer = index.load_stemmer()
+		saved = ResultCache(cur=con.cursor())
+
+		def ask(make_results):
+			def run():
+				server = index.QueryServer(con, stop_words, stemmer, k=10,
+				                           results=make_results())
+				for query in requests:
+					server.answer({'query': query})
+			return run
+
+		ask(lambda: saved)()
+		con.commit()
+		print(f'Answering {request_count} requests for {query_count} queries '
+		      f'on {count} documents')
+		print_results([
+			('no result cache', time_it(ask(lambda: None), repeat)),
+			('new result cache', time_it(ask(ResultCache), repeat)),
+			('saved results', time_it(ask(lambda: ResultCache(
+			                          cur=con.cursor())), repeat))])
+		print(saved.stats())
+		con.close()
+
+
+def benchmark_postings(args):
+	repeat, extra, _ = parse_args(args, 'd:q:b:', repeat=3)
+	try:
+		count = int(extra.get('-d', 10000))
+		query_count = int(extra.get('-q', 200))
+		budget = int(float(extra.get('-b', 32)) * 2 ** 20)
+	except ValueError:
+		count = query_count = budget = 0
+	if count <= 0 or query_count <= 0 or budget <= 0:
+		eprint('Error: documents, queries and megabytes must be positive\n')
+		eprint(usage, do_color=False)
+		sys.exit(1)
+
+	import index
+	from cache import PostingCache
+	rng = random.Random(1)
+	vocabulary, _ = synthetic_vocabulary()
+	# Searches are for a few words far more often than for the rest
+	queries = [' '.join(rng.choices(vocabulary[:2000],
+	                                [1 / (x + 1) for x in range(2000)], k=3))
+	           for _ in range(query_count)]
+
+	with tempfile.TemporaryDirectory() as directory:
+		database = os.path.join(directory, 'postings.db')
+		con = sqlite3.connect(database)
+		indexer = index.BulkIndexer(con, 1000)
+		for url, stems in synthetic_documents(count):
+			indexer.add(url, stems)
+		indexer.flush()
+		stop_words = set(index.stopwords.words('english'))
+		stemmer = index.load_stemmer()
+		lexicon = index.Lexicon(con.cursor())
+		lexicon.load()
+		caches = []
+
+		# Ranks every query the way a query server does, only leaving out
+		# looking up the urls of the websites found
+		def rank(make_cache, scorer, k):
+			def run():
+				caches.append(make_cache())
+				reader = index.TableReader(con.cursor(), caches[-1])
+				for query in queries:
+					index.rank_websites(reader, query, stop_words, stemmer,
+					                    False, scorer, k, lexicon=lexicon)
+			return run
+
+		print(f'Ranking {query_count} queries on {count} documents')
+		scorers = [('python', None), ('python', 10)]
+		if index.have_numpy:
+			scorers.insert(1, ('numpy', None))
+		for scorer, k in scorers:
+			print(f'{scorer} scorer' + ('' if k is None else f', top {k}'))
+			print_results([
+				('database', time_it(rank(lambda: None, scorer, k), repeat)),
+				('posting cache', time_it(rank(lambda: PostingCache(budget),
+				                                  scorer, k), repeat))])
+			print(caches[-1].stats())
+		con.close()
+
+
+# Returns how long importing <module> took in a new python3, in seconds, and
+# (module, seconds) for each module it imported itself, from the slowest.
+def import_times(module):
+	directory = os.path.dirname(os.path.abspath(__file__))
+	result = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+	                         f'import {module}'], cwd=directory, check=True,
+	                        capture_output=True, text=True)
+
+	# Lines are "import time: <self> | <cumulative> | <name>", with <name>
+	# indented two spaces for each level of imports, and every module listed
+	# after the modules it imported
+	rows = []
+	for line in result.stderr.splitlines()[1:]:
+		_, cumulative, name = line.split('|')
+		depth = (len(name) - len(name.lstrip()) - 1) // 2
+		rows.append((depth, name.strip(), int(cumulative) / 1000000))
+
+	position = max(i for i, row in enumerate(rows) if row[:2] == (0, module))
+	children = []
+	for depth, name, seconds in reversed(rows[:position]):
+		if depth == 0:
+			break
+		if depth == 1:
+			children.append((name, seconds))
+	children.sort(key=lambda x: -x[1])
+	return rows[position][2], children
+
+
+def benchmark_segment(args):
+	repeat, extra, _ = parse_args(args, 'd:q:k:')
+	try:
+		count = int(extra.get('-d', 10000))
+		query_count = int(extra.get('-q', 20))
+		k = int(extra.get('-k', 10))
+	except ValueError:
+		count = query_count = k = 0
+	if count <= 0 or query_count <= 0 or k <= 0:
+		eprint('Error: documents, queries and count must be positive '
+		       'integers\n')
+		eprint(usage, do_color=False)
+		sys.exit(1)
+
+	import index
+	import segment
+	if not index.have_numpy:
+		eprint('Error: the segment benchmark needs NumPy to be installed')
+		sys.exit(1)
+	program = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+	                       'index.py')
+
+	# The same queries as the query benchmark
+	rng = random.Random(1)
+	vocabulary, weights = synthetic_vocabulary()
+	queries = [rng.choices(vocabulary[:2000], weights[:2000], k=4)
+	           for _ in range(query_count)]
+
+	with tempfile.TemporaryDirectory() as directory:
+		database = os.path.join(directory, 'query.db')
+		path = os.path.join(directory, 'query.seg')
+		con = sqlite3.connect(database)
+		print(f'Indexing {count} documents ... ', end='', flush=True)
+		indexer = index.BulkIndexer(con, 1000)
+		for url, stems in synthetic_documents(count):
+			indexer.add(url, stems)
+		indexer.flush()
+		print('done')
+		cur = con.cursor()
+		export = time_it(lambda: segment.write_segment(cur, path), 1)
+		print(f'Writing the segment took {export:.4f} s '
+		      f'({os.path.getsize(path)} bytes, database '
+		      f'{os.path.getsize(database)} bytes)')
+
+		lexicon = index.Lexicon(cur)
+		queries = [lexicon.ids(x) for x in queries]
+		reader = segment.Segment(path)
+		for stem_ids in queries:
+			expected = index.score_python(cur, stem_ids)
+			if index.score_python(reader, stem_ids) != expected or \
+			   index.score_numpy(reader, stem_ids) != expected or \
+			   index.score_top_k(reader, stem_ids, k)[0] != expected[:k]:
+				eprint('Error: the segment ranked websites differently')
+				sys.exit(1)
+
+		def scorer(score, source):
+			def run():
+				for stem_ids in queries:
+					score(source, stem_ids)
+			return run
+
+		print(f'Running {query_count} queries (same results from both)')
+		for name, score in (('python', index.score_python),
+		                    ('numpy', index.score_numpy),
+		                    (f'top {k}', lambda source, stem_ids:
+		                     index.score_top_k(source, stem_ids, k))):
+			print_results([(f'{name}, database',
+			                time_it(scorer(score, cur), repeat)),
+			               (f'{name}, segment',
+			                time_it(scorer(score, reader), repeat))])
+		reader.close()
+		con.close()
+
+		# A stem whose word stems to itself, so index.py finds it
+		stemmer = index.load_stemmer()
+		word = next(x for x in vocabulary if stemmer.stem(x) == x)
+
+		def query(source):
+			def run():
+				subprocess.run([sys.executable, program, '-q', word, *source],
+				               check=True, stdout=subprocess.DEVNULL,
+				               stderr=subprocess.DEVNULL)
+			return run
+
+		print('Running index.py -q from start to finish')
+		print_results([('database', time_it(query(['-b', database]), repeat)),
+		               ('segment', time_it(query(['--segment', path]),
+		                                   repeat))])
+
+
+def benchmark_stem(args):
+	repeat, extra, paths = parse_args(args, 'd:', repeat=3)
+	try:
+		count = int(extra.get('-d', 200))
+	except ValueError:
+		count = 0
+	if count <= 0:
+		eprint('Error: documents must be a positive integer\n')
+		eprint(usage, do_color=False)
+		sys.exit(1)
+
+	if paths:
+		try:
+			texts = [x.decode('utf-8', 'replace') for x in saved_pages(paths)]
+		except OSError as ex:
+			eprint(f'Error: cannot read document "{ex.filename}"\n')
+			sys.exit(1)
+	else:
+		texts = synthetic_texts(count, seed=2)
+
+	import index
+	import stopwords
+	from cache import StemCache
+	stop_words = set(stopwords.words('english'))
+	stemmer = index.load_stemmer()
+
+	def stem(make_stemmer):
+		def run():
+			current = make_stemmer()
+			for text in texts:
+				index.get_stem_dict(text, stop_words, current)
+		return run
+
+	with tempfile.TemporaryDirectory() as directory:
+		path = os.path.join(directory, 'stems.json')
+		warm = StemCache(stemmer, path=path)
+		stem(lambda: warm)()
+		warm.save()
+
+		words = sum(len(x.split()) for x in texts)
+		print(f'Stemming {len(texts)} documents ({words} words)')
+		print_results([
+			('PorterStemmer', time_it(stem(lambda: stemmer), repeat)),
+			('new stem cache', time_it(stem(lambda: StemCache(stemmer)),
+			                           repeat)),
+			('saved stem cache', time_it(stem(lambda: StemCache(stemmer,
+			                                                    path=path)),
+			                             repeat))])
+		print(warm.stats())
+
+
+def benchmark_workers(args):
+	repeat, extra, _ = parse_args(args, 'd:p:', repeat=1)
+	try:
+		count = int(extra.get('-d', 500))
+		processes = int(extra.get('-p', os.cpu_count() or 1))
+	except ValueError:
+		count = processes = 0
+	if count <= 0 or processes <= 0:
+		eprint('Error: documents and processes must be positive integers\n')
+		eprint(usage, do_color=False)
+		sys.exit(1)
+
+	import io
+	import contextlib
+	import index
+
+	with tempfile.TemporaryDirectory() as directory:
+		links = os.path.join(directory, 'links.txt')
+		with open(links, 'w') as links_file:
+			for i, text in enumerate(synthetic_texts(count)):
+				name = os.path.join(directory, f'{i}.txt')
+				with open(name, 'w') as text_file:
+					text_file.write(text)
+				links_file.write(name + '\n')
+
+		# Runs index.py -w on the documents with <args>, into a new database
+		def run_index(args):
+			def run():
+				database = os.path.join(directory, 'workers.db')
+				with contextlib.redirect_stdout(io.StringIO()):
+					index.main(f'index.py -w {links} -b {database} {args}')
+				os.remove(database)
+			return run
+
+		print(f'Indexing {count} documents with {os.cpu_count()} cores')
+		results = [('one process', time_it(run_index('--batch 100'), repeat))]
+		workers = 1
+		while True:
+			results.append((f'{workers} workers',
+			                time_it(run_index(f'--workers {workers}'), repeat)))
+			if workers >= processes:
+				break
+			workers = min(workers * 2, processes)
+		print_results(results)
+
+
+def benchmark_startup(args):
+	repeat, _, _ = parse_args(args)
+
+	import index
+	program = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+	                       'index.py')
+
+	# The fastest run is the one least disturbed by everything else running
+	best = min((import_times('index') for _ in range(repeat)),
+	           key=lambda x: x[0])
+	print(f'Importing index.py took {best[0]:.4f} s, of which')
+	for name, seconds in best[1][:8]:
+		print('    %-24s %10.4f s' % (name, seconds))
+
+	with tempfile.TemporaryDirectory() as directory:
+		database = os.path.join(directory, 'startup.db')
+		con = sqlite3.connect(database)
+		indexer = index.BulkIndexer(con)
+		for url, stems in synthetic_documents(10):
+			indexer.add(url, stems)
+		indexer.flush()
+		con.close()
+
+		def query():
+			subprocess.run([sys.executable, program, '-q', 'news', '-b',
+			                database], check=True, stdout=subprocess.DEVNULL,
+			               stderr=subprocess.DEVNULL)
+
+		print(f'Running index.py -q took {time_it(query, repeat):.4f} s')
+
+
+benchmarks = {
+	'extract': benchmark_extract,
+	'ingest': benchmark_ingest,
+	'update': benchmark_update,
+	'query': benchmark_query,
+	'boolean': benchmark_boolean,
+	'serve': benchmark_serve,
+	'segment': benchmark_segment,
+	'shards': benchmark_shards,
+	'results': benchmark_results,
+	'postings': benchmark_postings,
+	'stem': benchmark_stem,
+	'workers': benchmark_workers,
+	'startup': benchmark_startup,
+}
+
+
+def main(args):
+	if len(args) < 2 or args[1] not in benchmarks:
+		eprint('Error: expected the name of a benchmark\n')
+		eprint(usage, do_color=False)
+		sys.exit(1)
+
+	benchmarks[args[1]](args[2:])
+
+
+if __name__ == '__main__':
+	main(sys.argv)
@@ -0,0 +1,304 @@
+import os
+import sys
+import json
+import time
+from collections import OrderedDict
+
+
+# How many words a StemCache remembers unless told otherwise
+default_stem_cache_size = 100000
+
+# How many results of queries a ResultCache remembers, and for how many
+# seconds, unless told otherwise
+default_result_cache_size = 1000
+default_result_ttl = 600
+
+# How many bytes of postings a PostingCache keeps unless told otherwise, and
+# how many times a stem's postings must be asked for before they are kept
+default_posting_cache_bytes = 32 * 1024 * 1024
+default_posting_admit = 2
+
+
+# Returns a line describing how well a cache called <name> did, calling the
+# <count> things it holds <things>.
+def cache_stats(name, hits, misses, count, things):
+	total = hits + misses
+	rate = hits / total if total > 0 else 0
+	return f'{name}: {hits} hits, {misses} misses ' \
+	       f'({rate:.1%} hit rate), {count} {things} cached'
+
+
+# A dictionary of at most <size> items, which forgets the least recently used
+# item to make room for a new one. Counts how often get() found what it was
+# asked for. Not safe to share between threads.
+class LRUCache:
+	def __init__(self, size):
+		self._size = size
+		self._items = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+
+	# Returns the value of <key>, or <default> if it isn't cached.
+	def get(self, key, default=None):
+		try:
+			value = self._items[key]
+		except KeyError:
+			self.misses += 1
+			return default
+		self._items.move_to_end(key)
+		self.hits += 1
+		return value
+
+
+	def put(self, key, value):
+		self._items[key] = value
+		self._items.move_to_end(key)
+		if len(self._items) > self._size:
+			self._items.popitem(last=False)
+
+
+	# Returns the (key, value) pairs cached, from the least recently used.
+	def items(self):
+		return list(self._items.items())
+
+
+	def __len__(self):
+		return len(self._items)
+
+
+	# Returns a line describing how well the cache did, calling what it holds
+	# <things>.
+	def stats(self, name, things):
+		return cache_stats(name, self.hits, self.misses, len(self), things)
+
+
+# Remembers what <stemmer> (such as nltk's PorterStemmer) made of each word, so
+# that a word repeated across websites is only stemmed once. It has the same
+# stem() method, so it is used in place of the stemmer. If <path> is given,
+# words stemmed in earlier runs are read from it, and save() writes them back.
+class StemCache:
+	def __init__(self, stemmer, size=default_stem_cache_size, path=None):
+		self._stemmer = stemmer
+		self._cache = LRUCache(size)
+		self._path = path
+
+		# Stems from a different stemmer would be wrong, so they are ignored,
+		# as is anything that cannot be read
+		if path is None:
+			return
+		try:
+			with open(path, 'r') as cache_file:
+				saved = json.load(cache_file)
+			if saved['stemmer'] == self._name():
+				for word, stem in saved['stems']:
+					self._cache.put(word, stem)
+		except (OSError, ValueError, KeyError, TypeError):
+			pass
+
+
+	# Returns what tells the stemmer apart from others for saved stems.
+	def _name(self):
+		mode = getattr(self._stemmer, 'mode', None)
+		name = type(self._stemmer).__name__
+		return name if mode is None else f'{name} {mode}'
+
+
+	def stem(self, word):
+		stem = self._cache.get(word)
+		if stem is None:
+			stem = self._stemmer.stem(word)
+			self._cache.put(word, stem)
+		return stem
+
+
+	# Writes the cached stems to the path given, if any.
+	def save(self):
+		if self._path is None:
+			return
+		temporary = self._path + '.tmp'
+		with open(temporary, 'w') as cache_file:
+			json.dump({'stemmer': self._name(), 'stems': self._cache.items()},
+			          cache_file)
+		os.replace(temporary, self._path)
+
+
+	def stats(self):
+		return self._cache.stats('Stem cache', 'words')
+
+
+# Remembers the websites found for queries, so that a query asked again is
+# answered without scoring any websites. Each result is kept with the
+# generation of the index it was found in (which goes up whenever websites are
+# added) and is only used while the index is still at that generation, and for
+# at most <ttl> seconds (forever if None). At most <size> results are kept in
+# memory. If <cur> is given, results are also kept in the result table of its
+# database, so that later runs can use them.
+class ResultCache:
+	def __init__(self, size=default_result_cache_size,
+	             ttl=default_result_ttl, cur=None):
+		self._cache = LRUCache(size)
+		self._size = size
+		self._ttl = ttl
+		self._cur = cur
+		self.hits = 0
+		self.misses = 0
+		if cur is not None:
+			cur.execute('CREATE TABLE IF NOT EXISTS result('
+			            'key TEXT PRIMARY KEY, generation INTEGER, '
+			            'time REAL, websites TEXT)')
+
+
+	# Returns True if a result stored at <stored> (a time.time()) for the
+	# generation <stored_generation> can be used now, at <generation>.
+	def _valid(self, stored_generation, stored, generation):
+		if stored_generation != generation:
+			return False
+		return self._ttl is None or time.time() - stored <= self._ttl
+
+
+	# Returns the result stored for <key> (a string) if it is still valid for
+	# the index at <generation>, or None.
+	def get(self, key, generation):
+		entry = self._cache.get(key)
+		if entry is None and self._cur is not None:
+			command = 'SELECT generation, time, websites FROM result ' \
+			          'WHERE key = ?'
+			row = self._cur.execute(command, (key,)).fetchone()
+			if row is not None:
+				websites = [tuple(x) for x in json.loads(row[2])]
+				entry = (row[0], row[1], websites)
+				self._cache.put(key, entry)
+
+		if entry is None or not self._valid(entry[0], entry[1], generation):
+			self.misses += 1
+			return None
+		self.hits += 1
+		return entry[2]
+
+
+	# Stores <websites>, the result for <key> found at <generation>.
+	def put(self, key, generation, websites):
+		stored = time.time()
+		self._cache.put(key, (generation, stored, websites))
+		if self._cur is None:
+			return
+
+		# Results for earlier generations can never be used again, and only
+		# the newest <size> are kept
+		self._cur.execute('INSERT OR REPLACE INTO result VALUES(?, ?, ?, ?)',
+		                  (key, generation, stored, json.dumps(websites)))
+		self._cur.execute('DELETE FROM result WHERE generation != ?',
+		                  (generation,))
+		self._cur.execute('DELETE FROM result WHERE key NOT IN ('
+		                  'SELECT key FROM result ORDER BY time DESC LIMIT ?)',
+		                  (self._size,))
+
+
+	def stats(self):
+		return cache_stats('Result cache', self.hits, self.misses,
+		                   len(self._cache), 'results')
+
+
+# Remembers the postings of the stems queried most often, as arrays of the
+# websites each stem is in and the weights it gives them, so that a stem asked
+# for again by another query is not read from the database again. Postings are
+# kept in at most <budget> bytes, and the least recently used are forgotten to
+# make room for new ones. A stem's postings are only kept once they have been
+# asked for <admit> times, and not if that would mean forgetting postings
+# asked for more often, so that stems queried once do not push out the common
+# ones. The cache only holds postings of one generation of the index (see
+# ResultCache), and forgets them all when told of another.
+class PostingCache:
+	# How many times postings can be asked for before how often each was asked
+	# for is halved, so that stems which were common long ago are forgotten
+	sample = 10000
+
+
+	def __init__(self, budget=default_posting_cache_bytes,
+	             admit=default_posting_admit):
+		self.budget = budget
+		self.used = 0
+		self._admit = admit
+		self._items = OrderedDict()
+		self._frequency = {}
+		self._asked = 0
+		self._generation = None
+		self.hits = 0
+		self.misses = 0
+
+
+	# Forgets every posting unless the index is still at <generation>.
+	def check(self, generation):
+		if generation != self._generation:
+			self._items.clear()
+			self._frequency.clear()
+			self.used = 0
+			self._generation = generation
+
+
+	# Returns the postings of <key>, or None if they aren't cached, counting it
+	# as asked for.
+	def get(self, key):
+		self._asked += 1
+		if self._asked >= self.sample:
+			self._asked = 0
+			self._frequency = {k: v // 2 for k, v in self._frequency.items()
+			                   if v > 1}
+		self._frequency[key] = self._frequency.get(key, 0) + 1
+
+		value = self.peek(key)
+		if value is None:
+			self.misses += 1
+		else:
+			self.hits += 1
+		return value
+
+
+	# Returns True if postings of <key> not yet cached have been asked for
+	# often enough to be kept, so that reading all of them is worthwhile.
+	def admits(self, key):
+		return self._frequency.get(key, 0) >= self._admit
+
+
+	# Same as get, without counting anything.
+	def peek(self, key):
+		entry = self._items.get(key)
+		if entry is None:
+			return None
+		self._items.move_to_end(key)
+		return entry[0]
+
+
+	# Keeps <value> (a tuple of arrays) as the postings of <key> if it is asked
+	# for often enough.
+	def put(self, key, value):
+		size = sum(sys.getsizeof(x) for x in value)
+		frequency = self._frequency.get(key, 0)
+		if key in self._items or size > self.budget or not self.admits(key):
+			return
+
+		# Postings asked for more often than these are never forgotten for them
+		victims = []
+		free = self.budget - self.used
+		for victim, (_, victim_size) in self._items.items():
+			if free >= size:
+				break
+			if self._frequency.get(victim, 0) > frequency:
+				return
+			victims.append(victim)
+			free += victim_size
+		for victim in victims:
+			self.used -= self._items.pop(victim)[1]
+		self._items[key] = (value, size)
+		self.used += size
+
+
+	def __len__(self):
+		return len(self._items)
+
+
+	def stats(self):
+		line = cache_stats('Posting cache', self.hits, self.misses, len(self),
+		                   'postings')
+		return f'{line} ({self.used} of {self.budget} bytes)'
@@ -3,15 +3,36 @@ import os
 import io 
 import getopt 
 import re
-from bs4 import BeautifulSoup
 from urllib.request import Request, urlopen
 from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit, urlunsplit
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from contextlib import closing
+import threading 
 import socket 
+import sqlite3 
+import hashlib 
+import math 
+import random 
 from colorama import Fore, Style
+import http.server 
+import tempfile 
+import time 
+import gzip 
 import unittest 
 import unittest.mock 
 from parameterized import parameterized 
 
+from extract import extract_links 
+import fetch 
+from fetch import Fetcher, ResponseCache, default_cache_directory, \
+                  default_pool_size 
+
+
+# How many hyperlinks --validate pings at once 
+validation_workers = 8 
+
 
 # Prints to stderr instead of stdout. 
 #   <do_color>: whether or not to color the output red. Default is True
@@ -31,6 +52,72 @@ def eprint(*args, **kwargs):
 		print(Style.RESET_ALL, end='', flush=True) 
 
 
+# Returns <url> in a canonical form, so different spellings of the same page 
+# (like "HTTP://Example.com:80" and "http://example.com/#top") compare equal.
+def normalize_url(url): 
+	parts = urlsplit(url) 
+	scheme = parts.scheme.lower() 
+	netloc = parts.netloc.lower() 
+	default_port = {'http': ':80', 'https': ':443'}.get(scheme) 
+	if default_port is not None and netloc.endswith(default_port): 
+		netloc = netloc[:-len(default_port)] 
+	path = parts.path if parts.path else '/' 
+	return urlunsplit((scheme, netloc, path, parts.query, '')) 
+
+
+# Probabilistic set of strings stored in a bit array. Checking for an item that
+# was added always returns True, but checking for one that wasn't may also 
+# return True, with a probability of about <error_rate> once <capacity> items 
+# have been added. Takes a small fraction of the memory an exact set would. 
+class BloomFilter: 
+	def __init__(self, capacity, error_rate): 
+		assert capacity > 0 and 0 < error_rate < 1 
+		
+		# Optimal sizes for the bit array and the number of hashes per item
+		self._size = math.ceil(-capacity * math.log(error_rate) / \
+		                       math.log(2) ** 2) 
+		self._hashes = max(1, round(self._size / capacity * math.log(2))) 
+		self._bits = bytearray((self._size + 7) // 8) 
+		self._count = 0 
+	
+	
+	# Returns the bit positions that represent <item>. The positions are made 
+	# from two halves of one digest (double hashing), which is as good as using
+	# a separate hash function for each. 
+	def _positions(self, item): 
+		digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+		first = int.from_bytes(digest[:8], 'little') 
+		second = int.from_bytes(digest[8:], 'little') | 1 
+		return [(first + i * second) % self._size for i in range(self._hashes)]
+	
+	
+	def add(self, item): 
+		for position in self._positions(item): 
+			self._bits[position >> 3] |= 1 << (position & 7) 
+		self._count += 1 
+	
+	
+	def __contains__(self, item): 
+		return all(self._bits[position >> 3] & (1 << (position & 7)) 
+		           for position in self._positions(item)) 
+	
+	
+	# Returns how many times add() was invoked. 
+	def __len__(self): 
+		return self._count 
+	
+	
+	# Returns how many bytes the bit array takes up. 
+	def memory(self): 
+		return len(self._bits) 
+	
+	
+	# Returns the expected false-positive rate given how many items were added.
+	def error_rate(self): 
+		filled = 1 - math.exp(-self._hashes * self._count / self._size) 
+		return filled ** self._hashes 
+
+
 class CircularQueue: 
 	class _CircularQueueIterator: 
 		def __init__(self, coll):
@@ -94,6 +181,11 @@ class CircularQueue:
 		return result[:-2] + ']' # Remove last comma and space 
 		
 	
+	# Returns how many more times insert() can be invoked. 
+	def remaining(self): 
+		return len(self._queue) - self._end_index 
+		
+	
 	# Returns how many times insert() was invoked. 
 	def __len__(self): 
 		return self._end_index 
@@ -102,56 +194,285 @@ class CircularQueue:
 	# Returns true if <item> exists somewhere inside the queue. 
 	def __contains__(self, item): 
 		return item in self._items 
+	
+	
+	# Returns a description of how much memory the seen-set takes up. 
+	def seen_stats(self): 
+		size = sys.getsizeof(self._items) 
+		size += sum(sys.getsizeof(item) for item in self._items) 
+		return f'Seen set: {len(self._items)} links in {size} bytes (exact)' 
+	
+	
+	# Moves the start pointer back <count> spots, so the most recently polled 
+	# items will be polled again. 
+	def rewind(self, count): 
+		self._start_index -= count 
+	
+	
+	# Nothing to save, the queue only lives in memory. 
+	def commit(self, pending=0): 
+		pass 
+	
+	
+	def close(self): 
+		pass 
 
 
-# Takes the website at the start of the queue, scrapes the hyperlinks found on
-# it, and adds each hyperlink to the end of the queue. 
-def process_website(queue, verbose, timeout, validate): 
-	assert not queue.is_full()
+# Same interface as CircularQueue, but everything is kept in a SQLite database
+# at <path> instead of in memory, so large crawls run in bounded memory and a 
+# crawl that was stopped can pick up where it left off by opening the same 
+# file again. 
+# 
+# If <error_rate> is given, a BloomFilter sits in front of the database so most 
+# links that were never seen skip the lookup on disk; the database still has 
+# the final say, so the filter's false positives cost a lookup, not a link. 
+# (CircularQueue has no such option: it keeps every link in memory anyway, so 
+# a filter in front of it would save next to nothing.) 
+class PersistentQueue: 
+	def __init__(self, path, length, error_rate=None): 
+		self._con = sqlite3.connect(path) 
+		self._con.execute('CREATE TABLE IF NOT EXISTS frontier(' 
+		                  'position INTEGER PRIMARY KEY, url TEXT UNIQUE)') 
+		self._con.execute('CREATE TABLE IF NOT EXISTS state(' 
+		                  'key TEXT PRIMARY KEY, value INTEGER)') 
+		self._con.commit() 
+		
+		self._length = length 
+		command = 'SELECT MAX(position) FROM frontier' 
+		last = self._con.execute(command).fetchone()[0] 
+		self._end_index = 0 if last is None else last + 1 
+		command = 'SELECT value FROM state WHERE key = "start_index"' 
+		start = self._con.execute(command).fetchone() 
+		self._start_index = 0 if start is None else start[0] 
+		
+		self._filter = None 
+		self._false_positives = 0 
+		if error_rate is not None: 
+			self._filter = BloomFilter(max(length, self._end_index), error_rate)
+			for url in self: 
+				self._filter.add(url) 
 	
-	# Contains rules for 'valid' hyperlinks, returns True if the link is valid. 
-	# Some links may be incomplete (as in they only contain the URL's path), 
-	# but incomplete links will still be marked as valid in this case. 
-	def is_valid(hyperlink): 
-		return                        \
-			hyperlink is not None and \
-			len(hyperlink) > 0    and \
-			hyperlink[0] != '#'   and \
-			'<' not in hyperlink  and \
-			'"' not in hyperlink 
 	
-	url = queue.poll()
-	if verbose: print('Reading: "', url, '" ... ', sep='', end='', flush=True) 
-	try: 
-		req = Request(url) 
-		html_page = urlopen(req, timeout=timeout) 
-	except Exception as ex: 
-		if verbose: 
-			message = f'{type(ex)}, {ex.reason}' 
-			print(Fore.YELLOW + f'Failed ({message})' + Style.RESET_ALL) 
-		return 
-	soup = BeautifulSoup(html_page, 'html.parser') 
-	if verbose: print(Fore.CYAN + 'Obtained' + Style.RESET_ALL)
+	def __iter__(self): 
+		command = 'SELECT url FROM frontier ORDER BY position' 
+		return (row[0] for row in self._con.execute(command)) 
+	
+	
+	# Inserts <value> to the end of the queue. 
+	def insert(self, value): 
+		assert self._end_index < self._length 
+		
+		command = 'INSERT INTO frontier VALUES(?, ?)' 
+		self._con.execute(command, (self._end_index, value)) 
+		self._end_index += 1 
+		if self._filter is not None: 
+			self._filter.add(value) 
+	
+	
+	# Returns the item at the beginning of the queue and advances the start 
+	# pointer to the next spot. 
+	def poll(self): 
+		assert not self.is_limit() 
+		
+		command = 'SELECT url FROM frontier WHERE position = ?' 
+		value = self._con.execute(command, (self._start_index,)).fetchone()[0]
+		self._start_index += 1 
+		return value 
+	
+	
+	# Returns true if we cannot add any more elements to the queue. 
+	def is_full(self): 
+		return self._end_index >= self._length 
+	
+	
+	# Returns true if we cannot poll any more. 
+	def is_limit(self): 
+		return self._start_index >= self._end_index 
+	
+	
+	# Returns how many more times insert() can be invoked. 
+	def remaining(self): 
+		return max(self._length - self._end_index, 0) 
+	
+	
+	def __str__(self): 
+		return '[' + ', '.join(self) + ']' 
+	
+	
+	# Returns how many times insert() was invoked. 
+	def __len__(self): 
+		return self._end_index 
+	
+	
+	# Returns true if <item> exists somewhere inside the queue. 
+	def __contains__(self, item): 
+		if self._filter is not None and item not in self._filter: 
+			return False 
+		
+		command = 'SELECT 1 FROM frontier WHERE url = ?' 
+		found = self._con.execute(command, (item,)).fetchone() is not None 
+		if self._filter is not None and not found: 
+			self._false_positives += 1 
+		return found 
 	
+	
+	# Returns a description of how much memory the seen-set takes up. 
+	def seen_stats(self): 
+		if self._filter is None: 
+			return f'Seen set: {len(self)} links on disk' 
+		
+		message =  filter_stats(self._filter) 
+		message += f', {self._false_positives} checked on disk and not found' 
+		return message 
+	
+	
+	# Moves the start pointer back <count> spots, so the most recently polled 
+	# items will be polled again. 
+	def rewind(self, count): 
+		self._start_index -= count 
+	
+	
+	# Saves everything inserted and polled so far. <pending> is how many of the
+	# most recently polled items haven't been fully processed yet; they will be
+	# polled again if the crawl is resumed from this point. 
+	def commit(self, pending=0): 
+		command = 'INSERT OR REPLACE INTO state VALUES("start_index", ?)' 
+		self._con.execute(command, (self._start_index - pending,)) 
+		self._con.commit() 
+	
+	
+	# Closes the database, throwing away anything not yet committed. 
+	def close(self): 
+		self._con.close() 
+
+
+# Returns a description of <bloom_filter>'s memory use and false-positive rate.
+def filter_stats(bloom_filter): 
+	message =  f'Seen filter: {len(bloom_filter)} links in ' 
+	message += f'{bloom_filter.memory()} bytes, estimated false-positive rate ' 
+	message += '%.4f%%' % (bloom_filter.error_rate() * 100) 
+	return message 
+
+
+# Contains rules for 'valid' hyperlinks, returns True if the link is valid. 
+# Some links may be incomplete (as in they only contain the URL's path), 
+# but incomplete links will still be marked as valid in this case. 
+def is_valid(hyperlink): 
+	return                        \
+		hyperlink is not None and \
+		len(hyperlink) > 0    and \
+		hyperlink[0] != '#'   and \
+		'<' not in hyperlink  and \
+		'"' not in hyperlink 
+
+
+# Downloads the page at <url> with <fetcher> (a fetch.Fetcher), returning the 
+# raw body of the response. Raises an exception if the page cannot be reached.
+def fetch_page(url, fetcher): 
+	with fetcher.open(url) as response: 
+		return response.read() 
+
+
+# Limits how many requests can be in flight to any one host at a time, so a 
+# concurrent crawl doesn't hammer a single server with every worker at once.
+class HostLimiter: 
+	def __init__(self, per_host): 
+		self._per_host = per_host 
+		self._semaphores = {} 
+		self._lock = threading.Lock() 
+	
+	
+	# Returns a context manager that waits for a free slot on <url>'s host. 
+	def slot(self, url): 
+		host = urlsplit(url).netloc 
+		with self._lock: 
+			if host not in self._semaphores: 
+				self._semaphores[host] = threading.Semaphore(self._per_host)
+			return self._semaphores[host] 
+	
+	
+	# Same as fetch_page, but waits for a free slot on the url's host first. 
+	def fetch(self, url, fetcher): 
+		with self.slot(url): 
+			return fetch_page(url, fetcher) 
+
+
+# Checks whether hyperlinks lead anywhere, pinging several of them at once. 
+# Results are remembered for the rest of the crawl, so a link that shows up on 
+# many pages is only ever pinged once. 
+class LinkValidator: 
+	def __init__(self, fetcher, workers, limiter): 
+		self._fetcher = fetcher 
+		self._limiter = limiter 
+		self._pool = ThreadPoolExecutor(max_workers=workers) 
+		self._results = {} 
+	
+	
+	def _ping(self, url): 
+		try: 
+			with self._limiter.slot(url): 
+				return self._fetcher.ping(url) 
+		except Exception: 
+			return False 
+	
+	
+	# Returns whether each of <hyperlinks> exists, in the same order. 
+	def check_all(self, hyperlinks): 
+		unknown = [x for x in dict.fromkeys(hyperlinks) if x not in self._results]
+		for hyperlink, exists in zip(unknown, self._pool.map(self._ping, unknown)):
+			self._results[hyperlink] = exists 
+		return [self._results[x] for x in hyperlinks] 
+	
+	
+	def close(self): 
+		self._pool.shutdown() 
+
+
+# Adds each of <hyperlinks> (the hrefs found on the page at <url>) to the end 
+# of the queue. If <validator> is given, only hyperlinks it finds to exist are 
+# added. 
+def add_links(queue, url, hyperlinks, verbose, validator): 
 	# In the example "https://en.wikipedia.org/wiki/Computer_science", the
-	# domain is "https://en.wikipedia.org". It is located by the first '/' after
-	# the first '//'.
-	domain = url[:url.index('/', url.index('//')+2)]
+	# domain is "https://en.wikipedia.org". The url may have no path at all, as
+	# in "https://en.wikipedia.org". 
+	parts = urlsplit(url) 
+	domain = f'{parts.scheme}://{parts.netloc}' 
 	
-	for link in soup.find_all('a'):
-		hyperlink = link.get('href')
+	# Collect the new hyperlinks first (None marks an invalid one) so they can 
+	# be validated in batches. 
+	candidates = [] 
+	found = set() 
+	for hyperlink in hyperlinks:
 		if is_valid(hyperlink): 
 			if hyperlink.find('//') <= 0: # Doesn't exist or is in first spot
 				hyperlink = domain + hyperlink 		
 			
-			if hyperlink in queue:
+			# Each page is only added once, however its link is spelled 
+			try: 
+				hyperlink = normalize_url(hyperlink) 
+			except ValueError: # Such as an unclosed "[" around the host 
+				candidates.append((hyperlink, False)) 
 				continue 
 			
-			if validate: 
-				try: 
-					validate_request = Request(hyperlink) 
-					urlopen(validate_request, timeout=timeout)
-				except Exception as ex: 
+			if hyperlink in queue or hyperlink in found:
+				continue 
+			found.add(hyperlink) 
+			candidates.append((hyperlink, True)) 
+		else: 
+			candidates.append((hyperlink, False)) 
+	
+	exists = {} 
+	for index, (hyperlink, valid) in enumerate(candidates): 
+		if valid: 
+			if validator is not None: 
+				if hyperlink not in exists: 
+					# Ping as many upcoming links as could still fit in the 
+					# queue, all at once 
+					batch = [x for x, ok in candidates[index:] if ok] 
+					batch = batch[:queue.remaining()] 
+					exists.update(zip(batch, validator.check_all(batch))) 
+				
+				if not exists[hyperlink]: 
 					if verbose: 
 						message =  f'{Fore.YELLOW}    Missing: {hyperlink}'
 						message += Style.RESET_ALL
@@ -170,12 +491,99 @@ def process_website(queue, verbose, timeout, validate):
 			print(Fore.YELLOW + '    Invalid:', hyperlink, Style.RESET_ALL) 
 
 
+# Prints why the page at <url> could not be read. 
+def print_failure(ex): 
+	message = f'{type(ex)}, {getattr(ex, "reason", ex)}' 
+	print(Fore.YELLOW + f'Failed ({message})' + Style.RESET_ALL) 
+
+
+# Takes the website at the start of the queue, scrapes the hyperlinks found on
+# it, and adds each hyperlink to the end of the queue. 
+def process_website(queue, verbose, fetcher, validator): 
+	assert not queue.is_full()
+	
+	url = queue.poll()
+	if verbose: print('Reading: "', url, '" ... ', sep='', end='', flush=True) 
+	try: 
+		html_page = fetch_page(url, fetcher) 
+	except Exception as ex: 
+		if verbose: print_failure(ex) 
+		return 
+	if verbose: print(Fore.CYAN + 'Obtained' + Style.RESET_ALL)
+	add_links(queue, url, extract_links(html_page), verbose, validator) 
+
+
+# Polls every url in the queue until it is exhausted, yielding (url, content, 
+# error) for each in the order they were polled, where <content> is the body 
+# of the page or None if downloading it raised <error>. Up to <concurrency> 
+# pages are downloaded at once (no more than <limiter> allows from the same 
+# host), so the caller can add more urls to the queue while the next pages are
+# downloading. 
+def fetch_pages(queue, concurrency, limiter, fetcher): 
+	in_flight = deque() 
+	with ThreadPoolExecutor(max_workers=concurrency) as pool: 
+		try: 
+			while True: 
+				# Keep the window of outstanding downloads topped up 
+				while len(in_flight) < concurrency and not queue.is_limit(): 
+					url = queue.poll() 
+					future = pool.submit(limiter.fetch, url, fetcher) 
+					in_flight.append((url, future)) 
+				
+				if len(in_flight) == 0: 
+					return # Frontier is exhausted 
+				
+				url, future = in_flight.popleft() 
+				try: 
+					yield url, future.result(), None 
+				except Exception as ex: 
+					yield url, None, ex 
+				queue.commit(len(in_flight)) 
+		finally: 
+			# The caller stopped early, so downloads still in flight are 
+			# useless. Their urls go back in the queue to be polled again. 
+			for url, future in in_flight: 
+				future.cancel() 
+			queue.rewind(len(in_flight)) 
+
+
+# Same as calling process_website until the queue is exhausted, but keeps up to
+# <concurrency> pages downloading at once (no more than <limiter> allows from 
+# the same host). Pages are still processed in the order they were polled, so
+# the resulting queue is identical to the one a sequential crawl would build. 
+def crawl_concurrent(queue, concurrency, limiter, verbose, fetcher, validator):
+	if queue.is_full(): 
+		return 
+	
+	pages = fetch_pages(queue, concurrency, limiter, fetcher) 
+	with closing(pages): 
+		for url, html_page, ex in pages: 
+			if verbose: 
+				print('Reading: "', url, '" ... ', sep='', end='', flush=True) 
+			if ex is not None: 
+				if verbose: print_failure(ex) 
+				continue 
+			if verbose: print(Fore.CYAN + 'Obtained' + Style.RESET_ALL)
+			
+			add_links(queue, url, extract_links(html_page), verbose, validator)
+			if queue.is_full(): 
+				break 
+	
+	# Closing the downloads put those still in flight back in the queue, so 
+	# they are left pending and polled again when the crawl is resumed. 
+	queue.commit() 
+
+
 # Prints the usage of this file to stderr 
 def print_usage(): 
 	lines = [\
 		'Usage: ',                                                             \
 		'    python3 crawl.py <start> <limit> [-o <output>]',                  \
 		'        [-t <timeout>] [--verbose] [--validate]',                     \
+		'        [--concurrency <workers>] [--per-host <requests>]',           \
+		'        [--resume <state>] [--seen-filter <rate>]',                   \
+		'        [--cache <directory>] [--offline]',                           \
+		'        [--pool-size <connections>]',                                 \
 		'',                                                                    \
 		'Options:',                                                            \
 		'    <start>: Starting hyperlink (string)',                            \
@@ -186,12 +594,53 @@ def print_usage():
 		'        given hyperlink before moving on, default is 5 seconds',      \
 		'    verbose: If supplied, prints debug information to stdout',        \
 		'    validate: If supplied, attempts to ping each hyperlink found to ',\
-		'        verify it actually exists']
+		'        verify it actually exists',                                   \
+		'    <workers>: Optional, how many pages to download at once ',        \
+		'        (positive integer), default is 1',                            \
+		'    <requests>: Optional, how many of those downloads may go to the ',\
+		'        same host at once (positive integer), default is 2',          \
+		'    <state>: Optional, file to keep the crawl\'s progress in ',       \
+		'        (string). If it already exists, the crawl picks up where it ',\
+		'        stopped instead of starting over from <start>',               \
+		'    <rate>: Optional, with --resume, check a Bloom filter with ',     \
+		'        this false-positive rate (between 0 and 1) before looking ',  \
+		'        a link up in <state>, which skips the lookup for most ',      \
+		'        links that were never found',                                 \
+		'    <directory>: Optional, keep every downloaded page in this ',      \
+		'        directory and only download it again if it has changed ',     \
+		'        (e.g. "data/cache")',                                         \
+		'    offline: If supplied, only reads pages from the cache ',          \
+		'        directory (default is "data/cache")',                         \
+		'    <connections>: Optional, how many idle connections to keep ',     \
+		'        open to each host between requests (positive integer), ',     \
+		f'        default is {default_pool_size}']
 		
 	for line in lines: 
 		eprint(line, do_color=False) 
 
 
+# Parses <value> as a positive integer, exiting with an error message that 
+# refers to it as <name> otherwise. 
+def parse_positive_int(value, name): 
+	try: 
+		amount = int(value) 
+	except ValueError: 
+		message =  f'Error: {name} must be an integer and positive, "'
+		message += str(value) + '" found\n'
+		eprint(message) 
+		print_usage() 
+		sys.exit(1) 
+	
+	if amount <= 0: 
+		message =  f'Error: {name} must be positive, "' + str(value)
+		message += '" found\n'
+		eprint(message) 
+		print_usage() 
+		sys.exit(1) 
+	
+	return amount 
+
+
 def main(args):
 	# For ease of testing, this turns command-line arguments passed as a string
 	# into something more traditionally used with sys.argv
@@ -222,9 +671,17 @@ def main(args):
 	verbose = None 
 	timeout = None 
 	validate = None 
+	concurrency = None 
+	per_host = None 
+	state_file = None 
+	error_rate = None 
+	cache_directory = None 
+	offline = None 
+	pool_size = None 
 	try: 
 		short = 'o:v:t:verb:val' 
-		long = ['verbose', 'validate']
+		long = ['verbose', 'validate', 'concurrency=', 'per-host=', 'resume=',
+		        'seen-filter=', 'cache=', 'offline', 'pool-size=']
 		iterator = getopt.gnu_getopt(args, short, long)[0]
 	except getopt.GetoptError as ex:
 		eprint(f'Error: unrecognized argument specified "{ex.opt}"\n')
@@ -270,6 +727,76 @@ def main(args):
 		elif option == '--validate':
 			validate = True 
 			
+		elif option == '--concurrency': 
+			if concurrency is not None: 
+				message =  'Error: only one argument can specify a concurrency '
+				message += 'amount\n' 
+				eprint(message) 
+				print_usage() 
+				sys.exit(1) 
+			
+			concurrency = parse_positive_int(value, 'concurrency amount') 
+			
+		elif option == '--per-host': 
+			if per_host is not None: 
+				message =  'Error: only one argument can specify a per-host '
+				message += 'amount\n' 
+				eprint(message) 
+				print_usage() 
+				sys.exit(1) 
+			
+			per_host = parse_positive_int(value, 'per-host amount') 
+			
+		elif option == '--resume': 
+			if state_file is not None: 
+				eprint('Error: only one argument can specify a state file\n')
+				print_usage() 
+				sys.exit(1) 
+			
+			state_file = value 
+			
+		elif option == '--seen-filter': 
+			if error_rate is not None: 
+				message =  'Error: only one argument can specify a seen-filter '
+				message += 'rate\n' 
+				eprint(message) 
+				print_usage() 
+				sys.exit(1) 
+			
+			try: 
+				error_rate = float(value) 
+			except ValueError: 
+				error_rate = -1 
+			
+			if not 0 < error_rate < 1: 
+				message =  'Error: seen-filter rate must be between 0 and 1, "'
+				message += str(value) + '" found\n' 
+				eprint(message) 
+				print_usage() 
+				sys.exit(1) 
+			
+		elif option == '--cache': 
+			if cache_directory is not None: 
+				message =  'Error: only one argument can specify a cache '
+				message += 'directory\n' 
+				eprint(message) 
+				print_usage() 
+				sys.exit(1) 
+			
+			cache_directory = value 
+			
+		elif option == '--offline': 
+			offline = True 
+			
+		elif option == '--pool-size': 
+			if pool_size is not None: 
+				message =  'Error: only one argument can specify a pool size\n'
+				eprint(message) 
+				print_usage() 
+				sys.exit(1) 
+			
+			pool_size = parse_positive_int(value, 'pool size') 
+			
 		else: 
 			eprint(f'Error: unrecognized argument specified "{ex.opt}"\n')
 			print_usage() 
@@ -279,6 +806,17 @@ def main(args):
 	if verbose is None: verbose = False 
 	if timeout is None:   timeout = 5
 	if validate is None:  validate = False 
+	if concurrency is None: concurrency = 1 
+	if per_host is None:    per_host = 2 
+	if offline is None:     offline = False 
+	if pool_size is None:   pool_size = default_pool_size 
+	if offline and cache_directory is None: 
+		cache_directory = default_cache_directory 
+	
+	if error_rate is not None and state_file is None: 
+		eprint('Error: --seen-filter can only be used with --resume\n') 
+		print_usage() 
+		sys.exit(1) 
 	
 	# Open either a new file or stdout 
 	if output_file_directory is None: 
@@ -298,10 +836,51 @@ def main(args):
 	
 	# Process each website in a breadth-first search starting with the start 
 	# hyperlink. 
-	queue = CircularQueue(limit) 
-	queue.insert(start) 
-	while not queue.is_full() and not queue.is_limit(): 
-		process_website(queue, verbose, timeout, validate)
+	if state_file is None: 
+		queue = CircularQueue(limit) 
+	else: 
+		try: 
+			queue = PersistentQueue(state_file, limit, error_rate) 
+		except sqlite3.Error: 
+			eprint(f'Error: cannot open state file "{state_file}"\n') 
+			sys.exit(1) 
+		
+		if verbose and len(queue) > 0: 
+			print(f'Resuming with {len(queue)} links found') 
+	
+	if len(queue) == 0: 
+		queue.insert(normalize_url(start)) 
+	
+	cache = None 
+	if cache_directory is not None: 
+		try: 
+			cache = ResponseCache(cache_directory) 
+		except (OSError, sqlite3.Error): 
+			eprint(f'Error: cannot open cache directory "{cache_directory}"\n')
+			sys.exit(1) 
+	fetcher = Fetcher(timeout, cache, offline, pool_size) 
+	
+	limiter = HostLimiter(per_host) 
+	validator = None 
+	if validate: 
+		validator = LinkValidator(fetcher, validation_workers, limiter) 
+	
+	try: 
+		if concurrency > 1: 
+			crawl_concurrent(queue, concurrency, limiter, verbose, fetcher, \
+			                 validator) 
+		else: 
+			while not queue.is_full() and not queue.is_limit(): 
+				process_website(queue, verbose, fetcher, validator)
+				queue.commit() 
+			queue.commit() 
+	except BaseException: 
+		queue.close() 
+		raise 
+	finally: 
+		if validator is not None: 
+			validator.close() 
+		fetcher.close() 
 	
 	# Print the contents of the queue to the output file 
 	if verbose and output_file != sys.stdout: 
@@ -313,6 +892,11 @@ def main(args):
 	if output_file != sys.stdout:
 		output_file.close() 
 		if verbose: print(Fore.CYAN + 'done' + Style.RESET_ALL) 
+	
+	if verbose: 
+		print(queue.seen_stats()) 
+		print(fetcher.stats()) 
+	queue.close() 
 
 
 # Boilerplate tests that verify command-line arguments, where the key is the
@@ -342,7 +926,28 @@ cla_tests = {                                                                  \
 	'crawl.py https://en.wikipedia.org/wiki/Computer_science 10 ' +            \
 	'-o file1.out -o file2.out',                                               \
 'multiple_timeout_specified':                                                  \
-	'crawl.py https://en.wikipedia.org/wiki/Computer_science 10 -t 5 -t 10'    \
+	'crawl.py https://en.wikipedia.org/wiki/Computer_science 10 -t 5 -t 10',   \
+'concurrency_not_numeric':                                                     \
+	'crawl.py https://en.wikipedia.org/wiki/Computer_science 10 ' +            \
+	'--concurrency many',                                                      \
+'per_host_negative':                                                           \
+	'crawl.py https://en.wikipedia.org/wiki/Computer_science 10 ' +            \
+	'--per-host -1',                                                           \
+'multiple_concurrency_specified':                                              \
+	'crawl.py https://en.wikipedia.org/wiki/Computer_science 10 ' +            \
+	'--concurrency 2 --concurrency 4',                                         \
+'multiple_resume_specified':                                                   \
+	'crawl.py https://en.wikipedia.org/wiki/Computer_science 10 ' +            \
+	'--resume state-1.db --resume state-2.db',                                 \
+'seen_filter_out_of_range':                                                    \
+	'crawl.py https://en.wikipedia.org/wiki/Computer_science 10 ' +            \
+	'--seen-filter 1.5',                                                       \
+'seen_filter_without_resume':                                                  \
+	'crawl.py https://en.wikipedia.org/wiki/Computer_science 10 ' +            \
+	'--seen-filter 0.01',                                                      \
+'pool_size_zero':                                                              \
+	'crawl.py https://en.wikipedia.org/wiki/Computer_science 10 ' +            \
+	'--pool-size 0'                                                            \
 }
 
 
@@ -400,5 +1005,456 @@ class UniqueTests(unittest.TestCase):
 			self.assertEqual(len(links), len(set(links))) 
 			
 
+# Serves a small generated website from a local http.server, so tests can crawl
+# something without depending on the internet. <pages> maps each path to the
+# paths it links to. 
+class LocalSiteTest(unittest.TestCase): 
+	pages = {
+		'/':       ['/a.html', '/b.html', '/c.html'],
+		'/a.html': ['/', '/d.html', '/e.html', '#top'],
+		'/b.html': ['/d.html', '/f.html', '/missing.html'],
+		'/c.html': ['/g.html', '/h.html', '/missing.html'],
+		'/d.html': ['/i.html'],
+		'/e.html': [], '/f.html': [], '/g.html': [], '/h.html': [], 
+		'/i.html': []
+	}
+	delay = 0.0 # Seconds the server waits before answering each request
+	compress = False # Whether pages are sent gzip-compressed when asked to 
+	
+	
+	@classmethod
+	def setUpClass(cls): 
+		cls.directory = tempfile.TemporaryDirectory() 
+		for path, links in cls.pages.items(): 
+			name = 'index.html' if path == '/' else path[1:] 
+			body = ''.join(f'<a href="{link}">{link}</a>' for link in links)
+			body += f'<p>Welcome to the {name} test page</p>' 
+			with open(os.path.join(cls.directory.name, name), 'w') as page: 
+				page.write(f'<html><body>{body}</body></html>') 
+		
+		test = cls 
+		class Handler(http.server.SimpleHTTPRequestHandler): 
+			protocol_version = 'HTTP/1.1' # Keeps connections open 
+			
+			
+			def __init__(self, *args, **kwargs): 
+				super().__init__(*args, directory=test.directory.name, **kwargs)
+			
+			
+			def do_GET(self): 
+				encodings = self.headers.get('Accept-Encoding', '') 
+				if test.compress and 'gzip' in encodings: 
+					self.count(self.send_compressed) 
+				else: 
+					self.count(super().do_GET) 
+			
+			
+			def send_compressed(self): 
+				path = self.translate_path(self.path) 
+				if os.path.isdir(path): 
+					path = os.path.join(path, 'index.html') 
+				try: 
+					with open(path, 'rb') as page: 
+						body = gzip.compress(page.read()) 
+				except OSError: 
+					self.send_error(404) 
+					return 
+				
+				self.send_response(200) 
+				self.send_header('Content-Type', 'text/html') 
+				self.send_header('Content-Encoding', 'gzip') 
+				self.send_header('Content-Length', str(len(body))) 
+				self.end_headers() 
+				self.wfile.write(body) 
+			
+			
+			def do_HEAD(self): 
+				self.count(super().do_HEAD) 
+			
+			
+			# Answers the request with <respond> while keeping track of how 
+			# many requests are being answered at once
+			def count(self, respond): 
+				with test.lock: 
+					test.in_flight += 1 
+					test.max_in_flight = max(test.max_in_flight, test.in_flight)
+					test.requests.append((self.command, self.path)) 
+				time.sleep(test.delay) 
+				try: 
+					respond() 
+				finally: 
+					with test.lock: 
+						test.in_flight -= 1 
+			
+			
+			def log_message(self, format, *args): 
+				pass # Keep the test output clean 
+		
+		cls.lock = threading.Lock() 
+		cls.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+		cls.url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+		threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+	
+	
+	@classmethod
+	def tearDownClass(cls): 
+		cls.server.shutdown() 
+		cls.server.server_close() 
+		cls.directory.cleanup() 
+	
+	
+	def setUp(self): 
+		type(self).in_flight = 0 
+		type(self).max_in_flight = 0 
+		type(self).requests = [] 
+	
+	
+	# Runs main with <args> (anything after "crawl.py <start>") and returns what
+	# it printed. 
+	def crawl(self, args): 
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
+			main(f'crawl.py {self.url}/ {args}') 
+			return fake_out.getvalue() 
+
+
+# Tests for crawling with several downloads in flight at once. 
+class ConcurrentCrawlTests(LocalSiteTest): 
+	delay = 0.05 
+	
+	
+	# Tests that a concurrent crawl finds the same links, in the same order, as 
+	# a sequential one 
+	def test_same_links(self): 
+		for limit in (1, 4, 9, 20): 
+			sequential = self.crawl(f'{limit}') 
+			concurrent = self.crawl(f'{limit} --concurrency 4 --per-host 4') 
+			self.assertEqual(sequential, concurrent) 
+	
+	
+	# Tests that no more than <per-host> requests reach the server at once
+	def test_per_host_limit(self): 
+		self.crawl('20 --concurrency 8 --per-host 2') 
+		self.assertLessEqual(self.max_in_flight, 2) 
+		self.assertGreater(len(self.requests), 2) 
+	
+	
+	# Tests that downloads actually overlap when allowed to 
+	def test_overlap(self): 
+		self.crawl('20 --concurrency 4 --per-host 4') 
+		self.assertGreater(self.max_in_flight, 1) 
+
+
+# Tests for --validate against the local site. 
+class ValidateTests(LocalSiteTest): 
+	# Tests that links which do not lead anywhere are reported and skipped
+	def test_missing(self): 
+		out = self.crawl('20 --verbose --validate') 
+		self.assertRegex(out, r'Missing: .*/missing.html') 
+		self.assertNotRegex(out, r'Added: .*/missing.html') 
+		self.assertRegex(out, r'Added: .*/i.html') 
+	
+	
+	# Tests that links are checked with HEAD requests, and only once each even
+	# when they appear on several pages 
+	def test_checked_once(self): 
+		self.crawl('20 --validate --concurrency 4') 
+		pings = [path for method, path in self.requests if method == 'HEAD'] 
+		self.assertIn('/missing.html', pings) 
+		self.assertEqual(len(pings), len(set(pings))) 
+	
+	
+	# Tests that validating gives the same links as not validating, minus the 
+	# missing ones 
+	def test_same_links(self): 
+		validated = self.crawl('20 --validate').split() 
+		unvalidated = self.crawl('20').split() 
+		unvalidated.remove(self.url + '/missing.html') 
+		self.assertEqual(validated, unvalidated) 
+
+
+# Tests for keeping the crawl's progress on disk with --resume. 
+class ResumeTests(LocalSiteTest): 
+	def setUp(self): 
+		super().setUp() 
+		self.state = os.path.join(self.directory.name, 'state.db') 
+		if os.path.isfile(self.state): 
+			os.remove(self.state) 
+	
+	
+	# Tests that raising the limit on a finished crawl continues it instead of
+	# starting over 
+	def test_extend(self): 
+		expected = self.crawl('20') 
+		self.crawl(f'4 --resume {self.state}') 
+		self.requests.clear() 
+		self.assertEqual(self.crawl(f'20 --resume {self.state}'), expected) 
+		self.assertNotIn(('GET', '/'), self.requests) 
+	
+	
+	# Same as test_extend, for a concurrent crawl, which stops with pages still
+	# in flight when the queue fills up 
+	def test_extend_concurrent(self): 
+		expected = self.crawl('20') 
+		args = f'--resume {self.state} --concurrency 4 --per-host 4' 
+		self.crawl(f'6 {args}') 
+		self.requests.clear() 
+		self.assertEqual(self.crawl(f'20 {args}'), expected) 
+		self.assertNotIn(('GET', '/'), self.requests) 
+	
+	
+	# Tests that a crawl killed partway through gives the same result once 
+	# resumed, without downloading the finished pages again 
+	def test_interrupted(self): 
+		expected = self.crawl('20') 
+		
+		calls = [] 
+		def interrupt(url, fetcher): 
+			calls.append(url) 
+			if len(calls) == 3: 
+				raise KeyboardInterrupt 
+			return real_fetch_page(url, fetcher) 
+		
+		real_fetch_page = fetch_page 
+		with unittest.mock.patch(__name__ + '.fetch_page', new = interrupt): 
+			with self.assertRaises(KeyboardInterrupt): 
+				self.crawl(f'20 --resume {self.state}') 
+		
+		self.requests.clear() 
+		self.assertEqual(self.crawl(f'20 --resume {self.state}'), expected) 
+		self.assertNotIn(('GET', '/'), self.requests) 
+		
+
+
+# Tests for remembering which links were found with a BloomFilter. 
+class SeenFilterTests(LocalSiteTest): 
+	# Tests that the filter never forgets an item and rarely claims to have 
+	# one it doesn't 
+	def test_error_rate(self): 
+		bloom_filter = BloomFilter(10000, 0.01) 
+		for i in range(10000): 
+			bloom_filter.add(f'https://example.com/{i}') 
+		
+		self.assertTrue(all(f'https://example.com/{i}' in bloom_filter 
+		                    for i in range(10000))) 
+		false_positives = sum(f'https://example.org/{i}' in bloom_filter 
+		                      for i in range(10000)) 
+		self.assertLess(false_positives, 200) 
+		self.assertLess(bloom_filter.memory(), 16000) 
+	
+	
+	# Tests that the queue only claims to have the items inserted, even when 
+	# the filter is wrong about many others 
+	def test_false_positives(self): 
+		state = os.path.join(self.directory.name, 'filter-state.db') 
+		queue = PersistentQueue(state, 1000, 0.5) 
+		for i in range(1000): 
+			queue.insert(f'https://example.com/{i}') 
+		
+		self.assertTrue(all(f'https://example.com/{i}' in queue 
+		                    for i in range(1000))) 
+		self.assertFalse(any(f'https://example.org/{i}' in queue 
+		                     for i in range(1000))) 
+		self.assertRegex(queue.seen_stats(), r', [1-9][0-9]* checked on disk') 
+		queue.close() 
+		os.remove(state) 
+	
+	
+	# Tests that different spellings of the same url are only added once, with
+	# or without the filter 
+	def test_normalize(self): 
+		state = os.path.join(self.directory.name, 'filter-state.db') 
+		links = ['HTTP://Example.com:80/a', 'http://example.com/a#top', '/a', 
+		         'https://example.com/a', 'http://example.com'] 
+		for queue in (CircularQueue(10), PersistentQueue(state, 10, 0.01)): 
+			add_links(queue, 'http://example.com/', links, False, None) 
+			self.assertEqual(list(queue), ['http://example.com/a', 
+			                               'https://example.com/a', 
+			                               'http://example.com/']) 
+			queue.close() 
+		os.remove(state) 
+	
+	
+	# Tests that crawling with the filter finds the same links and reports its
+	# memory use 
+	def test_crawl(self): 
+		expected = self.crawl('20') 
+		state = os.path.join(self.directory.name, 'filter-state.db') 
+		out = self.crawl(f'20 --resume {state} --seen-filter 0.001 --verbose') 
+		self.assertRegex(out, r'Seen filter: 11 links in [0-9]+ bytes') 
+		os.remove(state) 
+		
+		self.crawl(f'4 --resume {state} --seen-filter 0.001') 
+		out = self.crawl(f'20 --resume {state} --seen-filter 0.001') 
+		self.assertEqual(out, expected) 
+		os.remove(state) 
+
+
+# Tests for keeping downloaded pages on disk with --cache. 
+class CacheTests(LocalSiteTest): 
+	def setUp(self): 
+		super().setUp() 
+		self.cache = tempfile.TemporaryDirectory() 
+	
+	
+	def tearDown(self): 
+		self.cache.cleanup() 
+	
+	
+	# Tests that pages in the cache are revalidated instead of downloaded again,
+	# giving the same result 
+	def test_revalidate(self): 
+		expected = self.crawl(f'20 --cache {self.cache.name}') 
+		self.assertEqual(self.crawl(f'20 --cache {self.cache.name}'), expected)
+		objects = os.path.join(self.cache.name, 'objects') 
+		self.assertGreater(sum(len(x) for _, _, x in os.walk(objects)), 0) 
+	
+	
+	# Tests that an offline crawl gives the same result without contacting the
+	# server, and stops at pages that were never downloaded 
+	def test_offline(self): 
+		expected = self.crawl(f'20 --cache {self.cache.name}') 
+		self.requests.clear() 
+		out = self.crawl(f'20 --cache {self.cache.name} --offline') 
+		self.assertEqual(out, expected) 
+		self.assertEqual(self.requests, []) 
+		
+		with tempfile.TemporaryDirectory() as empty: 
+			out = self.crawl(f'20 --cache {empty} --offline') 
+		self.assertEqual(out.split(), [self.url + '/']) 
+	
+	
+	# Tests that a fetcher asks the server whether a cached page has changed
+	# and reads it from the cache when it hasn't 
+	def test_not_modified(self): 
+		cache = ResponseCache(self.cache.name) 
+		fetcher = Fetcher(5, cache) 
+		try: 
+			with fetcher.open(self.url + '/a.html') as response: 
+				first = response.read() 
+				self.assertFalse(response.not_modified) 
+			with fetcher.open(self.url + '/a.html') as response: 
+				self.assertEqual(response.read(), first) 
+				self.assertTrue(response.not_modified) 
+		finally: 
+			fetcher.close() 
+		
+		gets = [x for x in self.requests if x == ('GET', '/a.html')] 
+		self.assertEqual(len(gets), 2) 
+
+
+# Tests for keeping connections to the server open between requests. 
+class ConnectionPoolTests(LocalSiteTest): 
+	# Tests that a sequential crawl keeps using the same connection, only 
+	# connecting again after the server closes it (which it does after 
+	# answering /missing.html with an error) 
+	def test_reuse(self): 
+		out = self.crawl('20 --verbose') 
+		requests = len(self.requests) 
+		message = f'Connections: 2 opened for {requests} requests ' 
+		message += f'\\({requests - 2} reused\\)' 
+		self.assertRegex(out, message) 
+	
+	
+	# Tests that concurrent crawls and validation give the same result no 
+	# matter how many connections are kept 
+	def test_same_links(self): 
+		expected = self.crawl('20 --validate') 
+		for size in (1, 4): 
+			args = f'20 --validate --concurrency 4 --per-host 4 --pool-size {size}'
+			self.assertEqual(self.crawl(args), expected) 
+	
+	
+	# Tests that compressed pages are decompressed 
+	def test_gzip(self): 
+		expected = self.crawl('20') 
+		type(self).compress = True 
+		try: 
+			self.assertEqual(self.crawl('20'), expected) 
+			fetcher = Fetcher(5) 
+			with fetcher.open(self.url + '/a.html') as response: 
+				self.assertEqual(response.headers['Content-Encoding'], 'gzip') 
+				self.assertIn(b'Welcome to the a.html', response.read()) 
+			fetcher.close() 
+		finally: 
+			type(self).compress = False 
+	
+	
+	# Tests that the end of a compressed body is kept when the response closes
+	# right after the read that reached it, here exactly two reads long, with a
+	# decoder that holds the end back until it is flushed 
+	def test_flush_at_boundary(self): 
+		size = 2 * 64 * 1024 
+		source = random.Random(8).randbytes(2 * size) 
+		content = source[:size] 
+		compressed = gzip.compress(content, mtime=0) 
+		while len(compressed) != size: # Random bytes barely compress 
+			content = source[:len(content) + size - len(compressed)] 
+			compressed = gzip.compress(content, mtime=0) 
+		
+		class Response: 
+			headers = {'Content-Encoding': 'gzip'} 
+			status = 200 
+			reason = 'OK' 
+			will_close = True 
+			stream = io.BytesIO(compressed) 
+			
+			def read(self, size): 
+				return self.stream.read(size) 
+			
+			def isclosed(self): 
+				return self.stream.tell() == len(compressed) 
+			
+			def close(self): 
+				pass 
+		
+		decompressobj = fetch.zlib.decompressobj 
+		class Decoder: 
+			def __init__(self, *args): 
+				self._decoder = decompressobj(*args) 
+				self._held = b'' 
+			
+			def decompress(self, data): 
+				data = self._held + self._decoder.decompress(data) 
+				self._held = data[-1:] 
+				return data[:-1] 
+			
+			def flush(self): 
+				return self._held + self._decoder.flush() 
+		
+		with unittest.mock.patch.object(fetch.zlib, 'decompressobj', Decoder): 
+			body = fetch._PooledBody(None, None, unittest.mock.Mock(), 
+			                         Response()) 
+			self.assertEqual(body.read(), content) 
+	
+	
+	# Tests that pinging a page leaves its connection open for the next 
+	# request, and that a connection which never got an answer isn't counted 
+	def test_ping_reuse(self): 
+		fetcher = Fetcher(5) 
+		self.assertTrue(fetcher.ping(self.url + '/a.html')) 
+		self.assertTrue(fetcher.ping(self.url + '/b.html')) 
+		with self.assertRaises(URLError): 
+			fetcher.open('http://127.0.0.1:1/') 
+		fetcher.close() 
+		self.assertEqual(fetcher.stats(), 
+		                 'Connections: 1 opened for 2 requests (1 reused)') 
+	
+	
+	# Tests that requests go through the proxy the environment gives, unless 
+	# the host is one to reach directly 
+	def test_proxy(self): 
+		environment = {'http_proxy': 'http://127.0.0.1:1', 'no_proxy': ''} 
+		with unittest.mock.patch.dict('os.environ', environment): 
+			fetcher = Fetcher(5) 
+			with self.assertRaises(URLError): 
+				fetch_page(self.url + '/a.html', fetcher) 
+			fetcher.close() 
+			
+			os.environ['no_proxy'] = '127.0.0.1' 
+			fetcher = Fetcher(5) 
+			self.assertIn(b'a.html', fetch_page(self.url + '/a.html', fetcher)) 
+			fetcher.close() 
+
+
 if __name__ == '__main__':
 	main(sys.argv)
\ No newline at end of file
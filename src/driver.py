@@ -8,6 +8,8 @@ from colorama import Style, Fore
 from searchSuggestion import SearchSuggestion
 import csv
 from prepSuggestionMaster import appendPrepSuggestionMaster, searchSuggestionDriver
+import index
+from cache import StemCache
 
 num_results = 5
 
@@ -44,6 +46,13 @@ def check_valid_websites(cur):
 
 
 if __name__ == '__main__':
+	# With --socket <path>, queries are sent to a server started with 
+	# "python3 src/index.py --serve --socket <path> -b <database>" instead of 
+	# being answered in this process 
+	socket_path = None 
+	if '--socket' in sys.argv[1:-2]: 
+		socket_path = sys.argv[sys.argv.index('--socket') + 1] 
+	
 	database_file = sys.argv[-1]
 	if not os.path.isfile(database_file) or database_file[-3:] != '.db': 
 		eprint('Error: last argument must be a database file.')
@@ -61,8 +70,18 @@ if __name__ == '__main__':
 		for row in reader_obj:
 			ss.batch_insert(row)
 	
-	query_command = f'python3 src/index.py -q "%s" -b {database_file}'  
-	name_command = f'SELECT url FROM website WHERE id = %s'
+	if socket_path is None: 
+		stop_words = set(index.stopwords.words('english')) 
+		stemmer = StemCache(index.load_stemmer()) 
+		server = index.QueryServer(con, stop_words, stemmer, 
+		                           index.default_scorer) 
+	else: 
+		try: 
+			server = index.QueryClient(socket_path) 
+		except OSError: 
+			eprint(f'Error: no query server is listening on "{socket_path}"') 
+			sys.exit(1) 
+	
 	while True: 
 		query = input('Enter a query: ')
 		if query.lower().strip() == 'quit': 
@@ -73,12 +92,11 @@ if __name__ == '__main__':
 				print('  ' + suggestion)
 			print()
 		else: 		
-			ids_str = os.popen(query_command % query).read() 
-			ids = ids_str.split(';')
-			
-			for web_id in ids[:min(len(ids_str),num_results)]: 
-				name = cur.execute(name_command % web_id).fetchone()[0]
+			answer = server.answer({'query': query, 'k': num_results}) 
+			for _, name, _ in answer.get('websites', []): 
 				print('  ' + name) 
 			print() 
-		
+	
+	if socket_path is not None: 
+		server.close() 
 	con.close() 
\ No newline at end of file
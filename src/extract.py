@@ -0,0 +1,230 @@
+import codecs
+from html.parser import HTMLParser
+import io
+import unittest
+
+try:
+	from lxml import etree
+except ImportError:
+	etree = None # lxml is optional, html.parser is used without it
+
+
+# Kinds of items yielded by extract()
+LINK = 'link'
+TEXT = 'text'
+
+# How many bytes of a page are read and parsed at a time
+chunk_size = 64 * 1024
+
+# Elements whose content is never shown on the page
+hidden_tags = {'script', 'style', 'template', 'noscript'}
+
+
+# Reads <source> (a string, bytes, or a binary file object like an HTTP
+# response) a chunk at a time, yielding decoded strings as they are read.
+def read_chunks(source):
+	if isinstance(source, str):
+		yield source
+		return
+	if isinstance(source, bytes):
+		source = io.BytesIO(source)
+
+	charset = None
+	if hasattr(source, 'headers'):
+		charset = source.headers.get_content_charset()
+	try:
+		decoder = codecs.getincrementaldecoder(charset or 'utf-8')('replace')
+	except LookupError:
+		decoder = codecs.getincrementaldecoder('utf-8')('replace')
+
+	while True:
+		chunk = source.read(chunk_size)
+		if not chunk:
+			break
+		yield decoder.decode(chunk)
+	yield decoder.decode(b'', final=True)
+
+
+# Event-based parser that collects the hyperlinks and visible text of a page as
+# it is fed, without building a tree of the whole document. Text can arrive in
+# several pieces (a chunk may end in the middle of a word), so it is only 
+# collected once the next tag shows where it ends.
+class _PageParser(HTMLParser):
+	def __init__(self):
+		super().__init__()
+		self.items = []
+		self._text = []
+		self._hidden_depth = 0
+
+
+	def _end_text(self):
+		text = ''.join(self._text).strip()
+		if text:
+			self.items.append((TEXT, text))
+		self._text.clear()
+
+
+	def handle_starttag(self, tag, attrs):
+		self._end_text()
+		if tag == 'a':
+			self.items.append((LINK, dict(attrs).get('href')))
+		elif tag in hidden_tags:
+			self._hidden_depth += 1
+
+
+	def handle_endtag(self, tag):
+		self._end_text()
+		if tag in hidden_tags and self._hidden_depth > 0:
+			self._hidden_depth -= 1
+
+
+	def handle_comment(self, data):
+		self._end_text()
+
+
+	def handle_data(self, data):
+		if self._hidden_depth == 0:
+			self._text.append(data)
+
+
+	def close(self):
+		super().close()
+		self._end_text()
+
+
+def _extract_html_parser(source):
+	parser = _PageParser()
+	for chunk in read_chunks(source):
+		parser.feed(chunk)
+		yield from parser.items
+		parser.items.clear()
+	parser.close()
+	yield from parser.items
+
+
+# Text that comes right before the element that was just opened: either the
+# text after its previous sibling, or the text at the start of its parent.
+def _text_before(element):
+	previous = element.getprevious()
+	if previous is not None:
+		return previous.tail
+	parent = element.getparent()
+	if parent is not None:
+		return parent.text
+	return None
+
+
+# Text that comes right before the element that was just closed: either the
+# text after its last child, or all of its text if it has no children.
+def _text_inside(element):
+	if len(element) > 0:
+		return element[-1].tail
+	return element.text
+
+
+def _extract_lxml(source):
+	parser = etree.HTMLPullParser(events=('start', 'end'))
+	hidden_depth = 0
+
+	def events():
+		nonlocal hidden_depth
+		for action, element in parser.read_events():
+			if not isinstance(element.tag, str):
+				continue # Comments and processing instructions
+
+			text = _text_before(element) if action == 'start' \
+			       else _text_inside(element)
+			if text is not None and text.strip() and hidden_depth == 0:
+				yield TEXT, text.strip()
+
+			if action == 'start':
+				if element.tag == 'a':
+					yield LINK, element.get('href')
+				elif element.tag in hidden_tags:
+					hidden_depth += 1
+			else:
+				if element.tag in hidden_tags and hidden_depth > 0:
+					hidden_depth -= 1
+				# Everything inside this element has been yielded, so its
+				# children no longer need to be kept around
+				del element[:]
+
+	for chunk in read_chunks(source):
+		parser.feed(chunk)
+		yield from events()
+	parser.close()
+	yield from events()
+
+
+# Yields (LINK, href) for each <a> element and (TEXT, string) for each piece of
+# visible text in <source>, in the order they appear on the page. <source> can
+# be a string, bytes, or a binary file object (like the response from urlopen),
+# which is read and parsed a chunk at a time. <backend> is either "lxml" or
+# "html.parser"; by default lxml is used if it is installed.
+def extract(source, backend=None):
+	if backend is None:
+		backend = 'html.parser' if etree is None else 'lxml'
+
+	if backend == 'lxml':
+		return _extract_lxml(source)
+	return _extract_html_parser(source)
+
+
+# Returns the href of every <a> element in <source> (None for those without
+# one), in order.
+def extract_links(source, backend=None):
+	return [value for kind, value in extract(source, backend) if kind == LINK]
+
+
+# Returns all the visible text in <source>, separated by spaces.
+def extract_text(source, backend=None):
+	return ' '.join(value for kind, value in extract(source, backend)
+	                if kind == TEXT)
+
+
+class ExtractTests(unittest.TestCase):
+	page = '''<!DOCTYPE html>
+<html><head><title>Dogs &amp; cats</title>
+<style>body { color: red; }</style>
+<script>var ignored = "<a href='/script'>";</script></head>
+<body><!-- a comment -->
+<p>First <b>bold</b> after</p><noscript><p>Enable scripts</p></noscript>
+<a href="/one">One</a> <a name="anchor">No link</a>
+<div>Café <a href="https://example.com/two?a=1&amp;b=2">Two</a> end</div>
+</body></html>'''
+
+
+	def backends(self):
+		return ['html.parser'] + ([] if etree is None else ['lxml'])
+
+
+	# Tests that every hyperlink is found, in order, including <a> elements
+	# without an href
+	def test_links(self):
+		expected = ['/one', None, 'https://example.com/two?a=1&b=2']
+		for backend in self.backends():
+			self.assertEqual(extract_links(self.page, backend), expected)
+
+
+	# Tests that only visible text is kept, in document order
+	def test_text(self):
+		expected = 'Dogs & cats First bold after One No link Café Two end'
+		for backend in self.backends():
+			self.assertEqual(extract_text(self.page, backend), expected)
+
+
+	# Tests that pages split into many small chunks are parsed the same way,
+	# including multi-byte characters split between chunks
+	def test_chunks(self):
+		global chunk_size
+		data = self.page.encode('utf-8')
+		whole = [list(extract(data, backend)) for backend in self.backends()]
+
+		original_size = chunk_size
+		chunk_size = 7
+		try:
+			for backend, expected in zip(self.backends(), whole):
+				stream = io.BytesIO(data)
+				self.assertEqual(list(extract(stream, backend)), expected)
+		finally:
+			chunk_size = original_size
@@ -0,0 +1,557 @@
+import os
+import sys
+import email.message
+import base64
+import hashlib
+import http.client
+import io
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from collections import defaultdict
+from urllib.parse import urlsplit, urlunsplit, urljoin, unquote
+from urllib.request import Request, urlopen, getproxies, proxy_bypass
+from urllib.error import HTTPError, URLError
+
+try:
+	import brotli
+except ImportError:
+	brotli = None # Optional, "br" responses aren't asked for without it
+
+
+# Where cached responses are kept unless told otherwise
+default_cache_directory = 'data/cache'
+
+# How many idle connections are kept open to each host unless told otherwise
+default_pool_size = 4
+
+# How many redirects are followed before giving up, same as urlopen
+max_redirects = 10
+
+# Sent with every request, same as urlopen
+user_agent = 'Python-urllib/%d.%d' % sys.version_info[:2]
+
+# Content encodings the server may compress responses with
+accept_encoding = 'gzip' if brotli is None else 'gzip, br'
+
+
+# Raised in offline mode for a url that was never downloaded.
+class NotCachedError(URLError):
+	def __init__(self, url):
+		super().__init__(f'not in the cache (offline): {url}')
+
+
+# Keeps the body of every downloaded page on disk, along with what is needed
+# to ask the server whether it has changed since (its ETag and Last-Modified
+# headers). Bodies are stored under the SHA-256 of their content, so pages with
+# identical content are only stored once.
+class ResponseCache:
+	def __init__(self, directory):
+		self._directory = directory
+		os.makedirs(os.path.join(directory, 'objects'), exist_ok=True)
+		os.makedirs(os.path.join(directory, 'tmp'), exist_ok=True)
+
+		# Shared between the crawler's download threads
+		self._lock = threading.Lock()
+		path = os.path.join(directory, 'index.db')
+		self._con = sqlite3.connect(path, check_same_thread=False, \
+		                            isolation_level=None)
+		self._con.execute('CREATE TABLE IF NOT EXISTS response('
+		                  'url TEXT PRIMARY KEY, '
+		                  'digest TEXT, '
+		                  'etag TEXT, '
+		                  'last_modified TEXT, '
+		                  'content_type TEXT, '
+		                  'fetched REAL)')
+
+
+	# Returns the path the body with the given <digest> is stored at.
+	def _object_path(self, digest):
+		return os.path.join(self._directory, 'objects', digest[:2], digest)
+
+
+	# Returns (digest, etag, last_modified, content_type) for <url>, or None if
+	# it isn't cached.
+	def lookup(self, url):
+		command = 'SELECT digest, etag, last_modified, content_type ' \
+		          'FROM response WHERE url = ?'
+		with self._lock:
+			entry = self._con.execute(command, (url,)).fetchone()
+		if entry is None or not os.path.isfile(self._object_path(entry[0])):
+			return None
+		return entry
+
+
+	# Opens the cached body for <entry> (as returned by lookup()).
+	def open(self, entry):
+		return open(self._object_path(entry[0]), 'rb')
+
+
+	# Returns a file to write a new body into before it is stored with store().
+	def temporary_file(self):
+		directory = os.path.join(self._directory, 'tmp')
+		return tempfile.NamedTemporaryFile(dir=directory, delete=False)
+
+
+	# Moves the finished temporary file at <path> (whose content hashes to
+	# <digest>) into the cache as the body of <url>, remembering <headers>.
+	def store(self, url, path, digest, headers):
+		destination = self._object_path(digest)
+		os.makedirs(os.path.dirname(destination), exist_ok=True)
+		if os.path.isfile(destination):
+			os.remove(path) # Same content is already stored
+		else:
+			os.replace(path, destination)
+
+		command = 'INSERT OR REPLACE INTO response VALUES(?, ?, ?, ?, ?, ?)'
+		values = (url, digest, headers.get('ETag'),
+		          headers.get('Last-Modified'), headers.get('Content-Type'),
+		          time.time())
+		with self._lock:
+			self._con.execute(command, values)
+
+
+	def close(self):
+		self._con.close()
+
+
+# Copies everything read from a fresh response into the cache, storing it once
+# the whole body has been read.
+class _CacheWriter:
+	def __init__(self, cache, url, headers):
+		self._cache = cache
+		self._url = url
+		self._headers = headers
+		self._file = cache.temporary_file()
+		self._hash = hashlib.sha256()
+
+
+	def write(self, data):
+		self._file.write(data)
+		self._hash.update(data)
+
+
+	def finish(self):
+		self._file.close()
+		digest = self._hash.hexdigest()
+		self._cache.store(self._url, self._file.name, digest, self._headers)
+
+
+	# The body wasn't read to the end, so it can't be stored.
+	def discard(self):
+		self._file.close()
+		os.remove(self._file.name)
+
+
+# Keeps connections to each host open between requests (HTTP keep-alive), so
+# downloading many pages from one host only connects to it once. Up to <size>
+# idle connections are kept for each host.
+#
+# Connections go through a proxy like urlopen's do: the one given for the
+# scheme by the http_proxy and https_proxy environment variables (or the
+# system's settings), unless the host is one no_proxy says to reach directly.
+# Pages are asked for from an http proxy by their full url, and https pages
+# through a tunnel the proxy opens to the host.
+class ConnectionPool:
+	def __init__(self, timeout, size=default_pool_size):
+		self.timeout = timeout
+		self.size = size
+		self.opened = 0
+		self.requests = 0
+		self.reused = 0
+		self._idle = defaultdict(list)
+		self._lock = threading.Lock()
+
+
+	# Returns an idle connection to <key> (a (scheme, host, proxy) tuple, as
+	# returned by Fetcher._key()), or None if there aren't any.
+	def acquire(self, key):
+		with self._lock:
+			if self._idle[key]:
+				return self._idle[key].pop()
+		return None
+
+
+	# Returns a new connection to <key>, which isn't counted as opened until a
+	# request over it is answered.
+	def connect(self, key):
+		scheme, host, proxy = key
+		if proxy is None:
+			if scheme == 'https':
+				return http.client.HTTPSConnection(host, timeout=self.timeout)
+			return http.client.HTTPConnection(host, timeout=self.timeout)
+
+		proxy_host, authorization = proxy
+		if scheme == 'https':
+			connection = http.client.HTTPSConnection(proxy_host, \
+			                                         timeout=self.timeout)
+			headers = {}
+			if authorization is not None:
+				headers['Proxy-Authorization'] = authorization
+			connection.set_tunnel(host, headers=headers)
+			return connection
+		return http.client.HTTPConnection(proxy_host, timeout=self.timeout)
+
+
+	# Puts <connection> (whose last response has been read to the end) back
+	# into the pool, or closes it if the pool for <key> is already full.
+	def release(self, key, connection):
+		with self._lock:
+			if len(self._idle[key]) < self.size:
+				self._idle[key].append(connection)
+				return
+		connection.close()
+
+
+	# Counts a request that was answered, <reused> being whether it went over a
+	# connection that was already open (if not, the connection is counted as
+	# opened).
+	def record(self, reused):
+		with self._lock:
+			self.requests += 1
+			self.reused += reused
+			self.opened += not reused
+
+
+	def close(self):
+		with self._lock:
+			for connections in self._idle.values():
+				for connection in connections:
+					connection.close()
+			self._idle.clear()
+
+
+# Decompresses a "br" body with the same methods as zlib's decompress objects.
+class _BrotliDecoder:
+	def __init__(self):
+		self._decompressor = brotli.Decompressor()
+
+
+	def decompress(self, data):
+		return self._decompressor.process(data)
+
+
+	def flush(self):
+		return b''
+
+
+# Reads the body of a response from a pooled connection, decompressing it if
+# the server compressed it. Once the body has been read to the end, the
+# connection goes back into the pool for the next request to that host.
+class _PooledBody:
+	def __init__(self, pool, key, connection, response):
+		self.headers = response.headers
+		self.status = response.status
+		self.reason = response.reason
+		self._pool = pool
+		self._key = key
+		self._connection = connection
+		self._response = response
+		self._buffer = b''
+
+		encoding = response.headers.get('Content-Encoding', 'identity')
+		encoding = encoding.strip().lower()
+		if encoding in ('gzip', 'x-gzip'):
+			self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+		elif encoding == 'br' and brotli is not None:
+			self._decoder = _BrotliDecoder()
+		elif encoding == 'identity':
+			self._decoder = None
+		else:
+			self.close()
+			raise URLError(f'unsupported content encoding "{encoding}"')
+
+
+	# Reads and decodes more of the body into the buffer, returning False once
+	# there is nothing left.
+	def _fill(self):
+		if self._response is None:
+			return False
+
+		data = self._response.read(64 * 1024)
+		# The response may close right after the read that reached the end of
+		# the body, so the decoder is flushed as soon as either shows it ended
+		done = len(data) == 0 or self._response.isclosed()
+		if self._decoder is not None:
+			data = self._decoder.decompress(data)
+			if done:
+				data += self._decoder.flush()
+		self._buffer += data
+		if done:
+			self._finish()
+		return True
+
+
+	# The whole body has been read, so the connection can be used again
+	# (unless the server said it will close it).
+	def _finish(self):
+		if self._response.will_close:
+			self._connection.close()
+		else:
+			self._pool.release(self._key, self._connection)
+		self._response = None
+
+
+	def read(self, size=-1):
+		if size is None or size < 0:
+			while self._fill():
+				pass
+		else:
+			while len(self._buffer) < size and self._fill():
+				pass
+			if len(self._buffer) > size:
+				data, self._buffer = self._buffer[:size], self._buffer[size:]
+				return data
+
+		data, self._buffer = self._buffer, b''
+		return data
+
+
+	# Closing before the end of the body leaves the rest of it unread on the
+	# connection, so the connection can't be used again.
+	def close(self):
+		if self._response is not None:
+			self._response.close()
+			self._connection.close()
+			self._response = None
+
+
+	def __enter__(self):
+		return self
+
+
+	def __exit__(self, *args):
+		self.close()
+
+
+# A downloaded (or cached) page, read like the file object urlopen returns.
+#   <not_modified>: True if the body came from the cache because the server
+#       said the page hasn't changed since it was cached (or because the
+#       fetcher is offline)
+class Response:
+	def __init__(self, url, stream, headers, not_modified, writer=None):
+		self.url = url
+		self.headers = headers
+		self.not_modified = not_modified
+		self._stream = stream
+		self._writer = writer
+
+
+	def read(self, size=-1):
+		data = self._stream.read(size)
+		if self._writer is not None:
+			self._writer.write(data)
+			if size is None or size < 0 or len(data) == 0:
+				# Reached the end of the body
+				self._writer.finish()
+				self._writer = None
+		return data
+
+
+	def close(self):
+		if self._writer is not None:
+			self._writer.discard()
+			self._writer = None
+		self._stream.close()
+
+
+	def __enter__(self):
+		return self
+
+
+	def __exit__(self, *args):
+		self.close()
+
+
+# Downloads pages for the crawler and indexer, keeping connections open so
+# pages from the same host don't each need a new connection (and TLS
+# handshake).
+#   <timeout>: how long to wait for a server before giving up, in seconds
+#   <cache>: optional ResponseCache; pages in it are only downloaded again if
+#       the server says they have changed
+#   <offline>: if True, pages are only ever read from <cache>
+#   <pool_size>: how many idle connections to keep open to each host
+class Fetcher:
+	def __init__(self, timeout, cache=None, offline=False, \
+	             pool_size=default_pool_size):
+		assert cache is not None or not offline
+
+		self.timeout = timeout
+		self.cache = cache
+		self.offline = offline
+		self.pool = ConnectionPool(timeout, pool_size)
+		self.proxies = getproxies()
+
+
+	# Returns the key of the pool's connections for <parts> (a split url):
+	# (scheme, host, proxy), where proxy is None if the host is reached
+	# directly, or else (proxy host, Proxy-Authorization header or None).
+	def _key(self, parts):
+		proxy = self.proxies.get(parts.scheme)
+		if proxy is None or proxy_bypass(parts.netloc):
+			return (parts.scheme, parts.netloc, None)
+
+		if '//' not in proxy:
+			proxy = 'http://' + proxy # Given as just "host:port"
+		proxy = urlsplit(proxy)
+		authorization = None
+		if proxy.username is not None:
+			credentials = f'{unquote(proxy.username)}:' + \
+			              unquote(proxy.password or '')
+			credentials = base64.b64encode(credentials.encode('utf-8'))
+			authorization = 'Basic ' + credentials.decode('ascii')
+		proxy_host = proxy.netloc.rpartition('@')[2]
+		return (parts.scheme, parts.netloc, (proxy_host, authorization))
+
+
+	# Sends one request for <url> and returns its _PooledBody, reusing an idle
+	# connection to the host if there is one.
+	def _send(self, method, url, headers):
+		parts = urlsplit(url)
+		key = self._key(parts)
+		path = parts.path or '/'
+		if parts.query:
+			path += '?' + parts.query
+		headers = dict(headers)
+		headers.setdefault('Host', parts.netloc)
+		headers.setdefault('User-Agent', user_agent)
+		headers.setdefault('Accept-Encoding', accept_encoding)
+
+		proxy = key[2]
+		if proxy is not None and parts.scheme == 'http':
+			# An http proxy is asked for the full url instead
+			path = urlunsplit((parts.scheme, parts.netloc, path, '', ''))
+			if proxy[1] is not None:
+				headers.setdefault('Proxy-Authorization', proxy[1])
+
+		connection = self.pool.acquire(key)
+		while True:
+			reused = connection is not None
+			if not reused:
+				connection = self.pool.connect(key)
+			try:
+				connection.request(method, path, headers=headers)
+				response = connection.getresponse()
+			except (ConnectionError, http.client.BadStatusLine) as ex:
+				connection.close()
+				if reused:
+					# The server closed the connection while it was idle, so
+					# try again with a new one
+					connection = None
+					continue
+				raise URLError(ex)
+			except OSError as ex:
+				connection.close()
+				raise URLError(ex)
+			except http.client.HTTPException:
+				connection.close()
+				raise
+
+			self.pool.record(reused)
+			return _PooledBody(self.pool, key, connection, response)
+
+
+	# Requests <url>, following redirects, and returns the body to read the 
+	# response from (with its headers as .headers). Raises HTTPError for any
+	# response other than a successful one, like urlopen does.
+	def _request(self, method, url, headers):
+		if urlsplit(url).scheme not in ('http', 'https'):
+			# Anything else (file:, data:, ...) is left to urlopen
+			request = Request(url, method=method, headers=headers)
+			return urlopen(request, timeout=self.timeout)
+
+		for _ in range(max_redirects + 1):
+			body = self._send(method, url, headers)
+			location = body.headers.get('Location')
+			if body.status in (301, 302, 303, 307, 308) and location:
+				body.read() # Nothing needed from it, frees the connection
+				url = urljoin(url, location)
+				if urlsplit(url).scheme not in ('http', 'https'):
+					raise HTTPError(url, body.status, 'redirect to an '
+					                'unsupported scheme', body.headers, None)
+				if body.status == 303 and method != 'HEAD':
+					method = 'GET'
+				continue
+
+			if not 200 <= body.status < 300:
+				content = io.BytesIO(body.read())
+				raise HTTPError(url, body.status, body.reason, body.headers, \
+				                content)
+			return body
+
+		raise HTTPError(url, body.status, 'too many redirects', body.headers, \
+		                None)
+
+
+	# Returns a Response for the page at <url>. Raises an exception (like
+	# urlopen does) if the page cannot be reached.
+	def open(self, url):
+		entry = None if self.cache is None else self.cache.lookup(url)
+		if self.offline:
+			if entry is None:
+				raise NotCachedError(url)
+			return self._cached(url, entry)
+
+		headers = {}
+		if entry is not None:
+			digest, etag, last_modified, content_type = entry
+			if etag is not None:
+				headers['If-None-Match'] = etag
+			if last_modified is not None:
+				headers['If-Modified-Since'] = last_modified
+
+		try:
+			response = self._request('GET', url, headers)
+		except HTTPError as ex:
+			if ex.code == 304 and entry is not None:
+				return self._cached(url, entry)
+			raise
+
+		writer = None
+		if self.cache is not None:
+			writer = _CacheWriter(self.cache, url, response.headers)
+		return Response(url, response, response.headers, False, writer)
+
+
+	def _cached(self, url, entry):
+		headers = email.message.Message()
+		if entry[3] is not None:
+			headers['Content-Type'] = entry[3]
+		return Response(url, self.cache.open(entry), headers, True)
+
+
+	# Returns True if the page at <url> exists. A HEAD request is tried first
+	# since it doesn't download the body; some servers refuse those, so it
+	# falls back on asking for just the first byte of the page. Offline, only
+	# cached pages exist.
+	def ping(self, url):
+		if self.offline:
+			return self.cache.lookup(url) is not None
+
+		try:
+			with self._request('HEAD', url, {}) as response:
+				response.read() # Frees the connection for the next request
+				return True
+		except HTTPError as ex:
+			if ex.code in (404, 410):
+				return False # Definitely gone, no need to ask again
+
+		with self._request('GET', url, {'Range': 'bytes=0-0'}) as response:
+			response.read()
+			return True
+
+
+	# Returns a description of how many connections were opened and how often
+	# they were reused.
+	def stats(self):
+		message =  f'Connections: {self.pool.opened} opened for '
+		message += f'{self.pool.requests} requests ({self.pool.reused} reused)'
+		return message
+
+
+	def close(self):
+		self.pool.close()
+		if self.cache is not None:
+			self.cache.close()
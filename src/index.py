@@ -7,46 +7,149 @@ import math
 import socket 
 import os 
 import io 
-import urllib 
-from bs4 import BeautifulSoup
-from urllib.request import Request, urlopen
+import itertools
+import heapq 
+import bisect 
+import array 
+import socketserver 
+import signal 
+import importlib.util 
+import hashlib 
 from colorama import Fore, Style
-from collections import defaultdict
-import unittest 
-import unittest.mock 
-from parameterized import parameterized 
+from collections import defaultdict, deque
 
-import nltk 
-from nltk.stem import PorterStemmer
-nltk.download('stopwords', quiet=True) 
-from nltk.corpus import stopwords
+from fetch import Fetcher, ResponseCache, default_cache_directory, \
+                  default_pool_size 
+import stopwords 
+from cache import StemCache, ResultCache, PostingCache, \
+                  default_result_cache_size, default_result_ttl, \
+                  default_posting_cache_bytes 
 
-import hashlib
-def stem_to_int(stem): 
-	return int(hashlib.sha1(bytes(stem, 'utf-8')).hexdigest(), 16) % 1000000000
+# Only some ways of running index.py need these, and importing them takes 
+# longer than everything else together, so they are imported where used: 
+#   nltk: load_stemmer(), for indexing and queries 
+#   numpy: score_numpy(), optional and only for --scorer numpy 
+#   extract: scrape_text(), only for indexing 
+have_numpy = importlib.util.find_spec('numpy') is not None 
 
 
 default_database_file = 'data/table.db' 
 null_database_file = 'data/null.db' 
 
+# How many websites --batch writes at once if no amount is given 
+default_batch_size = 100 
+
+# Version of the tables this file reads and writes, kept in the database's 
+# user_version. Databases written by older versions are upgraded with 
+# migrate.py. 
+schema_version = 8 
+
+# Websites are deleted by only marking them deleted (see tombstone_create_table)
+# until this share of the websites indexed is deleted, when the index is 
+# compacted 
+default_compact_ratio = 0.1 
+
+# How queries are scored unless told otherwise (both give the same ranking) 
+default_scorer = 'numpy' if have_numpy else 'python' 
+
+# How websites are ranked unless told otherwise, and the parameters of BM25 
+# unless told otherwise 
+default_ranker = 'tfidf' 
+default_k1 = 1.2 
+default_b = 0.75 
+
 usage = f'''\
 Usage: 
-    python3 index.py {{-w <website> | -q <query> | -d <document>}} [-t <timeout] 
-        [-b <database>] [--verbose]
+    python3 index.py {{-w <website> | -q <query> | -d <document> | --serve | 
+        --delete <website> | --compact}} [-t <timeout] 
+        [-b <database>] [--cache <directory>] [--offline] 
+        [--pool-size <connections>] [--batch <documents>] 
+        [--scorer <scorer>] [-k <count>] [--ranker <ranker>] [--k1 <k1>] 
+        [--b <b>] [--socket <path>] [--stem-cache <file>] 
+        [--workers <processes>] [--segment <segment>] 
+        [--result-cache <results>] [--result-ttl <seconds>] 
+        [--persist-results] [--posting-cache <megabytes>] [--update] 
+        [--shards <shards>] [--verbose]
 
 Options: 
     <website>: (string) Name of a website or file containing a line-separated
         list of names of websites. Indexes content of site(s) into the database.
     <query>: (string) Query written in plain English. Yields a string
         representing a semicolon-separated list of website indices, relative to
-        the database. 
+        the database. Websites need only contain one of its words, but 
+        "<words>" in quotes must be in a website as written, words joined by 
+        AND must all be in it, and a word after NOT or - must not be. 
     <document>: (string) For debugging purposes, a document to be indexed
         directly instead of a website pointing to a document. 
+    delete: Deletes the website(s) given as with -w from the database, or 
+        the document given as with -d. 
+        Their postings are removed once {default_compact_ratio:.0%} of the 
+        websites have been deleted. 
+    compact: Removes the postings of every website deleted from the 
+        database, and brings the bounds of stems back down after updates. 
+    serve: Keeps running and answers queries read from stdin, one JSON 
+        object per line such as {{"query": "dogs", "k": 5}}, with a line 
+        {{"websites": [[<id>, <url>, <score>], ...]}} on stdout. Much faster 
+        than starting index.py for every query. 
+    <path>: (string) With serve, answers the queries of programs connecting
+        to the Unix socket <path> instead of stdin (see driver.py). 
+    <file>: (string) Keep the stem of every word seen in this file between
+        runs, so that words are not stemmed again. Words are always only 
+        stemmed once per run. 
     <timeout>: (positive float) How long to wait for a response from a server 
         before exiting. Default is 5 seconds. 
     <database>: (string) File to read/write database information. Default is 
         "{default_database_file}". If "null", saves to "{null_database_file}" 
         and deletes after.
+    <directory>: (string) Keep every downloaded website in this directory
+        and only download it again if it has changed. Usually 
+        "{default_cache_directory}".
+    offline: Only reads websites from the cache directory (default is
+        "{default_cache_directory}"), never from the network.
+    <connections>: (positive integer) How many idle connections to keep open
+        to each server between websites. Default is {default_pool_size}.
+    <documents>: (positive integer) Write websites into the database this 
+        many at a time, which is much faster for long lists of websites. 
+        Usually {default_batch_size}. 
+    <processes>: (positive integer) With a file of websites, turn their text
+        into stems in this many processes at once, usually one per core. 
+        Websites are written in batches (of {default_batch_size} unless 
+        given). With a query of shards, answer it in this many threads. 
+    <scorer>: (string) How to score websites for a query: "python", or 
+        "numpy" which is faster for large databases but needs NumPy. Both 
+        give the same ranking. Default is "{default_scorer}".
+    <count>: (positive integer) Only yields the best <count> websites for a
+        query, which skips most of the websites matching common words.
+    <ranker>: (string) How to rank websites for a query: "tfidf" (by 
+        tf/m * idf), or "bm25" (Okapi BM25). Default is "{default_ranker}".
+    <k1>: (non-negative float) How quickly repeats of a word stop counting 
+        towards a website's rank with bm25. Default is {default_k1}.
+    <b>: (float from 0 to 1) How much long websites are held back with bm25.
+        Default is {default_b}.
+    <segment>: (string) With a query or serve, answers from this segment 
+        (written from the database by segment.py) instead of the database, 
+        which is faster and opens at once. 
+    <results>: (non-negative integer) With serve, remember the websites 
+        found for this many queries, answering a query asked again at once 
+        until websites are added. 0 turns this off. 
+        Default is {default_result_cache_size}. 
+    <seconds>: (positive float) Remember results for at most this long. 
+        Default is {default_result_ttl}. 
+    persist-results: With a query or serve, keep remembered results in the 
+        database too, for later runs. 
+    <megabytes>: (non-negative number) With serve, keep the postings of 
+        the stems queried most often in this much memory, so that queries 
+        sharing stems read them once. 0 turns this off. 
+        Default is {default_posting_cache_bytes // 2 ** 20}. 
+    update: With a website or document, index again websites that were 
+        already indexed, writing only the postings that changed (websites 
+        whose text is the same are skipped). Cannot be used with a batch. 
+    <shards>: (positive integer) Split the database into this many files 
+        (<database> with -0, -1 ... before its extension), each website 
+        written into one of them by a hash of its name, and answer queries 
+        from all of them at once in as many threads (or <processes>). The 
+        same number must be given every time. Websites are written in 
+        batches, and shards cannot be served or updated. 
     verbose: Prints extra debug information to stdout.
 '''
 
@@ -69,80 +172,477 @@ def eprint(*args, **kwargs):
 		print(Style.RESET_ALL, end='', flush=True) 
 
 
+# <m> is the frequency of the website's most frequent stem and <length> how 
+# many stems it has, counting repeats. <hash> is content_hash() of its text, 
+# or NULL if it was indexed before hashes were kept. 
 def website_create_table(cur): 
 	command = 'CREATE TABLE IF NOT EXISTS website(' \
 	          'id INTEGER PRIMARY KEY, '            \
 			  'url TEXT UNIQUE, '                   \
 			  'm INTEGER, '                         \
-			  'data TEXT)'
+			  'data TEXT, '                         \
+			  'length INTEGER, '                    \
+			  'hash TEXT)'
+	cur.execute(command) 
+
+
+# Returns what is kept of <text> to tell whether it changed. 
+def content_hash(text): 
+	return hashlib.sha1(text.encode('utf-8')).hexdigest() 
+
+
+# The ids of deleted websites whose postings are still in the posting table. 
+# Deleting a website removes its row from the website table, which is all 
+# queries read it through, and takes it out of the df of its stems and the 
+# totals right away, but only records it here instead of removing its 
+# postings. The tombstone just hides those rows until compact() removes them 
+# later, all at once. 
+def tombstone_create_table(cur): 
+	command = 'CREATE TABLE IF NOT EXISTS tombstone(id INTEGER PRIMARY KEY)' 
 	cur.execute(command) 
 
 
+# Returns the (m, data, length) columns of the website row for <stems> (as 
+# returned by get_stem_dict). 
+def website_columns(stems): 
+	m = max(stems.values()) 
+	data = ','.join(key + ':' + str(value) for key, value in stems.items())
+	return m, data, sum(stems.values()) 
+
+
+# Returns the id the next website inserted should get. Ids are handed out in 
+# order, so it is the one after the largest (found from the end of the 
+# primary key without counting every row), including those of deleted 
+# websites whose postings are still kept. 
+def website_next_id(cur): 
+	command =  'SELECT MAX(COALESCE((SELECT MAX(id) FROM website), -1), ' 
+	command += 'COALESCE((SELECT MAX(id) FROM tombstone), -1)) + 1' 
+	return cur.execute(command).fetchone()[0] 
+
+
 # Inserts the website into the database and returns the primary key it was 
 # assigned (or None if this website already existed in the table) 
-def website_insert(cur, url, stems):
+def website_insert(cur, url, stems, text_hash=None):
 	# If this url already exists in the table, exit. 
-	command = f'SELECT id FROM website WHERE url = "{url}"'
-	existing_id = cur.execute(command).fetchone()  
-	already_exists = cur.execute(command).fetchone() != None 
-	if already_exists:
+	if website_exists(cur, url): 
 		return None 
-		
-	size = cur.execute('SELECT COUNT(*) FROM website').fetchone()[0]
-	m = max(stems.values()) 
-	data = ','.join(key + ':' + str(value) for key, value in stems.items())
 	
-	command = f'INSERT INTO website VALUES({size}, "{url}", {m}, "{data}")'
-	cur.execute(command) 
-	return size 
+	website_id = website_next_id(cur) 
+	columns = website_columns(stems) 
+	command = 'INSERT INTO website VALUES(?, ?, ?, ?, ?, ?)' 
+	cur.execute(command, (website_id, url, *columns, text_hash)) 
+	statistic_add(cur, 'websites', 1) 
+	statistic_add(cur, 'length', columns[2]) 
+	statistic_add(cur, 'generation', 1) 
+	return website_id 
+	
+
+# Returns True if a website with the given <url> was already indexed. 
+def website_exists(cur, url): 
+	command = 'SELECT 1 FROM website WHERE url = ?' 
+	return cur.execute(command, (url,)).fetchone() is not None 
+
+
+# Returns {stem: frequency} from the data column of a website's row. 
+def website_stems(data): 
+	stems = {} 
+	for item in data.split(','): 
+		stem, frequency = item.split(':') 
+		stems[stem] = int(frequency) 
+	return stems 
+
+
+# Deletes the website <url>, returning False if it wasn't indexed. Its stems 
+# stop counting towards their df at once, but its postings are only removed 
+# by compact(). 
+def website_delete(cur, url): 
+	command = 'SELECT id, data, length FROM website WHERE url = ?' 
+	row = cur.execute(command, (url,)).fetchone() 
+	if row is None: 
+		return False 
 	
+	website_id, data, length = row 
+	cur.execute('DELETE FROM website WHERE id = ?', (website_id,)) 
+	cur.execute('INSERT INTO tombstone VALUES(?)', (website_id,)) 
+	token_remove(cur, Lexicon(cur).ids(website_stems(data))) 
+	statistic_add(cur, 'websites', -1) 
+	statistic_add(cur, 'length', -length) 
+	statistic_add(cur, 'generation', 1) 
+	return True 
+
+
+# Returns True once enough websites are deleted (see default_compact_ratio) 
+# that their postings should be removed with compact(). 
+def compaction_due(cur, ratio=default_compact_ratio): 
+	tombstones = cur.execute('SELECT COUNT(*) FROM tombstone').fetchone()[0] 
+	websites = statistic_get(cur, 'websites') 
+	return tombstones > 0 and tombstones >= ratio * websites 
+
+
+# Removes the postings of every deleted website, and works the token table 
+# out again from the postings left, which also brings back down the bounds 
+# of stems that websites changed by update_document no longer need. Reads the
+# whole posting table, so it is only done once in a while. 
+def compact(cur): 
+	cur.execute('DELETE FROM posting WHERE doc IN (SELECT id FROM tombstone)') 
+	cur.execute('DELETE FROM token') 
+	cur.execute('INSERT INTO token ' 
+	            'SELECT posting.stem, COUNT(*), ' 
+	            'MAX(CAST(posting.tf AS REAL) / website.m) ' 
+	            'FROM posting JOIN website ON website.id = posting.doc ' 
+	            'GROUP BY posting.stem') 
+	cur.execute('DELETE FROM tombstone') 
+	statistic_add(cur, 'generation', 1) 
+
 
+# The integer each stem is stored as in the token and posting tables. 
+def lexicon_create_table(cur): 
+	command = 'CREATE TABLE IF NOT EXISTS lexicon(' 
+	command +=  'id INTEGER PRIMARY KEY, ' 
+	command +=  'stem TEXT UNIQUE)' 
+	cur.execute(command) 
+
+
+# One row per stem, with the number of websites it appears in (its document 
+# frequency) and the largest tf/m it has in any of them, which bounds how much
+# it can add to a website's score. 
 def token_create_table(cur): 
 	command = 'CREATE TABLE IF NOT EXISTS token('
 	command +=  'stem INTEGER PRIMARY KEY, '
-	command +=  'doc TEXT)' # TODO: see if BLOB is better
+	command +=  'df INTEGER, '
+	command +=  'bound REAL)'
 	cur.execute(command) 
-	
 
-def token_insert(cur, stem, website_id): 
-	stem = stem_to_int(stem) 
-	command = f'SELECT doc FROM token WHERE stem = {stem}'
-	doc = cur.execute(command).fetchone()
+
+# One row per stem per website it appears in, with how many times it appears 
+# there and where (as encode_positions stores them, or NULL for websites 
+# indexed before positions were kept). Rows are stored in order of stem (then 
+# website), so all the websites for one stem are read from one place. 
+def posting_create_table(cur): 
+	command = 'CREATE TABLE IF NOT EXISTS posting('
+	command +=  'stem INTEGER, '
+	command +=  'doc INTEGER, '
+	command +=  'tf INTEGER, '
+	command +=  'positions BLOB, '
+	command +=  'PRIMARY KEY (stem, doc)) WITHOUT ROWID'
+	cur.execute(command) 
+
+
+# Totals about the whole index that would otherwise have to be counted every 
+# time they are needed, kept up to date as websites are added: 
+#   websites: how many websites are indexed (N) 
+#   length: the sum of the lengths of all websites indexed 
+#   generation: goes up whenever websites are added, so that results of 
+#       queries cached before (see cache.ResultCache) are no longer used 
+def statistic_create_table(cur): 
+	command = 'CREATE TABLE IF NOT EXISTS statistic(' 
+	command +=  'name TEXT PRIMARY KEY, ' 
+	command +=  'value INTEGER)' 
+	cur.execute(command) 
+
+
+# Adds <amount> to the statistic <name>. 
+def statistic_add(cur, name, amount): 
+	command = 'INSERT INTO statistic VALUES(?, ?) ' 
+	command += 'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value'
+	cur.execute(command, (name, amount)) 
+
+
+# Returns the value of the statistic <name> (0 if it was never set). 
+def statistic_get(cur, name): 
+	command = 'SELECT value FROM statistic WHERE name = ?' 
+	row = cur.execute(command, (name,)).fetchone() 
+	return 0 if row is None else row[0] 
+
+
+# Creates any of the tables that don't exist yet. 
+def create_tables(cur): 
+	website_create_table(cur) 
+	lexicon_create_table(cur) 
+	token_create_table(cur) 
+	posting_create_table(cur) 
+	statistic_create_table(cur) 
+	tombstone_create_table(cur) 
+	cur.execute(f'PRAGMA user_version = {schema_version}') 
+
+
+# Exits with an error message if the database behind <cur> was written by a 
+# different version of this file. 
+def check_schema(cur, database_name): 
+	version = cur.execute('PRAGMA user_version').fetchone()[0] 
+	command = 'SELECT COUNT(*) FROM sqlite_master WHERE type = "table"' 
+	if version == schema_version or cur.execute(command).fetchone()[0] == 0: 
+		return 
 	
-	if doc is None: 
-		# The stem has not yet been added to the table, so we can be the first 
-		# addition 
-		# TODO: 'replace' should not be necessary here, so why is it?
-		command = 'INSERT OR REPLACE INTO token VALUES(' 
-		command += f'{stem}, "{website_id}")'  
+	if version < schema_version: 
+		message =  f'Error: "{database_name}" was written by an older version '
+		message += 'of index.py. Upgrade it first with:\n'
+		message += f'    python3 migrate.py "{database_name}"' 
 	else: 
-		# The stem has been added before, so append our website_id to the end 
-		text = doc[0] + ';' + str(website_id) 
-		command = f'UPDATE token SET doc = "{text}" WHERE stem = "{stem}"'
+		message =  f'Error: "{database_name}" was written by a newer version '
+		message += 'of index.py' 
+	eprint(message) 
+	sys.exit(1) 
+
+
+# Numbers stems 1, 2, 3 ... in the order they are first indexed, keeping the 
+# numbers in the lexicon table. Every stem looked up is remembered, so each is
+# read from the table at most once; load() reads them all at once instead, 
+# for when most will be looked up. 
+class Lexicon: 
+	def __init__(self, cur): 
+		self._cur = cur 
+		self._ids = {} 
+	
+	
+	def load(self): 
+		self._ids = dict(self._cur.execute('SELECT stem, id FROM lexicon')) 
+	
+	
+	# Returns the number of <stem>, or None if it was never indexed. 
+	def find(self, stem): 
+		stem_id = self._ids.get(stem) 
+		if stem_id is None: 
+			command = 'SELECT id FROM lexicon WHERE stem = ?' 
+			row = self._cur.execute(command, (stem,)).fetchone() 
+			if row is None: 
+				return None 
+			stem_id = self._ids[stem] = row[0] 
+		return stem_id 
+	
+	
+	# Returns the number of <stem>, giving it the next one if it was never 
+	# indexed. 
+	def add(self, stem): 
+		stem_id = self.find(stem) 
+		if stem_id is None: 
+			command = 'INSERT INTO lexicon(stem) VALUES(?)' 
+			stem_id = self._cur.execute(command, (stem,)).lastrowid 
+			self._ids[stem] = stem_id 
+		return stem_id 
+	
+	
+	# Returns the numbers of those of <stems> that were indexed, in order. 
+	def ids(self, stems): 
+		stem_ids = (self.find(stem) for stem in stems) 
+		return sorted(set(x for x in stem_ids if x is not None)) 
+	
+	
+	def __len__(self): 
+		return len(self._ids) 
+
+
+# Returns {stem id: frequency} for <stems> (as returned by get_stem_dict), 
+# numbering new stems in <lexicon>. 
+def stem_ids(stems, lexicon): 
+	return {lexicon.add(stem): frequency for stem, frequency in stems.items()}
+
+
+# Appends <value> (a non-negative integer) to <out> as a varint: 7 bits per 
+# byte, lowest first, with the top bit set on every byte but the last. 
+def encode_varint(value, out): 
+	while value >= 0x80: 
+		out.append(value & 0x7f | 0x80) 
+		value >>= 7 
+	out.append(value) 
+
+
+# Yields the integers encoded one after another in <data>, decoding each only 
+# when it is asked for. 
+def iterate_varints(data): 
+	value = shift = 0 
+	for byte in data: 
+		value |= (byte & 0x7f) << shift 
+		if byte < 0x80: 
+			yield value 
+			value = shift = 0 
+		else: 
+			shift += 7 
+
+
+# Returns the list of integers encoded one after another in <data>. 
+def decode_varints(data): 
+	return list(iterate_varints(data)) 
+
+
+# Returns <positions> (where a stem is found in a website, in order) as the 
+# posting table stores them: how far each is from the one before (the first 
+# from 0), as varints, so that most take one byte. 
+def encode_positions(positions): 
+	data = bytearray() 
+	previous = 0 
+	for position in positions: 
+		encode_varint(position - previous, data) 
+		previous = position 
+	return bytes(data) 
+
+
+# Returns the positions encode_positions stored in <data> (none if it is None).
+def decode_positions(data): 
+	if data is None: 
+		return [] 
+	return list(itertools.accumulate(iterate_varints(data))) 
+
+
+# Records that the stem <stem_id> appears <tf> times in the website 
+# <website_id>, whose most frequent stem appears <m> times, at <positions> if 
+# they are known. 
+def token_insert(cur, stem_id, website_id, tf, m, positions=None): 
+	command = 'INSERT INTO posting VALUES(?, ?, ?, ?)' 
+	data = None if positions is None else encode_positions(positions) 
+	cur.execute(command, (stem_id, website_id, tf, data)) 
+	command = 'INSERT INTO token VALUES(?, 1, ?) ' 
+	command += 'ON CONFLICT(stem) DO UPDATE SET df = df + 1, ' 
+	command += 'bound = MAX(bound, excluded.bound)' 
+	cur.execute(command, (stem_id, tf / m)) 
+
+
+# Records that the stems <stem_ids> are in one website fewer, forgetting those 
+# in no website at all. 
+def token_remove(cur, stem_ids): 
+	parameters = [(x,) for x in stem_ids] 
+	cur.executemany('UPDATE token SET df = df - 1 WHERE stem = ?', parameters) 
+	cur.executemany('DELETE FROM token WHERE stem = ? AND df = 0', parameters) 
+
+
+# Sets the connection up for writing many websites at once: the write-ahead 
+# log lets each transaction be written sequentially, and with it, syncing to 
+# disk once per checkpoint instead of once per transaction is still safe 
+# against corruption. 
+def tune_for_ingest(con): 
+	con.commit() # Neither can be changed inside a transaction 
+	con.execute('PRAGMA journal_mode = WAL') 
+	con.execute('PRAGMA synchronous = NORMAL') 
+
+
+# Indexes websites a batch at a time. Instead of reading and rewriting a 
+# stem's row in the token table once per website it appears in (which gets 
+# slower as its list of websites grows), the postings of the whole batch are 
+# gathered in memory and written with one statement per table, in a single
+# transaction. 
+class BulkIndexer: 
+	def __init__(self, con, batch_size=default_batch_size): 
+		self._con = con 
+		self._batch_size = batch_size 
+		tune_for_ingest(con) 
+		
+		cur = con.cursor() 
+		create_tables(cur) 
+		self._next_id = website_next_id(cur) 
+		self._lexicon = Lexicon(cur) 
+		self._lexicon.load() 
+		
+		self._websites = [] 
+		self._urls = set() 
+		self._postings = [] 
+		self._df = defaultdict(lambda: 0) 
+		self._bound = defaultdict(lambda: 0.0) 
+	
+	
+	# Returns True if <url> was already indexed, or will be once the current 
+	# batch is written. 
+	def __contains__(self, url): 
+		if url in self._urls: 
+			return True 
+		return website_exists(self._con.cursor(), url) 
+	
+	
+	# Adds the website <url>, made up of <stems> (as returned by 
+	# get_stem_dict, with <positions> if it was given them) and whose text has 
+	# the content_hash() <text_hash>, to the batch, writing the batch out once
+	# it is full. Returns the id the website was given, or None if it was 
+	# already indexed. 
+	def add(self, url, stems, positions=None, text_hash=None): 
+		if url in self: 
+			return None 
+		
+		website_id = self._next_id 
+		self._next_id += 1 
+		columns = website_columns(stems) 
+		self._websites.append((website_id, url, *columns, text_hash)) 
+		self._urls.add(url) 
+		for stem, tf in stems.items(): 
+			stem_id = self._lexicon.add(stem) 
+			data = None if positions is None else \
+			       encode_positions(positions[stem]) 
+			self._postings.append((stem_id, website_id, tf, data)) 
+			self._df[stem_id] += 1 
+			self._bound[stem_id] = max(self._bound[stem_id], tf / columns[0])
+		
+		if len(self._websites) >= self._batch_size: 
+			self.flush() 
+		return website_id 
+	
+	
+	# Writes every website in the batch to the database. 
+	def flush(self): 
+		if len(self._websites) == 0: 
+			return 
+		
+		# Sorted, the postings go into the table's b-tree in order 
+		self._postings.sort() 
+		with self._con: 
+			self._con.executemany('INSERT INTO website ' 
+			                      'VALUES(?, ?, ?, ?, ?, ?)', 
+			                      self._websites) 
+			self._con.executemany('INSERT INTO posting VALUES(?, ?, ?, ?)', 
+			                      self._postings) 
+			self._con.executemany('INSERT INTO token VALUES(?, ?, ?) ' 
+			                      'ON CONFLICT(stem) DO UPDATE ' 
+			                      'SET df = df + excluded.df, ' 
+			                      'bound = MAX(bound, excluded.bound)', 
+			                      ((stem, df, self._bound[stem]) 
+			                       for stem, df in self._df.items())) 
+			cur = self._con.cursor() 
+			statistic_add(cur, 'websites', len(self._websites)) 
+			statistic_add(cur, 'length', sum(x[4] for x in self._websites)) 
+			statistic_add(cur, 'generation', 1) 
+		
+		self._websites.clear() 
+		self._urls.clear() 
+		self._postings.clear() 
+		self._df.clear() 
+		self._bound.clear() 
 	
-	cur.execute(command)
+	
+	def __len__(self): 
+		return len(self._websites) 
+
+
+# Returns the stemmer get_stem_dict is given for every website and query. 
+def load_stemmer(): 
+	from nltk.stem import PorterStemmer 
+	return PorterStemmer() 
 
 
 # Return a dictionary of unique strings (not including stopwords) that appear in 
 # the text. These strings are made up of only lowercase alphabetic characters. 
 # The keys are stems, the values are frequencies (int) 
-def get_stem_dict(text, stop_words, stemmer): 
+# If <positions> (a defaultdict(list)) is given, the position of every word 
+# that was kept (counting from 0, stop words included) is appended to its 
+# stem's list in it. 
+def get_stem_dict(text, stop_words, stemmer, positions=None): 
 	# Go through each collection of words (where a "word" is considered to be 
 	# alphabetic characters grouped together). 
 	stems = defaultdict(lambda: 0) 
-	for m in re.finditer(r'[a-zA-Z]+', text):
+	for position, m in enumerate(re.finditer(r'[a-zA-Z]+', text)):
 		word = m.group(0).lower()
 		stem = stemmer.stem(word)  
 		if stem not in stop_words: 
 			stems[stem] += 1 
+			if positions is not None: 
+				positions[stem].append(position) 
 	
 	return stems 
 
 
 # Scrapes the text from the reference (either the name of a file containing 
-# plain text or the hyperlink to a website with content). Returns either None 
-# if the file cannot be opened or the content of the document. 
-def scrape_text(reference, timeout, verbose): 
+# plain text or the hyperlink to a website with content), downloading websites
+# with <fetcher> (a fetch.Fetcher). Returns either None if the file cannot be
+# opened or the content of the document. If <skip_unchanged> is True, websites
+# that have not changed since they were cached are not parsed and None is 
+# returned for them too. 
+def scrape_text(reference, fetcher, verbose, skip_unchanged=False): 
 	if verbose: 
 		print(f'Reading "{reference}" ... ', flush=True, end='') 
 	
@@ -153,13 +653,17 @@ def scrape_text(reference, timeout, verbose):
 		doc_file.close()
 	except OSError: 
 		# Interpret it as a website 
+		from extract import extract_text 
 		try: 
-			req = Request(reference)
-			html_page = urlopen(req, timeout=timeout)
-			
-			soup = BeautifulSoup(html_page, 'html.parser') 
-			all_text = soup.findAll(text=True)
-			text = u" ".join(t.strip() for t in all_text)
+			with fetcher.open(reference) as html_page: 
+				if skip_unchanged and html_page.not_modified: 
+					if verbose: 
+						message = 'Unchanged (not modified since cached)' 
+						print(Fore.CYAN + message + Style.RESET_ALL) 
+					return None 
+				
+				# Parsed as it downloads, without building the whole page 
+				text = extract_text(html_page) 
 		except Exception as ex: 
 			text = None
 			print(Fore.YELLOW + f'Failed ({ex})' + Style.RESET_ALL)
@@ -172,37 +676,230 @@ def scrape_text(reference, timeout, verbose):
 
 
 # Takes the collection of words pointed to by <reference, str> and stores it 
-# into the database.
+# into the database, or adds it to the batch of <indexer> (a BulkIndexer) if 
+# one is given. Stems are numbered with <lexicon> as index_document does. If 
+# <update> is True (without <indexer>), a website that was already indexed is
+# changed to its current text with update_document. 
 def process_document(cur, database_name, reference, stop_words, stemmer, \
-                     timeout, verbose):
+                     fetcher, verbose, indexer=None, lexicon=None, \
+                     update=False):
 	reference = reference.strip()
-	text_str = scrape_text(reference, timeout, verbose) 
+	
+	# A page that was already indexed and hasn't changed since doesn't need to
+	# be parsed again 
+	if indexer is None: 
+		create_tables(cur) 
+		indexed = website_exists(cur, reference) 
+	else: 
+		indexed = reference in indexer 
+	text_str = scrape_text(reference, fetcher, verbose, skip_unchanged=indexed)
 	if text_str is None:
 		return 
 
-	# Words we will index 
-	stems = get_stem_dict(text_str, stop_words, stemmer) 
+	# Words we will index, and where they are 
+	positions = defaultdict(list) 
+	stems = get_stem_dict(text_str, stop_words, stemmer, positions) 
+	text_hash = content_hash(text_str) 
+	if indexer is not None: 
+		batch_document(indexer, database_name, reference, stems, verbose, \
+		               positions, text_hash) 
+	elif update and indexed: 
+		update_document(cur, database_name, reference, stems, verbose, \
+		                lexicon, positions, text_hash) 
+	else: 
+		index_document(cur, database_name, reference, stems, verbose, lexicon, \
+		               positions, text_hash) 
+
+
+# Stores the document named <reference>, made up of <stems> (as returned by 
+# get_stem_dict, with <positions> if it was given them) and whose text has the
+# content_hash() <text_hash>, into the database, numbering stems with 
+# <lexicon> (a new Lexicon of <cur> if not given). 
+def index_document(cur, database_name, reference, stems, verbose, \
+                   lexicon=None, positions=None, text_hash=None): 
+	if len(stems) == 0: 
+		if verbose: 
+			print(Fore.YELLOW + 'Failed (no words to index)' + Style.RESET_ALL)
+		return 
 	
 	if verbose: 
 		message = f'Inserting {len(stems)} stems into {database_name} ... '
 		print(message, flush=True, end='')
 	
 	# Optionally create table and insert this reference into it.
-	website_create_table(cur) 
-	website_id = website_insert(cur, reference, stems) 
+	create_tables(cur) 
+	website_id = website_insert(cur, reference, stems, text_hash) 
 	if website_id == None:
 		if verbose: 
 			print(Fore.YELLOW + 'Failed (duplicate entry)' + Style.RESET_ALL)
 		return # Nothing new to do, already indexed 
 	
-	token_create_table(cur) 
-	for stem in stems.keys():
-		token_insert(cur, stem, website_id);
+	if lexicon is None: 
+		lexicon = Lexicon(cur) 
+	m = max(stems.values()) 
+	for stem, tf in stems.items(): 
+		token_insert(cur, lexicon.add(stem), website_id, tf, m, \
+		             None if positions is None else positions[stem]) 
 		
 	if verbose: 
 		print(Fore.CYAN + 'Done' + Style.RESET_ALL)
 
 
+# Same as index_document, but if <reference> was already indexed, only what 
+# changed since is written: the postings of stems it no longer has are 
+# deleted, those whose tf or positions changed are rewritten, and new stems 
+# are inserted. A website whose text has the same <text_hash> as when it was 
+# indexed isn't touched at all, and one with no words left is deleted. 
+def update_document(cur, database_name, reference, stems, verbose, \
+                    lexicon=None, positions=None, text_hash=None): 
+	create_tables(cur) 
+	command = 'SELECT id, m, data, length, hash FROM website WHERE url = ?' 
+	row = cur.execute(command, (reference,)).fetchone() 
+	if row is None: 
+		index_document(cur, database_name, reference, stems, verbose, lexicon, \
+		               positions, text_hash) 
+		return 
+	
+	website_id, old_m, data, length, old_hash = row 
+	if text_hash is not None and text_hash == old_hash: 
+		if verbose: 
+			print(Fore.CYAN + 'Unchanged (same content)' + Style.RESET_ALL) 
+		return 
+	
+	if len(stems) == 0: 
+		website_delete(cur, reference) 
+		if verbose: 
+			print(Fore.YELLOW + 'Deleted (no words to index)' + Style.RESET_ALL)
+		return 
+	
+	if verbose: 
+		message = f'Updating {len(stems)} stems in {database_name} ... ' 
+		print(message, flush=True, end='') 
+	
+	if lexicon is None: 
+		lexicon = Lexicon(cur) 
+	old_stems = website_stems(data) 
+	removed = lexicon.ids(x for x in old_stems if x not in stems) 
+	cur.executemany('DELETE FROM posting WHERE stem = ? AND doc = ?', 
+	                ((x, website_id) for x in removed)) 
+	token_remove(cur, removed) 
+	
+	columns = website_columns(stems) 
+	m = columns[0] 
+	for stem, tf in stems.items(): 
+		stem_positions = None if positions is None else positions[stem] 
+		if stem not in old_stems: 
+			token_insert(cur, lexicon.add(stem), website_id, tf, m, \
+			             stem_positions) 
+			continue 
+		
+		stem_id = lexicon.find(stem) 
+		data = None if positions is None else encode_positions(stem_positions)
+		command =  'UPDATE posting SET tf = ?, positions = ? ' 
+		command += 'WHERE stem = ? AND doc = ? ' 
+		command += 'AND (tf != ? OR positions IS NOT ?)' 
+		cur.execute(command, (tf, data, stem_id, website_id, tf, data)) 
+		# The bound only ever goes up, until compact() works it out again 
+		if tf / m > old_stems[stem] / old_m: 
+			command = 'UPDATE token SET bound = MAX(bound, ?) WHERE stem = ?' 
+			cur.execute(command, (tf / m, stem_id)) 
+	
+	command =  'UPDATE website SET m = ?, data = ?, length = ?, hash = ? ' 
+	command += 'WHERE id = ?' 
+	cur.execute(command, (*columns, text_hash, website_id)) 
+	statistic_add(cur, 'length', columns[2] - length) 
+	statistic_add(cur, 'generation', 1) 
+	
+	if verbose: 
+		print(Fore.CYAN + 'Done' + Style.RESET_ALL) 
+
+
+# The stop words and stemmer of a process started by process_documents. 
+worker_stop_words = None 
+worker_stemmer = None 
+
+
+# Sets up a process started by process_documents, reading words stemmed in 
+# earlier runs from <stem_cache_file> if given. 
+def start_worker(stem_cache_file): 
+	global worker_stop_words, worker_stemmer 
+	worker_stop_words = set(stopwords.words('english')) 
+	worker_stemmer = StemCache(load_stemmer(), path=stem_cache_file) 
+
+
+# Same as get_stem_dict, run in a process started by process_documents, 
+# returning the stems and their positions. Plain dictionaries are returned, as 
+# a defaultdict of a lambda can't be sent back to the main process. 
+def worker_stem_dict(text): 
+	positions = defaultdict(list) 
+	stems = get_stem_dict(text, worker_stop_words, worker_stemmer, positions) 
+	return dict(stems), dict(positions) 
+
+
+# Same as process_document with <indexer> for every reference in 
+# <references>, but the text of each is turned into stems by one of <workers> 
+# processes, so that stemming uses every core and overlaps with downloading 
+# the next websites. The stems come back to this process, which adds them to
+# the batch in the order of <references>, giving the same ids as without
+# workers. 
+def process_documents(database_name, references, fetcher, verbose, indexer, \
+                      workers, stem_cache_file=None): 
+	from concurrent.futures import ProcessPoolExecutor 
+	
+	# Websites waiting for their stems, oldest first. Only a few are kept 
+	# waiting per worker, so that the text of a long list of websites is not 
+	# all held in memory 
+	waiting = deque() 
+	
+	def add_oldest(): 
+		reference, text_hash, result = waiting.popleft() 
+		stems, positions = result.result() 
+		batch_document(indexer, database_name, reference, stems, verbose, \
+		               positions, text_hash) 
+	
+	with ProcessPoolExecutor(workers, initializer=start_worker, \
+	                         initargs=(stem_cache_file,)) as executor: 
+		for reference in references: 
+			reference = reference.strip() 
+			indexed = reference in indexer 
+			text_str = scrape_text(reference, fetcher, verbose, \
+			                       skip_unchanged=indexed) 
+			if text_str is None: 
+				continue 
+			
+			result = executor.submit(worker_stem_dict, text_str) 
+			waiting.append((reference, content_hash(text_str), result)) 
+			if len(waiting) >= 4 * workers: 
+				add_oldest() 
+		
+		while len(waiting) > 0: 
+			add_oldest() 
+
+
+# Same as index_document, but adds the document to the batch of <indexer> (a 
+# BulkIndexer) instead of writing it right away. 
+def batch_document(indexer, database_name, reference, stems, verbose, \
+                   positions=None, text_hash=None): 
+	if len(stems) == 0: 
+		if verbose: 
+			print(Fore.YELLOW + 'Failed (no words to index)' + Style.RESET_ALL)
+		return 
+	
+	if verbose: 
+		print(f'Batching {len(stems)} stems ... ', flush=True, end='') 
+	
+	batched = len(indexer) 
+	if indexer.add(reference, stems, positions, text_hash) is None: 
+		if verbose: 
+			print(Fore.YELLOW + 'Failed (duplicate entry)' + Style.RESET_ALL)
+		return 
+	
+	if verbose: 
+		print(Fore.CYAN + 'Done' + Style.RESET_ALL) 
+		if len(indexer) == 0: 
+			print(f'Wrote {batched + 1} websites into {database_name}') 
+
+
 def check_valid_websites(cur): 
 	# Make sure table was previously indexed
 	command = 'SELECT name FROM sqlite_master WHERE type = "table"'
@@ -215,49 +912,730 @@ def check_valid_websites(cur):
 		sys.exit(1) 
 		
 	
-def query_websites(cur, query, stop_words, stemmer, verbose):
-	check_valid_websites(cur) 
+# Returns the inverse document frequency of a stem that appears in <df> of the
+# <website_count> websites indexed. 
+def idf(website_count, df): 
+	return math.log2(website_count / df) + 1 
+
+
+# Ranks websites by the sum of tf/m * idf over the stems of the query they 
+# contain. 
+class TfIdf: 
+	# What a stem appearing in a website adds to the website's score, before it
+	# is multiplied by stem_weight(), as SQL over the posting and website 
+	# tables. SQLite divides exactly as Python does. 
+	weight = 'CAST(posting.tf AS REAL) / website.m' 
 	
-	website_set = set() 
-	stems = get_stem_dict(query, stop_words, stemmer)
-	for stem in stems.keys(): 
-		stem = stem_to_int(stem) 
-		command = f'SELECT doc FROM token WHERE stem = {stem}' 
-		websites = cur.execute(command).fetchone()
-		if websites is not None: 
-			for website in websites: 
-				website_set.update(website.split(';')) 
 	
-	website_count = cur.execute('SELECT COUNT(*) FROM website').fetchone()[0]
+	# Reads the totals about the index the ranker needs from <reader> (as 
+	# as_reader returns it). 
+	def load(self, reader): 
+		self.website_count = reader.statistic('websites') 
+	
+	
+	# Returns the values of the parameters (?) in self.weight. 
+	def parameters(self): 
+		return () 
+	
+	
+	# Same as self.weight, in Python, for a stem found <tf> times in a website
+	# whose most frequent stem is found <m> times and whose length is 
+	# <length>. Works on NumPy arrays as well as numbers. 
+	def weigh(self, tf, m, length): 
+		return tf / m 
+	
+	
+	# Returns what the weights of a stem found in <df> websites are multiplied
+	# by. 
+	def stem_weight(self, df): 
+		return idf(self.website_count, df) 
+	
+	
+	# Returns the most self.weight can be for a stem whose token.bound is 
+	# <bound>. 
+	def bound(self, bound): 
+		return bound 
+	
+	
+	# Tells rankers apart, including the same ranker with other parameters, 
+	# in the keys of cached results. 
+	def __repr__(self): 
+		return 'TfIdf()' 
+
+
+# Ranks websites with Okapi BM25: a stem found tf times in a website of length
+# l adds tf * (k1 + 1) / (tf + k1 * (1 - b + b * l / avgdl)) times 
+# ln(1 + (N - df + 0.5) / (df + 0.5)) to its score, where avgdl is the average
+# length of a website. <k1> is how quickly repeats of a stem stop counting and
+# <b> how much long websites are held back. 
+class BM25: 
+	weight =  'posting.tf * ? / ' 
+	weight += '(posting.tf + ? * (1 - ? + ? * website.length / ?))' 
+	
+	
+	def __init__(self, k1=default_k1, b=default_b): 
+		self.k1 = k1 
+		self.b = b 
+	
+	
+	def load(self, reader): 
+		self.website_count = reader.statistic('websites') 
+		length = reader.statistic('length') 
+		self.average_length = length / max(self.website_count, 1) 
+	
+	
+	def parameters(self): 
+		return (self.k1 + 1, self.k1, self.b, self.b, self.average_length) 
+	
+	
+	def weigh(self, tf, m, length): 
+		k1, b = self.k1, self.b 
+		return tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / \
+		                                  self.average_length)) 
+	
+	
+	def stem_weight(self, df): 
+		n = self.website_count 
+		return math.log(1 + (n - df + 0.5) / (df + 0.5)) 
+	
+	
+	# tf * (k1 + 1) / (tf + ...) only gets close to k1 + 1 
+	def bound(self, bound): 
+		return self.k1 + 1 
+	
+	
+	def __repr__(self): 
+		return f'BM25({self.k1!r}, {self.b!r})' 
+
+
+# Ways of ranking websites, chosen with --ranker 
+rankers = { 
+	'tfidf': TfIdf, 
+	'bm25': BM25, 
+} 
+
+
+# Returns the command reading what each website one stem appears in gets from
+# it under <ranker> (before stem_weight()), as (website, weight) rows in order
+# of website. Only the one column is worked out per row, which keeps reading 
+# each row cheap. <where> narrows the rows down further. 
+def weights_command(ranker, where=''): 
+	command =  f'SELECT posting.doc, {ranker.weight} ' 
+	command += 'FROM posting JOIN website ON website.id = posting.doc ' 
+	command += f'WHERE posting.stem = ? {where}ORDER BY posting.doc' 
+	return command 
+
+
+# Returns {stem: (df, bound)} for each of <stem_ids> that was indexed. 
+def token_rows(cur, stem_ids): 
+	command =  'SELECT stem, df, bound FROM token WHERE stem IN ' 
+	command += '(' + ', '.join('?' * len(stem_ids)) + ')' 
+	return {x[0]: x[1:] for x in cur.execute(command, stem_ids).fetchall()} 
+
+
+# What the scorers read the index through, for an index in the database's 
+# tables. segment.Segment reads an index exported by segment.py the same way.
+# The postings read are kept in <postings> (a cache.PostingCache) if given. 
+class TableReader: 
+	def __init__(self, cur, postings=None): 
+		self._cur = cur 
+		self._postings = postings 
+	
+	
+	# Exits with an error message if there are no websites to query. 
+	def check(self): 
+		check_valid_websites(self._cur) 
+	
+	
+	# Returns a Lexicon numbering stems the way this index does. 
+	def lexicon(self): 
+		return Lexicon(self._cur) 
+	
+	
+	def statistic(self, name): 
+		return statistic_get(self._cur, name) 
+	
+	
+	# Every scorer reads the tokens of a query before its postings, so this is
+	# where cached postings are dropped if websites have been added since. 
+	def tokens(self, stem_ids): 
+		if self._postings is not None: 
+			self._postings.check(self.statistic('generation')) 
+		return token_rows(self._cur, stem_ids) 
+	
+	
+	# Returns (website, weight) for each website <stem_id> appears in, in 
+	# order of website, where weight is what it gets from the stem under 
+	# <ranker> (before stem_weight()). 
+	def weights(self, ranker, stem_id): 
+		# Postings that won't be kept are read as they are used, as the top k 
+		# scorer often stops reading them early 
+		if self._postings is not None: 
+			key = (stem_id, repr(ranker)) 
+			postings = self._postings.get(key) 
+			if postings is not None or self._postings.admits(key): 
+				return self._cached_weights(ranker, stem_id, postings) 
+		command = weights_command(ranker) 
+		parameters = (*ranker.parameters(), stem_id) 
+		return self._cur.connection.execute(command, parameters) 
+	
+	
+	# Returns the websites <stem_id> appears in, in order, leaving out those 
+	# deleted since the index was last compacted. 
+	def websites(self, stem_id): 
+		command =  'SELECT doc FROM posting WHERE stem = ? ' 
+		command += 'AND doc NOT IN (SELECT id FROM tombstone) ORDER BY doc' 
+		return [x[0] for x in self._cur.execute(command, (stem_id,))] 
+	
+	
+	# Returns {website: positions} for each of <websites> (in order) that 
+	# <stem_id> appears in, where positions are where in the website it is, 
+	# in order (none for websites indexed before positions were kept). 
+	def positions(self, stem_id, websites): 
+		positions = {} 
+		for start in range(0, len(websites), 500): 
+			chunk = websites[start:start + 500] 
+			command =  'SELECT doc, positions FROM posting WHERE stem = ? ' 
+			command += 'AND doc IN (' + ', '.join('?' * len(chunk)) + ')' 
+			for website, data in self._cur.execute(command, (stem_id, *chunk)):
+				positions[website] = decode_positions(data) 
+		return positions 
+	
+	
+	# Same as weights, from <postings> if they were cached. 
+	def _cached_weights(self, ranker, stem_id, postings): 
+		if postings is None: 
+			postings = self._read(ranker, stem_id) 
+		yield from zip(*postings) 
+	
+	
+	# Reads the postings of <stem_id> under <ranker> into the cache (if it 
+	# keeps them), as an array of websites and one of weights. 
+	def _read(self, ranker, stem_id): 
+		command = weights_command(ranker) 
+		parameters = (*ranker.parameters(), stem_id) 
+		rows = self._cur.execute(command, parameters).fetchall() 
+		postings = (array.array('q', [x[0] for x in rows]), 
+		            array.array('d', [x[1] for x in rows])) 
+		self._postings.put((stem_id, repr(ranker)), postings) 
+		return postings 
+	
+	
+	# Returns the weight <website> gets from <stem_id> under <ranker>, or None 
+	# if the stem isn't in it. 
+	def weight(self, ranker, stem_id, website): 
+		if self._postings is not None: 
+			postings = self._postings.peek((stem_id, repr(ranker))) 
+			if postings is not None: 
+				websites, weights = postings 
+				i = bisect.bisect_left(websites, website) 
+				if i == len(websites) or websites[i] != website: 
+					return None 
+				return weights[i] 
+		command = weights_command(ranker, 'AND posting.doc = ? ') 
+		parameters = (*ranker.parameters(), stem_id, website) 
+		row = self._cur.execute(command, parameters).fetchone() 
+		return None if row is None else row[1] 
+	
+	
+	# Same as weights, as a NumPy array of websites and one of weights. 
+	def weight_arrays(self, ranker, stem_id): 
+		import numpy as np 
+		if self._postings is not None: 
+			postings = self._postings.get((stem_id, repr(ranker))) 
+			if postings is None: 
+				postings = self._read(ranker, stem_id) 
+			websites, weights = postings 
+			return np.frombuffer(websites, np.int64), np.frombuffer(weights) 
+		rows = self.weights(ranker, stem_id).fetchall() 
+		values = itertools.chain.from_iterable(rows) 
+		postings = np.fromiter(values, np.float64, 2 * len(rows)).reshape(-1, 2)
+		return postings[:, 0].astype(np.int64), postings[:, 1] 
+	
+	
+	# Returns {website: url} for each of <websites>. 
+	def urls(self, websites): 
+		command =  'SELECT id, url FROM website WHERE id IN ' 
+		command += '(' + ', '.join('?' * len(websites)) + ')' 
+		return dict(self._cur.execute(command, websites).fetchall()) 
+
+
+# Returns what the scorers read <source> through: a TableReader if it is a 
+# cursor of the database, or <source> itself (such as a segment.Segment). 
+def as_reader(source): 
+	if isinstance(source, sqlite3.Cursor): 
+		return TableReader(source) 
+	return source 
+
+
+# Scores every website containing any of <stem_ids> by the sum over the stems
+# it contains of what <ranker> (TfIdf if not given) says each adds, returning
+# (website, score) pairs from the highest score to the lowest (ties in order 
+# of website). Everything needed to score a website comes with its postings, 
+# so each stem takes one read, however many websites it is in. 
+def score_python(cur, stem_ids, ranker=None): 
+	reader = as_reader(cur) 
+	ranker = TfIdf() if ranker is None else ranker 
+	ranker.load(reader) 
+	tokens = reader.tokens(stem_ids) 
+	
+	scores = defaultdict(lambda: 0) 
+	for stem_id in stem_ids: 
+		if stem_id not in tokens: 
+			continue 
+		stem_weight = ranker.stem_weight(tokens[stem_id][0]) 
+		for website, weight in reader.weights(ranker, stem_id): 
+			scores[website] += weight * stem_weight 
+	return sorted(scores.items(), key=lambda x: (-x[1], x[0])) 
+
+
+# Same as score_python, but each stem's postings are loaded into arrays and 
+# added into the scores all at once. 
+def score_numpy(cur, stem_ids, ranker=None): 
+	import numpy as np 
+	reader = as_reader(cur) 
+	ranker = TfIdf() if ranker is None else ranker 
+	ranker.load(reader) 
+	tokens = reader.tokens(stem_ids) 
+	
 	websites = [] 
-	for website in website_set: 
-		name = cur.execute(f'SELECT url FROM website WHERE id = {website}').fetchone()[0] 
+	weights = [] 
+	for stem_id in stem_ids: 
+		if stem_id not in tokens: 
+			continue 
+		stem_websites, stem_weights = reader.weight_arrays(ranker, stem_id) 
+		websites.append(stem_websites) 
+		stem_weight = ranker.stem_weight(tokens[stem_id][0]) 
+		weights.append(stem_weights * stem_weight) 
+	if len(websites) == 0: 
+		return [] 
+	
+	# Adding the weights in the same order as score_python does gives exactly 
+	# the same sums 
+	ids, slots = np.unique(np.concatenate(websites), return_inverse=True) 
+	scores = np.bincount(slots, weights=np.concatenate(weights)) 
+	order = np.lexsort((ids, -scores)) 
+	return list(zip(ids[order].tolist(), scores[order].tolist())) 
+
+
+# Returns the <k> best of the (website, score) pairs score_python would give, 
+# in the same order and with the same scores, without scoring every website. 
+# This is MaxScore: no website can get more from a stem than <ranker>'s bound
+# for it times its stem weight, so once k websites have been found, the stems
+# whose bounds add up to less than the k-th best score cannot by themselves 
+# put a website in the top k. Their postings stop being read, and they are 
+# only looked up for websites found through the other stems, and only while 
+# the website could still beat the k-th best score. Also returns how many 
+# postings were read. 
+def score_top_k(cur, stem_ids, k, ranker=None): 
+	reader = as_reader(cur) 
+	ranker = TfIdf() if ranker is None else ranker 
+	ranker.load(reader) 
+	terms = [] 
+	for stem_id, (df, bound) in reader.tokens(stem_ids).items(): 
+		weight = ranker.stem_weight(df) 
+		terms.append((ranker.bound(bound) * weight, stem_id, weight)) 
+	terms.sort() 
+	
+	# Most a website can get from terms[0] ... terms[i] together; sums are 
+	# rounded, so they are only trusted to within a small slack 
+	limits = list(itertools.accumulate(x[0] for x in terms)) 
+	slack = 1e-9 
+	
+	cursors = [reader.weights(ranker, x[1]) for x in terms] 
+	current = [next(x, None) for x in cursors] 
+	read = sum(x is not None for x in current) 
+	
+	best = [] # Min-heap of (score, -website), worst of the best k first 
+	threshold = -math.inf 
+	first = 0 # terms[first:] are read in full, terms[:first] looked up 
+	while first < len(terms): 
+		candidates = [x[0] for x in current[first:] if x is not None] 
+		if len(candidates) == 0: 
+			break 
+		website = min(candidates) 
 		
-		command = f'SELECT m, data FROM website WHERE id = {website}'
-		m, freq_data = cur.execute(command).fetchone() 
+		weights = {} 
+		for i in range(first, len(terms)): 
+			if current[i] is not None and current[i][0] == website: 
+				weights[i] = current[i][1] * terms[i][2] 
+				current[i] = next(cursors[i], None) 
+				read += current[i] is not None 
+		
+		# Look up the other stems from the most to the least promising, 
+		# giving up as soon as the website cannot make it 
+		limit = sum(weights.values()) + (limits[first - 1] if first else 0) 
+		for i in range(first - 1, -1, -1): 
+			if limit < threshold - slack * threshold: 
+				break 
+			limit -= terms[i][0] 
+			weight = reader.weight(ranker, terms[i][1], website) 
+			read += 1 
+			if weight is not None: 
+				weights[i] = weight * terms[i][2] 
+				limit += weights[i] 
+		else: 
+			# Same order of addition as score_python, for the same sums 
+			score = 0 
+			for i in sorted(weights, key=lambda x: terms[x][1]): 
+				score += weights[i] 
+			if len(best) < k: 
+				heapq.heappush(best, (score, -website)) 
+			elif score > best[0][0]: 
+				heapq.heapreplace(best, (score, -website)) 
+			
+			if len(best) == k: 
+				threshold = best[0][0] 
+				while first < len(terms) and \
+				      limits[first] < threshold - slack * threshold: 
+					first += 1 
+	
+	for cursor in cursors: 
+		cursor.close() 
+	websites = [(-website, score) for score, website in sorted(best)[::-1]] 
+	return websites, read 
+
+
+# Ways of scoring websites for a query, chosen with --scorer 
+scorers = { 
+	'python': score_python, 
+	'numpy': score_numpy, 
+} 
+
+
+# Splits <query> into clauses, (kind, terms) pairs where terms are the 
+# (position, stem) pairs of a word or phrase, from the first position, and 
+# kind says what websites must do with it: 
+#   "<words>": 'required', contain the words next to each other, in order 
+#   <clause> AND <clause>: 'required', contain both 
+#   NOT <clause>, -<clause>: 'excluded', not contain it 
+#   anything else: 'optional', count towards a website's score if contained 
+# Stop words are dropped, but still count as positions between the other 
+# words of a phrase. 
+def parse_query(query, stop_words, stemmer): 
+	clauses = [] 
+	kind = None 
+	for match in re.finditer(r'(-?)(?:"([^"]*)"?|([^\s"]+))', query): 
+		minus, phrase, word = match.groups() 
+		if not minus and word in ('AND', 'NOT'): 
+			if word == 'AND' and len(clauses) > 0: 
+				clauses[-1] = ('required', clauses[-1][1]) 
+			kind = 'required' if word == 'AND' else 'excluded' 
+			continue 
 		
-		term_sum = 0
-		for item in freq_data.split(','): 
-			parts = item.split(':') 
-			if parts[0] in stems.keys(): 
-				command = f'SELECT doc FROM token WHERE stem = {stem_to_int(parts[0])}'
-				term_count = cur.execute(command).fetchone()[0].count(':') + 1 
-				tf_ij = int(parts[1]) / m 
-				idf_i = math.log2(website_count / term_count) + 1  
-				term_sum += tf_ij * idf_i 
+		positions = defaultdict(list) 
+		text = word if phrase is None else phrase 
+		get_stem_dict(text, stop_words, stemmer, positions) 
+		terms = sorted((x, stem) for stem, found in positions.items() 
+		               for x in found) 
+		if len(terms) == 0: 
+			continue 
+		terms = [(x - terms[0][0], stem) for x, stem in terms] 
 		
-		websites.append((name, term_sum, website))
+		if minus: 
+			kind = 'excluded' 
+		elif kind is None: 
+			kind = 'optional' if phrase is None else 'required' 
+		clauses.append((kind, terms)) 
+		kind = None 
+	return clauses 
+
+
+# Returns the first index of <values> (in order) at or after <low> whose value 
+# is at least <target>. The distance looked ahead doubles until it passes 
+# <target>, so skipping far ahead takes few steps and skipping a little takes 
+# fewer still. 
+def gallop(values, target, low=0): 
+	high = low 
+	step = 1 
+	while high < len(values) and values[high] < target: 
+		low = high + 1 
+		high += step 
+		step *= 2 
+	return bisect.bisect_left(values, target, low, min(high, len(values))) 
+
+
+# Returns the values in every one of <lists> (each in order), in order. The 
+# values of the shortest list are looked for in the others, each search 
+# galloping on from where the last one stopped. 
+def intersect(lists): 
+	if len(lists) == 0: 
+		return [] 
+	lists = sorted(lists, key=len) 
+	starts = [0] * len(lists) 
+	found = [] 
+	for value in lists[0]: 
+		for i in range(1, len(lists)): 
+			starts[i] = gallop(lists[i], value, starts[i]) 
+			if starts[i] == len(lists[i]): 
+				return found 
+			if lists[i][starts[i]] != value: 
+				break 
+		else: 
+			found.append(value) 
+	return found 
+
+
+# Returns the values of <values> (in order) not in <other> (in order). 
+def subtract(values, other): 
+	start = 0 
+	kept = [] 
+	for value in values: 
+		start = gallop(other, value, start) 
+		if start == len(other) or other[start] != value: 
+			kept.append(value) 
+	return kept 
+
+
+# Returns the websites (in order) containing <terms>, a clause of 
+# parse_query's, as read from <reader> with stems numbered by <lexicon>. The 
+# websites containing every stem are found first, and only their positions 
+# read to check the stems are where the clause has them. 
+def match_clause(reader, lexicon, terms): 
+	stem_ids = [lexicon.find(stem) for _, stem in terms] 
+	if None in stem_ids: 
+		return [] 
+	websites = intersect([reader.websites(x) for x in set(stem_ids)]) 
+	if len(terms) == 1 or len(websites) == 0: 
+		return websites 
 	
-	websites = sorted(websites, key=lambda x: x[1], reverse=True)
+	positions = {x: reader.positions(x, websites) for x in set(stem_ids)} 
+	matched = [] 
+	for website in websites: 
+		# Where the clause could start, going by each stem in turn 
+		starts = None 
+		for (offset, _), stem_id in zip(terms, stem_ids): 
+			found = {x - offset for x in positions[stem_id].get(website, ())}
+			starts = found if starts is None else starts & found 
+			if len(starts) == 0: 
+				break 
+		if len(starts) > 0: 
+			matched.append(website) 
+	return matched 
+
+
+# Returns the websites matching <clauses> (from parse_query) as (website, 
+# score) pairs, in the order score_python gives, and how many websites were 
+# scored. Websites must contain every required clause, or any stem if none 
+# are, and no excluded clause. Only those websites are scored, by the stems 
+# of every clause but the excluded ones, looking each website up in the 
+# postings of a stem if there are far fewer websites than postings. 
+def score_boolean(cur, clauses, lexicon, ranker=None): 
+	reader = as_reader(cur) 
+	ranker = TfIdf() if ranker is None else ranker 
+	ranker.load(reader) 
+	stems = [stem for kind, terms in clauses if kind != 'excluded' 
+	         for _, stem in terms] 
+	stem_ids = lexicon.ids(stems) 
+	tokens = reader.tokens(stem_ids) 
 	
-	if len(websites) > 0: 
-		for website in websites[:-1]: 
-			print(website[2], end=';')
-		print(websites[-1][2])
-		
-		if verbose:
-			for website in websites[:10]:
-				print('[%.3f] %s' % (website[1], website[0]))
+	required = [match_clause(reader, lexicon, terms) 
+	            for kind, terms in clauses if kind == 'required'] 
+	if len(required) > 0: 
+		websites = intersect(required) 
+	else: 
+		found = set() 
+		for stem_id in stem_ids: 
+			found.update(reader.websites(stem_id)) 
+		websites = sorted(found) 
+	for kind, terms in clauses: 
+		if kind == 'excluded' and len(websites) > 0: 
+			websites = subtract(websites, match_clause(reader, lexicon, terms))
+	
+	scores = dict.fromkeys(websites, 0) 
+	for stem_id in stem_ids: 
+		if stem_id not in tokens: 
+			continue 
+		df = tokens[stem_id][0] 
+		stem_weight = ranker.stem_weight(df) 
+		if 8 * len(websites) < df: 
+			for website in websites: 
+				weight = reader.weight(ranker, stem_id, website) 
+				if weight is not None: 
+					scores[website] += weight * stem_weight 
+		else: 
+			for website, weight in reader.weights(ranker, stem_id): 
+				if website in scores: 
+					scores[website] += weight * stem_weight 
+	return sorted(scores.items(), key=lambda x: (-x[1], x[0])), len(websites) 
+
+
+# Returns the websites matching <query> as (website, score) pairs, best first:
+# all of them, or only the best <k> if given. Websites are ranked by <ranker> 
+# (TfIdf if not given). The index is read from <cur>, a cursor of the 
+# database or a segment.Segment. Stems are looked up in <lexicon> (a new one 
+# for the index if not given); those never indexed match no websites. Queries
+# with the same stems are only scored once per generation of the index if 
+# <results> (a cache.ResultCache) is given. Queries using phrases, AND or NOT 
+# (see parse_query) only score the websites matching them. 
+def rank_websites(cur, query, stop_words, stemmer, verbose=False, \
+                  scorer='python', k=None, ranker=None, lexicon=None, \
+                  results=None): 
+	reader = as_reader(cur) 
+	ranker = TfIdf() if ranker is None else ranker 
+	clauses = parse_query(query, stop_words, stemmer) 
+	if all(kind == 'optional' for kind, _ in clauses): 
+		clauses = None 
+	stems = get_stem_dict(query, stop_words, stemmer)
+	if lexicon is None: 
+		lexicon = reader.lexicon() 
+	stem_ids = lexicon.ids(stems.keys()) 
+	
+	# Every scorer gives the same result, so it isn't part of the key 
+	if results is not None: 
+		key = repr((stem_ids if clauses is None else clauses, k, ranker)) 
+		generation = reader.statistic('generation') 
+		websites = results.get(key, generation) 
+		if websites is not None: 
+			return websites 
+	
+	if clauses is not None: 
+		websites, scored = score_boolean(reader, clauses, lexicon, ranker) 
+		websites = websites[:k] 
+		if verbose: 
+			total = sum(df for df, _ in reader.tokens(stem_ids).values()) 
+			print(f'Scored {scored} websites, not {total} postings') 
+	elif k is None: 
+		websites = scorers[scorer](reader, stem_ids, ranker) 
+	else: 
+		websites, read = score_top_k(reader, stem_ids, k, ranker) 
+		if verbose: 
+			total = sum(df for df, _ in reader.tokens(stem_ids).values()) 
+			print(f'Read {read} of {total} postings') 
+	
+	if results is not None: 
+		results.put(key, generation, websites) 
+	return websites 
+
+
+# Prints the websites matching <query>, as rank_websites returns them. 
+def query_websites(cur, query, stop_words, stemmer, verbose, scorer='python', \
+                   k=None, ranker=None, results=None):
+	reader = as_reader(cur) 
+	reader.check() 
+	websites = rank_websites(reader, query, stop_words, stemmer, verbose, \
+	                         scorer, k, ranker, results=results) 
+	print_websites(reader, websites, verbose) 
+
+
+# Prints <websites> (as rank_websites returns them), with the urls of the best
+# read from <reader> if <verbose>. 
+def print_websites(reader, websites, verbose): 
+	if len(websites) > 0: 
+		for website in websites[:-1]: 
+			print(website[0], end=';')
+		print(websites[-1][0])
+		
+		if verbose:
+			names = reader.urls([website for website, _ in websites[:10]]) 
+			for website, score in websites[:10]:
+				print('[%.3f] %s' % (score, names[website]))
+
+
+# Answers queries in a process that keeps running (--serve), so the database 
+# connection, stop words and stemmer are only set up once instead of for 
+# every query. Each request is a JSON object on a line of its own, 
+#   {"query": <query>, "k": <count>} 
+# where "k" can be left out (for <k>, or every website if it is None), and is
+# answered with a line 
+#   {"websites": [[<id>, <url>, <score>], ...]} 
+# best first, or {"error": <message>} if the request was not understood. 
+# Queries are answered from <segment> (a segment.Segment) if given, instead of
+# from the database behind <con>, and remembered in <results> (a 
+# cache.ResultCache) if given. The postings read from the database are kept 
+# in <postings> (a cache.PostingCache) if given. 
+class QueryServer: 
+	def __init__(self, con, stop_words, stemmer, scorer='python', k=None, \
+	             ranker=None, segment=None, results=None, postings=None): 
+		self.results = results 
+		self._stop_words = stop_words 
+		self._stemmer = stemmer 
+		self._scorer = scorer 
+		self._k = k 
+		self._ranker = ranker 
+		if segment is None: 
+			self._reader = TableReader(con.cursor(), postings) 
+			self._lexicon = self._reader.lexicon() 
+			self._lexicon.load() 
+		else: 
+			self._reader = segment 
+			self._lexicon = segment 
+	
+	
+	# Returns the answer to <request>, a dictionary as described above. 
+	def answer(self, request): 
+		if not isinstance(request, dict) or \
+		   not isinstance(request.get('query'), str): 
+			return {'error': 'expected an object with a "query" string'} 
+		k = request.get('k', self._k) 
+		if k is not None and (type(k) is not int or k <= 0): 
+			return {'error': f'k must be a positive integer, "{k}" found'} 
+		
+		websites = rank_websites(self._reader, request['query'], 
+		                         self._stop_words, self._stemmer, False, 
+		                         self._scorer, k, self._ranker, self._lexicon, 
+		                         self.results) 
+		names = self._reader.urls([website for website, _ in websites]) 
+		return {'websites': [[website, names[website], score] 
+		                     for website, score in websites]} 
+	
+	
+	# Returns the line answering the request on <line>. 
+	def answer_line(self, line): 
+		try: 
+			request = json.loads(line) 
+		except ValueError: 
+			return json.dumps({'error': 'request is not valid JSON'}) 
+		return json.dumps(self.answer(request)) 
+	
+	
+	# Answers each request read from <infile> on <outfile>, until <infile> 
+	# ends. 
+	def serve(self, infile, outfile): 
+		for line in infile: 
+			if line.strip() == '': 
+				continue 
+			outfile.write(self.answer_line(line) + '\n') 
+			outfile.flush() 
+	
+	
+	# Returns a server listening on the Unix socket <path>, which answers the 
+	# requests of each client that connects (one at a time) until the client 
+	# disconnects. Run it with serve_forever(). 
+	def listen(self, path): 
+		query_server = self 
+		class Handler(socketserver.StreamRequestHandler): 
+			def handle(self): 
+				for line in self.rfile: 
+					if line.strip() == b'': 
+						continue 
+					answer = query_server.answer_line(line.decode('utf-8')) 
+					self.wfile.write(answer.encode('utf-8') + b'\n') 
+		
+		return socketserver.UnixStreamServer(path, Handler) 
+
+
+# Asks a QueryServer listening on the Unix socket <path> for answers, the same
+# way QueryServer.answer gives them in the same process. 
+class QueryClient: 
+	def __init__(self, path): 
+		self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) 
+		self._socket.connect(path) 
+		self._file = self._socket.makefile('rwb') 
+	
+	
+	def answer(self, request): 
+		self._file.write(json.dumps(request).encode('utf-8') + b'\n') 
+		self._file.flush() 
+		line = self._file.readline() 
+		if line == b'': 
+			raise ConnectionError('the query server closed the connection') 
+		return json.loads(line) 
+	
+	
+	def close(self): 
+		self._file.close() 
+		self._socket.close() 
 	
 	
 def main(args): 
@@ -272,8 +1650,12 @@ def main(args):
 
 	# Iterate through arguments 
 	try:
-		short = 'w:q:t:d:b:'
-		long = ['verbose'] 
+		short = 'w:q:t:d:b:k:'
+		long = ['verbose', 'cache=', 'offline', 'pool-size=', 'batch=', 
+		        'scorer=', 'ranker=', 'k1=', 'b=', 'serve', 'socket=', 
+		        'stem-cache=', 'workers=', 'segment=', 'result-cache=', 
+		        'result-ttl=', 'persist-results', 'posting-cache=', 'update', 
+		        'delete=', 'compact', 'shards='] 
 		iterator = getopt.gnu_getopt(args, short, long)[0] 
 	except getopt.GetoptError as ex: 
 		eprint(f'Error: unrecognized argument specified "{ex.opt}"\n') 
@@ -286,6 +1668,28 @@ def main(args):
 	timeout = None 
 	database = None 
 	verbose = None
+	cache_directory = None 
+	offline = None 
+	pool_size = None 
+	batch_size = None 
+	scorer = None 
+	k = None 
+	ranker_name = None 
+	k1 = None 
+	b = None 
+	serve = None 
+	socket_path = None 
+	stem_cache_file = None 
+	workers = None 
+	segment_file = None 
+	result_cache_size = None 
+	result_ttl = None 
+	persist_results = None 
+	posting_cache_bytes = None 
+	update = None 
+	delete = None 
+	compact_index = None 
+	shard_count = None 
 	for option, value in iterator: 
 		if option == '-w': 
 			if website is not None: 
@@ -346,6 +1750,296 @@ def main(args):
 		elif option == '--verbose': 
 			verbose = True 
 		
+		elif option == '--cache': 
+			if cache_directory is not None: 
+				message =  'Error: only one argument can specify a cache '
+				message += 'directory\n' 
+				eprint(message) 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+			
+			cache_directory = value 
+		
+		elif option == '--offline': 
+			offline = True 
+		
+		elif option == '--pool-size': 
+			if pool_size is not None: 
+				message = 'Error: only one argument can specify a pool size\n' 
+				eprint(message) 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+			
+			try: 
+				pool_size = int(value) 
+			except ValueError: 
+				pool_size = 0 
+			
+			if pool_size <= 0: 
+				message = 'Error: pool size must be a positive integer, "'
+				message += str(value) + '" found\n'
+				eprint(message) 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+		
+		elif option == '--scorer': 
+			if scorer is not None: 
+				message = 'Error: only one argument can specify a scorer\n' 
+				eprint(message) 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+			
+			if value not in scorers: 
+				message = 'Error: scorer must be one of ' 
+				message += ', '.join(f'"{x}"' for x in scorers) 
+				message += f', "{value}" found\n' 
+				eprint(message) 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+			
+			if value == 'numpy' and not have_numpy: 
+				eprint('Error: the numpy scorer needs NumPy to be installed\n')
+				sys.exit(1) 
+			
+			scorer = value 
+		
+		elif option == '-k': 
+			if k is not None: 
+				eprint('Error: only one argument can specify a count\n') 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+			
+			try: 
+				k = int(value) 
+			except ValueError: 
+				k = 0 
+			
+			if k <= 0: 
+				message = 'Error: count must be a positive integer, "'
+				message += str(value) + '" found\n'
+				eprint(message) 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+		
+		elif option == '--ranker': 
+			if ranker_name is not None: 
+				message = 'Error: only one argument can specify a ranker\n' 
+				eprint(message) 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+			
+			if value not in rankers: 
+				message = 'Error: ranker must be one of ' 
+				message += ', '.join(f'"{x}"' for x in rankers) 
+				message += f', "{value}" found\n' 
+				eprint(message) 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+			
+			ranker_name = value 
+		
+		elif option == '--k1': 
+			if k1 is not None: 
+				eprint('Error: only one argument can specify k1\n') 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+			
+			try: 
+				k1 = float(value) 
+			except ValueError: 
+				k1 = -1 
+			
+			if not k1 >= 0 or math.isinf(k1): 
+				message = 'Error: k1 must be a non-negative number, "'
+				message += str(value) + '" found\n'
+				eprint(message) 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+		
+		elif option == '--b': 
+			if b is not None: 
+				eprint('Error: only one argument can specify b\n') 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+			
+			try: 
+				b = float(value) 
+			except ValueError: 
+				b = -1 
+			
+			if not 0 <= b <= 1: 
+				message = 'Error: b must be a number from 0 to 1, "'
+				message += str(value) + '" found\n'
+				eprint(message) 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+		
+		elif option == '--serve': 
+			serve = True 
+		
+		elif option == '--socket': 
+			if socket_path is not None: 
+				eprint('Error: only one argument can specify a socket\n') 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+			
+			socket_path = value 
+		
+		elif option == '--stem-cache': 
+			if stem_cache_file is not None: 
+				message =  'Error: only one argument can specify a stem cache ' 
+				message += 'file\n' 
+				eprint(message) 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+			
+			stem_cache_file = value 
+		
+		elif option == '--workers': 
+			if workers is not None: 
+				message =  'Error: only one argument can specify a number of '
+				message += 'workers\n' 
+				eprint(message) 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+			
+			try: 
+				workers = int(value) 
+			except ValueError: 
+				workers = 0 
+			
+			if workers <= 0: 
+				message = 'Error: workers must be a positive integer, "'
+				message += str(value) + '" found\n'
+				eprint(message) 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+		
+		elif option == '--segment': 
+			if segment_file is not None: 
+				eprint('Error: only one argument can specify a segment\n') 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+			
+			segment_file = value 
+		
+		elif option == '--result-cache': 
+			if result_cache_size is not None: 
+				message =  'Error: only one argument can specify a result ' 
+				message += 'cache size\n' 
+				eprint(message) 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+			
+			try: 
+				result_cache_size = int(value) 
+			except ValueError: 
+				result_cache_size = -1 
+			
+			if result_cache_size < 0: 
+				message = 'Error: result cache size must be a non-negative ' 
+				message += 'integer, "' + str(value) + '" found\n' 
+				eprint(message) 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+		
+		elif option == '--result-ttl': 
+			if result_ttl is not None: 
+				message =  'Error: only one argument can specify how long ' 
+				message += 'results are kept\n' 
+				eprint(message) 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+			
+			try: 
+				result_ttl = float(value) 
+			except ValueError: 
+				result_ttl = 0 
+			
+			if not result_ttl > 0: 
+				message = 'Error: result ttl must be a positive number, "'
+				message += str(value) + '" found\n'
+				eprint(message) 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+		
+		elif option == '--posting-cache': 
+			if posting_cache_bytes is not None: 
+				message =  'Error: only one argument can specify a posting ' 
+				message += 'cache size\n' 
+				eprint(message) 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+			
+			try: 
+				posting_cache_bytes = int(float(value) * 2 ** 20) 
+			except (ValueError, OverflowError): 
+				posting_cache_bytes = -1 
+			
+			if posting_cache_bytes < 0: 
+				message = 'Error: posting cache size must be a non-negative ' 
+				message += 'number, "' + str(value) + '" found\n' 
+				eprint(message) 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+		
+		elif option == '--persist-results': 
+			persist_results = True 
+		
+		elif option == '--update': 
+			update = True 
+		
+		elif option == '--delete': 
+			if delete is not None: 
+				message =  'Error: only one argument can specify websites to ' 
+				message += 'delete\n' 
+				eprint(message) 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+			
+			delete = value 
+		
+		elif option == '--compact': 
+			compact_index = True 
+		
+		elif option == '--shards': 
+			if shard_count is not None: 
+				message = 'Error: only one argument can specify a shard count\n' 
+				eprint(message) 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+			
+			try: 
+				shard_count = int(value) 
+			except ValueError: 
+				shard_count = 0 
+			
+			if shard_count <= 0: 
+				message = 'Error: shards must be a positive integer, "'
+				message += str(value) + '" found\n'
+				eprint(message) 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+		
+		elif option == '--batch': 
+			if batch_size is not None: 
+				message = 'Error: only one argument can specify a batch size\n'
+				eprint(message) 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+			
+			try: 
+				batch_size = int(value) 
+			except ValueError: 
+				batch_size = 0 
+			
+			if batch_size <= 0: 
+				message = 'Error: batch size must be a positive integer, "'
+				message += str(value) + '" found\n'
+				eprint(message) 
+				eprint(usage, do_color=False) 
+				sys.exit(1) 
+		
 		else:
 			eprint(f'Error: unrecognized argument specified "{ex.opt}"\n') 
 			eprint(usage, do_color=False) 
@@ -354,369 +2048,339 @@ def main(args):
 	# Default values 
 	if timeout is None: timeout = 5 
 	if verbose is None: verbose = False 
+	if offline is None: offline = False 
+	if pool_size is None: pool_size = default_pool_size 
+	if scorer is None: scorer = default_scorer 
+	if ranker_name is None: ranker_name = default_ranker 
+	if ranker_name != 'bm25' and (k1 is not None or b is not None): 
+		eprint('Error: k1 and b can only be given with the bm25 ranker\n') 
+		eprint(usage, do_color=False) 
+		sys.exit(1) 
+	if k1 is None: k1 = default_k1 
+	if b is None: b = default_b 
+	ranker = BM25(k1, b) if ranker_name == 'bm25' else rankers[ranker_name]() 
+	if offline and cache_directory is None: 
+		cache_directory = default_cache_directory 
 	
 	if database is None: database = default_database_file
 	elif database.lower() == 'null': database = null_database_file
 	
-	given_elements = sum(x is not None for x in (website, query, document))
+	given_elements = sum(x is not None for x in (website, query, document, \
+	                                             serve, delete, compact_index))
 	if given_elements > 1: 
-		message =  'Error: only one of the options among (-w, -q, -d) can be '
-		message += 'provided at a single time'
+		message =  'Error: only one of the options among (-w, -q, -d, --serve, '
+		message += '--delete, --compact) can be provided at a single time'
 		eprint(message) 
 		eprint(usage, do_color=False) 
 		sys.exit(1)
 	
 	if given_elements == 0: 
-		message =  'Error: either the website (-w), query (-q), or ' 
-		message += 'document (-d) flags must be present\n'
+		message =  'Error: either the website (-w), query (-q), document (-d), '
+		message += 'serve (--serve), delete (--delete) or compact (--compact) '
+		message += 'flags must be present\n'
 		eprint(message) 
 		eprint(usage, do_color=False)  
 		sys.exit(1) 
 		
 	stop_words = set(stopwords.words('english'))
-	stemmer = PorterStemmer() 
+	stemmer = StemCache(load_stemmer(), path=stem_cache_file) 
+	
+	if workers is not None and website is None and \
+	   (query is None or shard_count is None): 
+		message =  'Error: workers can only be given with a website (-w), or ' 
+		message += 'a query (-q) of shards\n' 
+		eprint(message) 
+		eprint(usage, do_color=False) 
+		sys.exit(1) 
+	
+	if socket_path is not None and serve is None: 
+		eprint('Error: a socket can only be given with --serve\n') 
+		eprint(usage, do_color=False) 
+		sys.exit(1) 
+	
+	if segment_file is not None and query is None and serve is None: 
+		message =  'Error: a segment can only be given with a query (-q) or ' 
+		message += '--serve\n' 
+		eprint(message) 
+		eprint(usage, do_color=False) 
+		sys.exit(1) 
+	
+	cache_options = (result_cache_size, result_ttl, persist_results) 
+	if any(x is not None for x in cache_options) and query is None and \
+	   serve is None: 
+		message =  'Error: results can only be cached with a query (-q) or ' 
+		message += '--serve\n' 
+		eprint(message) 
+		eprint(usage, do_color=False) 
+		sys.exit(1) 
+	
+	if persist_results and segment_file is not None: 
+		eprint('Error: results cannot be kept in a segment\n') 
+		eprint(usage, do_color=False) 
+		sys.exit(1) 
+	
+	if posting_cache_bytes is not None and serve is None: 
+		eprint('Error: postings can only be cached with --serve\n') 
+		eprint(usage, do_color=False) 
+		sys.exit(1) 
+	
+	if posting_cache_bytes is not None and segment_file is not None: 
+		eprint('Error: postings of a segment are not cached\n') 
+		eprint(usage, do_color=False) 
+		sys.exit(1) 
+	
+	if update and website is None and document is None: 
+		message =  'Error: update can only be given with a website (-w) or ' 
+		message += 'document (-d)\n' 
+		eprint(message) 
+		eprint(usage, do_color=False) 
+		sys.exit(1) 
+	
+	if update and (batch_size is not None or workers is not None): 
+		eprint('Error: websites cannot be updated in batches\n') 
+		eprint(usage, do_color=False) 
+		sys.exit(1) 
+	
+	if shard_count is not None and (serve or segment_file is not None): 
+		eprint('Error: shards can only be queried with a query (-q)\n') 
+		eprint(usage, do_color=False) 
+		sys.exit(1) 
+	
+	if shard_count is not None and (update or persist_results): 
+		eprint('Error: shards cannot be updated or keep results\n') 
+		eprint(usage, do_color=False) 
+		sys.exit(1) 
 	
-	if query is not None and not os.path.isfile(database): 
+	if result_cache_size is None: result_cache_size = default_result_cache_size
+	if result_ttl is None: result_ttl = default_result_ttl 
+	if posting_cache_bytes is None: 
+		posting_cache_bytes = default_posting_cache_bytes 
+	
+	# The files the index is kept in 
+	if shard_count is None: 
+		database_files = [database] 
+	else: 
+		from shard import shard_file 
+		database_files = [shard_file(database, x) for x in range(shard_count)]
+	
+	if (query is not None or serve or delete is not None or compact_index) \
+	   and segment_file is None and \
+	   not all(os.path.isfile(x) for x in database_files): 
 		# User wants to query from a database that doesn't exist. 
 		eprint('Error: no index found. Index at least one valid website.')
 		sys.exit(1) 
 	
-	# Open connection to the database
-	con = sqlite3.connect(database)
+	cache = None 
+	if cache_directory is not None: 
+		try: 
+			cache = ResponseCache(cache_directory) 
+		except (OSError, sqlite3.Error): 
+			eprint(f'Error: cannot open cache directory "{cache_directory}"') 
+			sys.exit(1) 
+	fetcher = Fetcher(timeout, cache, offline, pool_size) 
+	
+	segment = None 
+	if segment_file is not None: 
+		from segment import Segment 
+		try: 
+			segment = Segment(segment_file) 
+		except (OSError, ValueError) as ex: 
+			eprint(f'Error: cannot read segment "{segment_file}" ({ex})') 
+			sys.exit(1) 
+	
+	# Open connection to the database (an empty one in memory if queries are 
+	# answered from a segment or the index is in shards, so that the database
+	# isn't created) 
+	con = sqlite3.connect(database if segment is None and shard_count is None \
+	                      else ':memory:')
 	cur = con.cursor()
+	check_schema(cur, database) 
+	
+	# Every database written into: the database, or each shard (queries of 
+	# shards open them in the processes answering them) 
+	connections = [con] 
+	if shard_count is not None and query is None: 
+		connections = [sqlite3.connect(x) for x in database_files] 
+		for shard_con, shard_name in zip(connections, database_files): 
+			check_schema(shard_con.cursor(), shard_name) 
+	cursors = [x.cursor() for x in connections] 
+	
+	indexer = None 
+	if shard_count is not None and (website is not None or \
+	                                document is not None): 
+		from shard import ShardedIndexer 
+		indexer = ShardedIndexer(connections, batch_size or default_batch_size)
+	elif batch_size is not None and (website is not None or \
+	                                 document is not None): 
+		indexer = BulkIndexer(con, batch_size) 
+	elif workers is not None: 
+		# Workers only hand back stems, which are written in batches 
+		indexer = BulkIndexer(con) 
+	
+	# A query on its own can only use results kept in the database 
+	results = None 
+	if (serve or persist_results) and result_cache_size > 0: 
+		results = ResultCache(result_cache_size, result_ttl, \
+		                      cur if persist_results else None) 
+	
+	if query is not None and shard_count is not None: 
+		from shard import ShardedIndex 
+		sharded = ShardedIndex(database, shard_count, workers) 
+		sharded.check() 
+		websites = sharded.rank(query, stop_words, stemmer, scorer, k, ranker)
+		print_websites(sharded, websites, verbose) 
+		sharded.close() 
 	
-	if query is not None: 
-		query_websites(cur, query, stop_words, stemmer, verbose) 
+	elif query is not None: 
+		query_websites(cur if segment is None else segment, query, stop_words, \
+		               stemmer, verbose, scorer, k, ranker, results) 
+	
+	elif serve: 
+		as_reader(cur if segment is None else segment).check() 
+		postings = None 
+		if segment is None and posting_cache_bytes > 0: 
+			postings = PostingCache(posting_cache_bytes) 
+		server = QueryServer(con, stop_words, stemmer, scorer, k, ranker, \
+		                     segment, results, postings) 
+		if socket_path is None: 
+			server.serve(sys.stdin, sys.stdout) 
+		else: 
+			try: 
+				listener = server.listen(socket_path) 
+			except OSError as ex: 
+				eprint(f'Error: cannot listen on "{socket_path}" ({ex})') 
+				sys.exit(1) 
+			if verbose: 
+				print(f'Listening on {socket_path}', flush=True) 
+			# Stopped with Ctrl-C or kill, either way removing the socket 
+			signal.signal(signal.SIGTERM, lambda *_: sys.exit(0)) 
+			try: 
+				listener.serve_forever() 
+			except KeyboardInterrupt: 
+				pass 
+			finally: 
+				listener.server_close() 
+				os.remove(socket_path) 
+				if verbose and results is not None: 
+					print(results.stats()) 
+				if verbose and postings is not None: 
+					print(postings.stats()) 
 	
 	elif website is not None: 
 		# Interpret the website as a file to a line-separated list of websites. 
 		try: 
 			website_file = open(website, 'r') 
-			for website in website_file.readlines():
-				process_document(cur, database, website, stop_words, stemmer, \
-				                 timeout, verbose)
+			websites = website_file.readlines() 
 			website_file.close() 
 		except OSError: 
+			websites = None 
+		
+		if websites is None: 
 			# If the open statement failed, then interpret it as a plain website
 			# instead. 
 			process_document(cur, database, website, stop_words, stemmer, \
-			                 timeout, verbose)
+			                 fetcher, verbose, indexer, update=update)
+		elif workers is not None: 
+			process_documents(database, websites, fetcher, verbose, indexer, \
+			                  workers, stem_cache_file) 
+		else: 
+			# Shared, so that each stem is only looked up once for the list
+			lexicon = Lexicon(cur) 
+			for website in websites: 
+				process_document(cur, database, website, stop_words, stemmer, \
+				                 fetcher, verbose, indexer, lexicon, update)
 			
 	elif document is not None: 
 		process_document(cur, database, document, stop_words, stemmer, \
-		                 timeout, verbose)
+		                 fetcher, verbose, indexer, update=update)
+	
+	elif delete is not None: 
+		from shard import shard_of 
+		for shard_cur in cursors: 
+			create_tables(shard_cur) 
+		
+		# A document indexed with -d is deleted by its name. Anything else is 
+		# interpreted as a file to a line-separated list of websites, as with 
+		# -w, or else as a plain website. 
+		delete = delete.strip() 
+		urls = [delete] 
+		if not website_exists(cursors[shard_of(delete, len(cursors))], delete):
+			try: 
+				with open(delete, 'r') as website_file: 
+					urls = website_file.readlines() 
+			except OSError: 
+				pass 
+		
+		for url in urls: 
+			url = url.strip() 
+			if verbose: 
+				print(f'Deleting "{url}" ... ', flush=True, end='') 
+			shard_cur = cursors[shard_of(url, len(cursors))] 
+			deleted = website_delete(shard_cur, url) 
+			if verbose and deleted: 
+				print(Fore.CYAN + 'Done' + Style.RESET_ALL) 
+			elif verbose: 
+				print(Fore.YELLOW + 'Failed (not indexed)' + Style.RESET_ALL) 
+	
+	elif compact_index: 
+		for shard_cur in cursors: 
+			compact(shard_cur) 
+	
+	# Updates and deletes leave postings behind, which are removed all at once
+	# when there are enough of them 
+	for shard_cur in cursors: 
+		if (update or delete is not None) and compaction_due(shard_cur): 
+			if verbose: 
+				print('Compacting the index ... ', flush=True, end='') 
+			compact(shard_cur) 
+			if verbose: 
+				print(Fore.CYAN + 'Done' + Style.RESET_ALL) 
 						 
+	if indexer is not None and len(indexer) > 0: 
+		if verbose: 
+			message = f'Writing {len(indexer)} websites into {database} ... '
+			print(message, flush=True, end='') 
+		indexer.flush() 
+		if verbose: 
+			print(Fore.CYAN + 'Done' + Style.RESET_ALL) 
+	
 	if document is not None or website is not None:
-		check_valid_websites(cur) 
-		website_size = cur.execute('SELECT COUNT(*) FROM website').fetchone()[0]
-		tokens_size = cur.execute('SELECT COUNT(*) FROM token').fetchone()[0]
+		# Shards may well be empty, as long as one isn't 
+		if shard_count is None: 
+			check_valid_websites(cur) 
+		website_size = sum(x.execute('SELECT COUNT(*) FROM website') 
+		                   .fetchone()[0] for x in cursors) 
+		tokens_size = sum(x.execute('SELECT COUNT(*) FROM token') 
+		                  .fetchone()[0] for x in cursors) 
 		print('Table(website) size:', website_size) 
 		print('Table(token) size:', tokens_size) 
 	
-	con.commit()
+	if verbose and website is not None: 
+		print(fetcher.stats()) 
+	if verbose and query is not None and results is not None: 
+		print(results.stats()) 
+	# Workers stem with caches of their own, which aren't counted 
+	if verbose and (website is not None or document is not None) and \
+	   workers is None: 
+		print(stemmer.stats()) 
+	
+	try: 
+		stemmer.save() 
+	except OSError: 
+		eprint(f'Error: cannot write stem cache file "{stem_cache_file}"') 
+	
+	for shard_con in connections: 
+		shard_con.commit() 
+		shard_con.close() 
 	con.close() 
+	fetcher.close() 
+	if segment is not None: 
+		segment.close() 
 	
 	if database == null_database_file:
-		os.system('rm ' + null_database_file) 
-
-
-# Boilerplate tests that verify command-line arguments, where the key is the
-# name of the test and the value is the arguments supplied.
-cla_tests = {                                                                  \
-'no_args':                                                                     \
-	'index.py',                                                                \
-'no_main_direction':                                                           \
-	'index.py -t 5 -b output.txt',                                             \
-'multiple_main_direction':                                                     \
-	'index.py -w "http://example.com/" -q test',                               \
-'unknown_single_option_1':                                                     \
-	'index.py -z',                                                             \
-'unknown_single_option_2':                                                     \
-	'index.py --z',                                                            \
-'unknown_double_option':                                                       \
-	'index.py -z test',                                                        \
-'missing_document':                                                            \
-	'index.py -d "data/this-file-should-not-exist.txt"',                       \
-'missing_database':                                                            \
-	'index.py -q test -b data/this-database-should-not-exist.txt',             \
-'timeout_not_numeric':                                                         \
-	'index.py -w "http://example.com/" -t test',                               \
-'timeout_negative':                                                            \
-	'index.py -w "http://example.com/" -t -3.14',                              \
-'multiple_website_specified':                                                  \
-	'index.py -w "http://example.com/" -w "http://example.com/"',              \
-'multiple_query_specified':                                                    \
-	'index.py -q "test" -q "test"',                                            \
-'multiple_document_specified':                                                 \
-	'index.py -d "data/document-1.txt" -d "data/document-2.txt"',              \
-'multiple_database_specified':                                                 \
-	'index.py -w "http://example.com/" -b "null" -b "null"',                   \
-'multiple_timeout_specified':                                                  \
-	'index.py -w "http://example.com/" -t 5 -t 10',                            \
-'verbose_misspelled':                                                          \
-	'index.py -w "http://example.com/" --verbosee'                             \
-}
-
-
-# Collection of simple tests that should all return SystemExit signals (due to
-# sys.exit(1) calls) due to poor formatting of the command-line arguments. 
-class CommandLineArgumentTest(unittest.TestCase):
-	# Runs each test case in cla_tests
-	@parameterized.expand(cla_tests.items())
-	def test_cla(self, name, args): 
-		with self.assertRaises(SystemExit) as cm: 
-			main(args)
-
-
-# Collection of more complicated tests that have internal logic in them. 
-class UniqueTests(unittest.TestCase):
-	@classmethod
-	def setUpClass(cls): 
-		cls.test_table = 'data/unit-test-table.db'
-	
-	
-	@classmethod
-	def remove_test_table(cls):
-		os.system('rm -f ' + cls.test_table)
-		
-		
-	@classmethod
-	def tearDownClass(cls):
-		cls.remove_test_table()
-	
-	
-	# Test that a null database does not create a table at the default location
-	def test_null_database(self): 
-		args = 'index.py -w "https://example.com/" -b null'
-		main(args)
-		self.assertFalse(os.path.isfile(null_database_file))
-	
-	
-	# Test that websites will correctly timeout
-	def test_timeout(self):
-		args = 'index.py -w "http://example.com/" -t 0.0001 -b null --verbose'
-		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
-			try:
-				main(args)
-				self.fail('No exception raised for empty database')
-			except SystemExit as ex: 
-				message = 'Network is unreachable' 
-				self.assertRegex(fake_out.getvalue(), message)
-		
-		
-	# Test that the size of the database changes after each indexing of a 
-	# document
-	def test_document_database_increase(self): 
-		args = 'index.py -d "%s" -b ' + self.test_table 
-		doc_1 = 'data/documents/information-processing.txt' 
-		doc_2 = 'data/documents/nintendogs.txt' 
-		website_regex = r'Table\(website\) size: ([0-9]+)'
-		token_regex = r'Table\(token\) size: ([0-9]+)'
-		
-		self.remove_test_table()
-		
-		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
-			main(args % doc_1)
-			out = fake_out.getvalue()
-			start_website_size = re.search(website_regex, out).group(1)
-			start_token_size = re.search(token_regex, out).group(1)
-			
-		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out: 
-			main(args % doc_2)
-			out = fake_out.getvalue() 
-			end_website_size = re.search(website_regex, out).group(1)
-			end_token_size = re.search(token_regex, out).group(1)
-					
-		try: 
-			start_website_size = int(start_website_size) 
-			start_token_size = int(start_token_size) 
-			end_website_size = int(end_website_size) 
-			end_token_size = int(end_token_size) 
-		except ValueError: 
-			self.fail('Website/token regex did not match')
-			
-		self.assertGreater(end_website_size, start_website_size) 
-		self.assertGreater(end_token_size, start_token_size)
-
-
-	# Test that a website-collection that contains both unique websites and 
-	# unique documents are each indexed. 
-	def test_index_document_multi(self): 
-		args = 'index.py -w "data/links/multi-document.txt" -b null' 
-		website_regex = r'Table\(website\) size: ([0-9]+)'
-		
-		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out: 
-			main(args)
-			out = fake_out.getvalue() 
-			website_size = re.search(website_regex, out).group(1) 
-			self.assertEquals(website_size, '3') # 3 docs in collection 
-
-
-	# Test that the size of the database changes after each indexing of a 
-	# website
-	def test_website_database_increase(self): 
-		args = 'index.py -w "%s" -b ' + self.test_table 
-		link_1 = 'https://en.wikipedia.org/wiki/Computer_science' 
-		link_2 = 'https://en.wikipedia.org/wiki/Nintendogs' 
-		website_regex = r'Table\(website\) size: ([0-9]+)'
-		token_regex = r'Table\(token\) size: ([0-9]+)'
-		
-		self.remove_test_table()
-		
-		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
-			main(args % link_1)
-			out = fake_out.getvalue()
-			start_website_size = re.search(website_regex, out).group(1)
-			start_token_size = re.search(token_regex, out).group(1)
-			
-		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out: 
-			main(args % link_2)
-			out = fake_out.getvalue() 
-			end_website_size = re.search(website_regex, out).group(1)
-			end_token_size = re.search(token_regex, out).group(1)
-					
-		try: 
-			start_website_size = int(start_website_size) 
-			start_token_size = int(start_token_size) 
-			end_website_size = int(end_website_size) 
-			end_token_size = int(end_token_size) 
-		except ValueError: 
-			self.fail('Website/token regex did not match')
-			
-		self.assertGreater(end_website_size, start_website_size) 
-		self.assertGreater(end_token_size, start_token_size)
-	
-	
-	# Tests that a query returns the expected documents
-	def test_document_query(self): 
-		insert_args = 'index.py -d "%s" -b ' + self.test_table 
-		query_args = 'index.py -q "%s" -b ' + self.test_table
-		doc_1 = 'data/documents/information-processing.txt'
-		doc_2 = 'data/documents/nintendogs.txt'
-		doc_1_unique_query = 'telecommunications' 
-		doc_2_unique_query = 'dog' 
-		doc_general_query = 'microphone'
-		website_regex = r'Table\(website\) size: ([0-9]+)'
-		
-		self.remove_test_table() 
-		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
-			main(insert_args % doc_1) 
-			out = fake_out.getvalue() 
-			doc_1_index = re.search(website_regex, out).group(1)
-		
-		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
-			main(insert_args % doc_2) 
-			out = fake_out.getvalue() 
-			doc_2_index = re.search(website_regex, out).group(1)
-			
-		try: 
-			doc_1_index = str(int(doc_1_index) - 1)
-			doc_2_index = str(int(doc_2_index) - 1)
-		except ValueError: 
-			self.fail('Website/token regex did not match')
-			
-		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
-			main(query_args % doc_1_unique_query)
-			out = fake_out.getvalue().strip()
-			self.assertTrue(doc_1_index in out.split(';'))
-		
-		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
-			main(query_args % doc_2_unique_query) 
-			out = fake_out.getvalue().strip() 
-			self.assertTrue(doc_2_index in out.split(';'))
-			
-		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
-			main(query_args % doc_general_query) 
-			out = fake_out.getvalue().strip()
-			indices = out.split(';') 
-			self.assertTrue(doc_1_index in indices and doc_2_index in indices)
-	
-	
-	# Tests that documents are ranked in the correct order given single-word 
-	# queries
-	def test_document_rank_single(self): 
-		insert_args = 'index.py -d "%s" -b ' + self.test_table 
-		query_args = 'index.py -q "%s" -b ' + self.test_table
-		doc_1 = 'data/documents/information-processing.txt'
-		doc_2 = 'data/documents/nintendogs.txt'
-		doc_1_relevancy_query = 'information'
-		doc_2_relevancy_query = 'microphone'
-		website_regex = r'Table\(website\) size: ([0-9]+)'
-		
-		self.remove_test_table() 
-		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
-			main(insert_args % doc_1) 
-			out = fake_out.getvalue() 
-			doc_1_index = re.search(website_regex, out).group(1)
-		
-		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
-			main(insert_args % doc_2) 
-			out = fake_out.getvalue()
-			doc_2_index = re.search(website_regex, out).group(1)
-		
-		try: 
-			doc_1_index = str(int(doc_1_index) - 1)
-			doc_2_index = str(int(doc_2_index) - 1)
-		except ValueError: 
-			self.fail('Website/token regex did not match')
-		
-		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
-			main(query_args % doc_1_relevancy_query)
-			out = fake_out.getvalue().strip()
-			indices = out.split(';') 
-			self.assertTrue(doc_1_index in indices and doc_2_index in indices)
-			self.assertLess(out.index(doc_1_index), out.index(doc_2_index)) 
-		
-		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
-			main(query_args % doc_2_relevancy_query)
-			out = fake_out.getvalue().strip() 
-			indices = out.split(';') 
-			self.assertTrue(doc_1_index in indices and doc_2_index in indices)
-			self.assertLess(out.index(doc_2_index), out.index(doc_1_index))
-			
-			
-	# Tests that documents are ranked in the correct order given multi-word 
-	# queries
-	def test_document_rank_multi(self): 
-		insert_args = 'index.py -d "%s" -b ' + self.test_table 
-		query_args = 'index.py -q "%s" -b ' + self.test_table
-		doc_1 = 'data/documents/information-processing.txt'
-		doc_2 = 'data/documents/nintendogs.txt'
-		doc_1_relevancy_query = 'what is the study of information and algorithm'
-		doc_2_relevancy_query = 'what information gets me better dogs'
-		website_regex = r'Table\(website\) size: ([0-9]+)'
-		
-		self.remove_test_table() 
-		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
-			main(insert_args % doc_1) 
-			out = fake_out.getvalue() 
-			doc_1_index = re.search(website_regex, out).group(1)
-		
-		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
-			main(insert_args % doc_2) 
-			out = fake_out.getvalue()
-			doc_2_index = re.search(website_regex, out).group(1)
-		
-		try: 
-			doc_1_index = str(int(doc_1_index) - 1)
-			doc_2_index = str(int(doc_2_index) - 1)
-		except ValueError: 
-			self.fail('Website/token regex did not match')
-		
-		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
-			main(query_args % doc_1_relevancy_query)
-			out = fake_out.getvalue().strip()
-			indices = out.split(';') 
-			self.assertTrue(doc_1_index in indices and doc_2_index in indices)
-			self.assertLess(out.index(doc_1_index), out.index(doc_2_index)) 
-		
-		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
-			main(query_args % doc_2_relevancy_query)
-			out = fake_out.getvalue().strip() 
-			indices = out.split(';') 
-			self.assertTrue(doc_1_index in indices and doc_2_index in indices)
-			self.assertLess(out.index(doc_2_index), out.index(doc_1_index))
-	
+		for name in database_files: 
+			os.system('rm ' + name) 
+
 
 if __name__ == '__main__': 
 	main(sys.argv) 
\ No newline at end of file
@@ -0,0 +1,408 @@
+import sys
+import os
+import io
+import re
+import getopt
+import hashlib
+import sqlite3
+import tempfile
+import unittest
+import unittest.mock
+from collections import defaultdict
+from parameterized import parameterized
+from colorama import Fore, Style
+
+import index
+
+
+usage = f'''\
+Usage:
+    python3 migrate.py <database> [--verbose]
+
+Upgrades a database written by an older version of index.py to the current
+version ({index.schema_version}), in place. Databases that are already
+current are left alone.
+
+Options:
+    <database>: (string) File the database is in, e.g.
+        "{index.default_database_file}".
+    verbose: Prints each step to stdout.
+'''
+
+
+# Prints to stderr instead of stdout.
+#   <do_color>: whether or not to color the output red. Default is True
+def eprint(*args, **kwargs):
+	if 'do_color' in kwargs:
+		do_color = kwargs['do_color']
+		kwargs.pop('do_color')
+	else:
+		do_color = True
+
+	if do_color:
+		print(Fore.RED, end='', flush=True) # Flushing required here
+
+	print(*args, file=sys.stderr, **kwargs)
+
+	if do_color:
+		print(Style.RESET_ALL, end='', flush=True)
+
+
+# Returns the names of the tables in the database behind <cur>.
+def table_names(cur):
+	command = 'SELECT name FROM sqlite_master WHERE type = "table"'
+	return [x[0] for x in cur.execute(command).fetchall()]
+
+
+# How versions before 5 numbered stems: by a hash of their text, so two stems
+# could end up with the same number. 
+def stem_to_int(stem):
+	return int(hashlib.sha1(bytes(stem, 'utf-8')).hexdigest(), 16) % 1000000000
+
+
+# Version 0 to 1: each stem's websites were kept as one semicolon-separated
+# string in token.doc, with no frequencies. They move into the posting table,
+# one row per stem per website, with frequencies from website.data; token
+# keeps each stem's document frequency instead.
+def migrate_1(cur):
+	tables = table_names(cur)
+	if 'token' in tables:
+		cur.execute('DROP TABLE token')
+	cur.execute('CREATE TABLE IF NOT EXISTS website('
+	            'id INTEGER PRIMARY KEY, url TEXT UNIQUE, m INTEGER, '
+	            'data TEXT)')
+	cur.execute('CREATE TABLE token(stem INTEGER PRIMARY KEY, df INTEGER)')
+	cur.execute('CREATE TABLE posting(stem INTEGER, doc INTEGER, tf INTEGER, '
+	            'PRIMARY KEY (stem, doc)) WITHOUT ROWID')
+
+	websites = cur.execute('SELECT id, data FROM website').fetchall()
+	for website_id, data in websites:
+		stems = defaultdict(lambda: 0)
+		for item in data.split(','):
+			stem, frequency = item.split(':')
+			stems[stem_to_int(stem)] += int(frequency)
+		cur.executemany('INSERT INTO posting VALUES(?, ?, ?)',
+		                ((stem, website_id, tf) for stem, tf in stems.items()))
+
+	cur.execute('INSERT INTO token '
+	            'SELECT stem, COUNT(*) FROM posting GROUP BY stem')
+
+
+# Version 1 to 2: the number of websites is stored instead of being counted
+# for every query. (This version also stored each website's norm, which no
+# ranker ever read; databases upgraded from before it never get one, and
+# migrate_8 removes it from the others.)
+def migrate_2(cur):
+	cur.execute('CREATE TABLE statistic(name TEXT PRIMARY KEY, value INTEGER)')
+	cur.execute('INSERT INTO statistic '
+	            'SELECT "websites", COUNT(*) FROM website')
+
+
+# Version 2 to 3: each stem keeps the largest tf/m it has in any website, so
+# that queries can tell what it could add to a score without reading it.
+def migrate_3(cur):
+	cur.execute('ALTER TABLE token ADD COLUMN bound REAL')
+	cur.execute('UPDATE token SET bound = ('
+	            'SELECT MAX(CAST(posting.tf AS REAL) / website.m) '
+	            'FROM posting JOIN website ON website.id = posting.doc '
+	            'WHERE posting.stem = token.stem)')
+
+
+# Version 3 to 4: each website's length (how many stems it has, counting 
+# repeats) and the sum of them are stored for BM25. 
+def migrate_4(cur):
+	cur.execute('ALTER TABLE website ADD COLUMN length INTEGER')
+	websites = cur.execute('SELECT id, data FROM website').fetchall()
+	for website_id, data in websites:
+		length = sum(int(item.split(':')[1]) for item in data.split(','))
+		cur.execute('UPDATE website SET length = ? WHERE id = ?',
+		            (length, website_id))
+
+	cur.execute('INSERT INTO statistic '
+	            "SELECT 'length', SUM(length) FROM website")
+
+
+# Version 4 to 5: stems are numbered 1, 2, 3 ... in the order they were first
+# indexed, kept in the new lexicon table, instead of by stem_to_int. The token
+# and posting tables are rebuilt from website.data with the new numbers, which
+# also pulls apart stems that stem_to_int had merged.
+def migrate_5(cur):
+	cur.execute('CREATE TABLE lexicon(id INTEGER PRIMARY KEY, stem TEXT UNIQUE)')
+	cur.execute('DELETE FROM posting')
+	cur.execute('DELETE FROM token')
+
+	lexicon = index.Lexicon(cur)
+	websites = cur.execute('SELECT id, data FROM website ORDER BY id').fetchall()
+	for website_id, data in websites:
+		stems = {}
+		for item in data.split(','):
+			stem, frequency = item.split(':')
+			stems[stem] = int(frequency)
+		cur.executemany('INSERT INTO posting VALUES(?, ?, ?)',
+		                ((stem_id, website_id, tf) for stem_id, tf
+		                 in index.stem_ids(stems, lexicon).items()))
+
+	cur.execute('INSERT INTO token '
+	            'SELECT posting.stem, COUNT(*), '
+	            'MAX(CAST(posting.tf AS REAL) / website.m) '
+	            'FROM posting JOIN website ON website.id = posting.doc '
+	            'GROUP BY posting.stem')
+
+
+# Version 5 to 6: postings keep where each stem is found in the website, for
+# phrase queries. Earlier versions never kept positions, so the websites they
+# indexed get none and only match phrases once they are indexed again.
+def migrate_6(cur):
+	cur.execute('ALTER TABLE posting ADD COLUMN positions BLOB')
+
+
+# Version 6 to 7: websites keep a hash of their text, so that indexing them
+# again with --update skips those that haven't changed, and websites can be
+# deleted (see index.tombstone_create_table). Websites indexed before have no
+# hash and are always updated.
+def migrate_7(cur):
+	cur.execute('ALTER TABLE website ADD COLUMN hash TEXT')
+	cur.execute('CREATE TABLE tombstone(id INTEGER PRIMARY KEY)')
+
+
+# Version 7 to 8: websites no longer keep a norm, which no ranker read. The
+# table is written again without it, as SQLite before 3.35 cannot drop a
+# column.
+def migrate_8(cur):
+	cur.execute('ALTER TABLE website RENAME TO old_website')
+	index.website_create_table(cur)
+	cur.execute('INSERT INTO website '
+	            'SELECT id, url, m, data, length, hash FROM old_website')
+	cur.execute('DROP TABLE old_website')
+
+
+# The migration that brings a database up to each version, in order.
+migrations = {
+	1: migrate_1,
+	2: migrate_2,
+	3: migrate_3,
+	4: migrate_4,
+	5: migrate_5,
+	6: migrate_6,
+	7: migrate_7,
+	8: migrate_8,
+}
+
+
+# Upgrades the database behind <con> to index.schema_version, one version at a
+# time. Each step is one transaction, so an interrupted upgrade leaves the
+# database at the last version it finished.
+def migrate(con, verbose):
+	cur = con.cursor()
+	version = cur.execute('PRAGMA user_version').fetchone()[0]
+	if version > index.schema_version:
+		return False
+	if version == index.schema_version:
+		return True
+
+	while version < index.schema_version:
+		version += 1
+		if verbose:
+			print(f'Upgrading to version {version} ... ', flush=True, end='')
+		cur.execute('BEGIN')
+		try:
+			migrations[version](cur)
+			cur.execute(f'PRAGMA user_version = {version}')
+			cur.execute('COMMIT')
+		except BaseException:
+			cur.execute('ROLLBACK')
+			raise
+		if verbose:
+			print(Fore.CYAN + 'Done' + Style.RESET_ALL)
+
+	# Space freed by the old tables is given back to the file system
+	cur.execute('VACUUM')
+	return True
+
+
+def main(args):
+	# For ease of testing, this turns command-line arguments passed as a string
+	# into something more traditionally used with sys.argv
+	if isinstance(args, str):
+		args = re.findall(r'("[^"]+"|[^\s"]+)', args)
+		args = [
+			arg[1:-1] if arg[0] == arg[-1] and arg[0] in ('\'', '"')
+			else arg for arg in args
+		]
+
+	try:
+		options, rest = getopt.gnu_getopt(args[1:], '', ['verbose'])
+	except getopt.GetoptError as ex:
+		eprint(f'Error: unrecognized argument specified "{ex.opt}"\n')
+		eprint(usage, do_color=False)
+		sys.exit(1)
+
+	if len(rest) != 1:
+		eprint(f'Error: expected 1 argument, found {len(rest)}\n')
+		eprint(usage, do_color=False)
+		sys.exit(1)
+
+	database = rest[0]
+	verbose = any(option == '--verbose' for option, _ in options)
+	if not os.path.isfile(database):
+		eprint(f'Error: database "{database}" does not exist')
+		sys.exit(1)
+
+	con = sqlite3.connect(database, isolation_level=None)
+	try:
+		if not migrate(con, verbose):
+			message =  f'Error: "{database}" was written by a newer version '
+			message += 'of index.py'
+			eprint(message)
+			sys.exit(1)
+	except sqlite3.Error as ex:
+		eprint(f'Error: cannot upgrade "{database}" ({ex})')
+		sys.exit(1)
+	finally:
+		con.close()
+
+
+# Boilerplate tests that verify command-line arguments, where the key is the
+# name of the test and the value is the arguments supplied.
+cla_tests = {                                                                  \
+'no_args':                                                                     \
+	'migrate.py',                                                              \
+'too_many_args':                                                               \
+	'migrate.py data/table.db data/null.db',                                   \
+'unknown_option':                                                              \
+	'migrate.py data/table.db -q',                                             \
+'missing_database':                                                            \
+	'migrate.py data/this-database-should-not-exist.db'                        \
+}
+
+
+# Collection of simple tests that should all return SystemExit signals (due to
+# sys.exit(1) calls) due to poor formatting of the command-line arguments.
+class CommandLineArgumentTest(unittest.TestCase):
+	# Runs each test case in cla_tests
+	@parameterized.expand(cla_tests.items())
+	def test_cla(self, name, args):
+		with self.assertRaises(SystemExit) as cm:
+			main(args)
+
+
+# Tests for upgrading databases written by earlier versions of index.py.
+class MigrateTests(unittest.TestCase):
+	documents = ['data/documents/information-processing.txt',
+	             'data/documents/nintendogs.txt']
+
+
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		self.current = os.path.join(self.directory.name, 'current.db')
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()):
+			for document in self.documents:
+				index.main(f'index.py -d {document} -b {self.current}')
+
+
+	def tearDown(self):
+		self.directory.cleanup()
+
+
+	# Returns the contents of every table in <database>.
+	def dump(self, database):
+		con = sqlite3.connect(database)
+		cur = con.cursor()
+		tables = {}
+		for name in table_names(cur):
+			# In order of the first two columns (or the only one)
+			width = len(cur.execute(f'PRAGMA table_info({name})').fetchall())
+			order = ', '.join(str(x + 1) for x in range(min(width, 2)))
+			command = f'SELECT * FROM {name} ORDER BY {order}'
+			tables[name] = cur.execute(command).fetchall()
+		# The generation counts writes rather than what was written, so a
+		# migrated database need not have the same one
+		if 'statistic' in tables:
+			tables['statistic'] = [x for x in tables['statistic']
+			                       if x[0] != 'generation']
+		# Nor can positions be recovered for websites indexed before them
+		if 'posting' in tables:
+			tables['posting'] = [x[:3] for x in tables['posting']]
+		# or hashes of their text
+		if 'website' in tables:
+			tables['website'] = [x[:5] for x in tables['website']]
+		version = cur.execute('PRAGMA user_version').fetchone()[0]
+		con.close()
+		return tables, version
+
+
+	# Writes the same websites as self.current into a new database the way
+	# version 0 of index.py stored them, returning its file name.
+	def version_0(self):
+		old = os.path.join(self.directory.name, 'old.db')
+		con = sqlite3.connect(old)
+		con.execute('CREATE TABLE website(id INTEGER PRIMARY KEY, '
+		            'url TEXT UNIQUE, m INTEGER, data TEXT)')
+		con.execute('CREATE TABLE token(stem INTEGER PRIMARY KEY, doc TEXT)')
+		websites = self.dump(self.current)[0]['website']
+		postings = defaultdict(list)
+		for row in websites:
+			con.execute('INSERT INTO website VALUES(?, ?, ?, ?)', row[:4])
+			for item in row[3].split(','):
+				stem = stem_to_int(item.split(':')[0])
+				postings[stem].append(str(row[0]))
+		con.executemany('INSERT INTO token VALUES(?, ?)',
+		                ((x, ';'.join(y)) for x, y in postings.items()))
+		con.commit()
+		con.close()
+		return old
+
+
+	# Tests that an upgraded database is the same as one written by the
+	# current version
+	def test_version_0(self):
+		old = self.version_0()
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()):
+			main(f'migrate.py {old}')
+		self.assertEqual(self.dump(old), self.dump(self.current))
+		self.assertEqual(self.dump(old)[1], index.schema_version)
+
+
+	# Tests that the norm kept by versions 2 to 7 is dropped without changing
+	# anything else
+	def test_version_7(self):
+		old = os.path.join(self.directory.name, 'old.db')
+		con = sqlite3.connect(old)
+		con.execute(f'ATTACH "{self.current}" AS current')
+		con.execute('CREATE TABLE website(id INTEGER PRIMARY KEY, '
+		            'url TEXT UNIQUE, m INTEGER, data TEXT, norm REAL, '
+		            'length INTEGER, hash TEXT)')
+		con.execute('INSERT INTO website SELECT id, url, m, data, 1.5, length, '
+		            'hash FROM current.website')
+		command = 'SELECT name, sql FROM current.sqlite_master ' \
+		          'WHERE type = "table" AND name != "website"'
+		for name, sql in con.execute(command).fetchall():
+			con.execute(sql)
+			con.execute(f'INSERT INTO {name} SELECT * FROM current.{name}')
+		con.execute('PRAGMA user_version = 7')
+		con.commit()
+		con.close()
+
+		main(f'migrate.py {old}')
+		self.assertEqual(self.dump(old), self.dump(self.current))
+
+
+	# Tests that index.py refuses old databases until they are upgraded, and
+	# that upgrading a current database changes nothing
+	def test_refuse_old(self):
+		old = self.version_0()
+		with self.assertRaises(SystemExit):
+			index.main(f'index.py -q information -b {old}')
+
+		expected = self.dump(self.current)
+		main(f'migrate.py {self.current}')
+		self.assertEqual(self.dump(self.current), expected)
+
+		main(f'migrate.py {old}')
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as out:
+			index.main(f'index.py -q information -b {old}')
+			self.assertNotEqual(out.getvalue().strip(), '')
+
+
+if __name__ == '__main__':
+	main(sys.argv)
@@ -0,0 +1,513 @@
+import sys
+import os
+import io
+import re
+import getopt
+import sqlite3
+import threading
+import queue
+import unittest
+import unittest.mock
+from collections import defaultdict
+from parameterized import parameterized
+from colorama import Fore, Style
+
+import crawl
+import index
+from extract import extract, LINK, TEXT
+from fetch import Fetcher, ResponseCache, default_cache_directory, \
+                  default_pool_size
+import stopwords
+from cache import StemCache
+
+
+# How many documents can wait between two stages before the earlier stage has
+# to stop and wait for the later one to catch up
+stage_buffer = 32
+
+# How many documents are written to the database between commits
+commit_interval = 50
+
+usage = f'''\
+Usage:
+    python3 pipeline.py <start> <limit> [-b <database>] [-t <timeout>]
+        [--concurrency <workers>] [--per-host <requests>]
+        [--cache <directory>] [--offline] [--pool-size <connections>]
+        [--stem-cache <file>] [--verbose]
+
+Crawls outward from <start> like crawl.py and indexes every page it finds like
+index.py -w, downloading and parsing each page only once.
+
+Options:
+    <start>: (string) Starting hyperlink.
+    <limit>: (positive integer) How many pages to find and index.
+    <database>: (string) File to write database information. Default is
+        "{index.default_database_file}". If "null", saves to
+        "{index.null_database_file}" and deletes after.
+    <timeout>: (positive float) How long to wait for a response from a server
+        before moving on. Default is 5 seconds.
+    <workers>: (positive integer) How many pages to download at once. Default
+        is 4.
+    <requests>: (positive integer) How many of those downloads may go to the
+        same host at once. Default is 2.
+    <directory>: (string) Keep every downloaded page in this directory and
+        only download it again if it has changed. Usually
+        "{default_cache_directory}".
+    offline: Only reads pages from the cache directory (default is
+        "{default_cache_directory}"), never from the network.
+    <connections>: (positive integer) How many idle connections to keep open
+        to each host between downloads. Default is {default_pool_size}.
+    <file>: (string) Keep the stem of every word seen in this file between
+        runs, as index.py --stem-cache does.
+    verbose: Prints extra debug information to stdout.
+'''
+
+
+# Prints to stderr instead of stdout.
+#   <do_color>: whether or not to color the output red. Default is True
+def eprint(*args, **kwargs):
+	if 'do_color' in kwargs:
+		do_color = kwargs['do_color']
+		kwargs.pop('do_color')
+	else:
+		do_color = True
+
+	if do_color:
+		print(Fore.RED, end='', flush=True) # Flushing required here
+
+	print(*args, file=sys.stderr, **kwargs)
+
+	if do_color:
+		print(Style.RESET_ALL, end='', flush=True)
+
+
+# Returns (links, text) for the page <html_page>, both from one pass of the
+# parser over it.
+def read_page(html_page):
+	links = []
+	text = []
+	for kind, value in extract(html_page):
+		if kind == LINK:
+			links.append(value)
+		else:
+			text.append(value)
+	return links, ' '.join(text)
+
+
+# First stage: downloads every page in <frontier> (a crawl.CircularQueue),
+# adding the hyperlinks on each page to the frontier and putting (url, text)
+# into <documents>. A page that cannot be downloaded or read is skipped. The
+# stage always ends by putting None into <documents>, even if it fails.
+def fetch_stage(frontier, concurrency, limiter, fetcher, verbose, documents):
+	pages = crawl.fetch_pages(frontier, concurrency, limiter, fetcher)
+	try:
+		for url, html_page, ex in pages:
+			if ex is None:
+				try:
+					links, text = read_page(html_page)
+					if not frontier.is_full():
+						crawl.add_links(frontier, url, links, False, None)
+				except Exception as page_ex:
+					ex = page_ex
+
+			if ex is not None:
+				if verbose:
+					message = f'{type(ex)}, {getattr(ex, "reason", ex)}'
+					print(f'Reading "{url}" ... ' + Fore.YELLOW + \
+					      f'Failed ({message})' + Style.RESET_ALL, flush=True)
+				continue
+
+			if verbose:
+				print(f'Reading "{url}" ... ' + Fore.CYAN + 'Obtained' + \
+				      Style.RESET_ALL, flush=True)
+			documents.put((url, text))
+	finally:
+		pages.close()
+		documents.put(None)
+
+
+# Second stage: turns each (url, text) from <documents> into (url, stems,
+# positions, text_hash) in <stemmed>, text_hash being index.content_hash().
+# Like the first stage, it always ends by putting None into <stemmed>.
+def stem_stage(documents, stop_words, stemmer, stemmed):
+	try:
+		while True:
+			document = documents.get()
+			if document is None:
+				break
+			url, text = document
+			positions = defaultdict(list)
+			stems = index.get_stem_dict(text, stop_words, stemmer, positions)
+			stemmed.put((url, stems, positions, index.content_hash(text)))
+	except BaseException:
+		# Keep taking documents so the first stage is not left waiting for
+		# room in <documents> forever
+		while documents.get() is not None:
+			pass
+		raise
+	finally:
+		stemmed.put(None)
+
+
+# Runs <stage> with <args>, keeping any exception it raises in <errors> so it
+# can be raised again in the calling thread.
+def run_stage(errors, stage, *args):
+	try:
+		stage(*args)
+	except BaseException as ex:
+		errors.append(ex)
+
+
+# Last stage: writes each (url, stems, positions, text_hash) from <stemmed>
+# into the database, <commit_interval> documents at a time.
+def write_stage(con, database, stemmed, verbose):
+	indexer = index.BulkIndexer(con, commit_interval)
+	while True:
+		document = stemmed.get()
+		if document is None:
+			break
+		url, stems, positions, text_hash = document
+		if len(stems) == 0 or \
+		   indexer.add(url, stems, positions, text_hash) is None:
+			continue
+		if verbose:
+			print(f'Indexed "{url}" ({len(stems)} stems)', flush=True)
+	indexer.flush()
+
+
+# Crawls from <start> until <limit> pages are found, indexing each into the
+# database connected to by <con>. The stages run in their own threads (the
+# database is only touched from the calling thread), connected by bounded
+# queues so each can run at its own speed without any one of them getting
+# arbitrarily far ahead of the others. Words are stemmed with <stemmer>, which
+# only the stemming stage uses. If a stage fails, the others still finish and
+# its exception is raised here.
+def run_pipeline(con, database, start, limit, concurrency, per_host, fetcher, \
+                 stemmer, verbose):
+	frontier = crawl.CircularQueue(limit)
+	frontier.insert(crawl.normalize_url(start))
+	limiter = crawl.HostLimiter(per_host)
+	stop_words = set(stopwords.words('english'))
+
+	documents = queue.Queue(maxsize=stage_buffer)
+	stemmed = queue.Queue(maxsize=stage_buffer)
+	errors = []
+	stages = [
+		threading.Thread(target=run_stage, daemon=True, args=(errors, \
+		    fetch_stage, frontier, concurrency, limiter, fetcher, verbose, \
+		    documents)),
+		threading.Thread(target=run_stage, daemon=True, args=(errors, \
+		    stem_stage, documents, stop_words, stemmer, stemmed))
+	]
+	for stage in stages:
+		stage.start()
+	write_stage(con, database, stemmed, verbose)
+	for stage in stages:
+		stage.join()
+	if len(errors) > 0:
+		raise errors[0]
+
+
+# Parses <value> as a positive integer, exiting with an error message that
+# refers to it as <name> otherwise.
+def parse_positive_int(value, name):
+	try:
+		amount = int(value)
+	except ValueError:
+		amount = 0
+
+	if amount <= 0:
+		eprint(f'Error: {name} must be a positive integer, "{value}" found\n')
+		eprint(usage, do_color=False)
+		sys.exit(1)
+	return amount
+
+
+def main(args):
+	# For ease of testing, this turns command-line arguments passed as a string
+	# into something more traditionally used with sys.argv
+	if isinstance(args, str):
+		args = re.findall(r'("[^"]+"|[^\s"]+)', args)
+
+	try:
+		short = 'b:t:'
+		long = ['verbose', 'concurrency=', 'per-host=', 'cache=', 'offline',
+		        'pool-size=', 'stem-cache=']
+		iterator, positional = getopt.gnu_getopt(args, short, long)
+	except getopt.GetoptError as ex:
+		eprint(f'Error: unrecognized argument specified "{ex.opt}"\n')
+		eprint(usage, do_color=False)
+		sys.exit(1)
+
+	if len(positional) != 3:
+		eprint(f'Error: expected 2 arguments, found {len(positional)-1}\n')
+		eprint(usage, do_color=False)
+		sys.exit(1)
+
+	start = positional[1]
+	limit = parse_positive_int(positional[2], 'limit')
+
+	database = None
+	timeout = None
+	concurrency = None
+	per_host = None
+	cache_directory = None
+	offline = None
+	pool_size = None
+	stem_cache_file = None
+	verbose = None
+	for option, value in iterator:
+		if option == '-b':
+			if database is not None:
+				eprint('Error: only one argument can specify a database\n')
+				eprint(usage, do_color=False)
+				sys.exit(1)
+
+			database = value
+
+		elif option == '-t':
+			if timeout is not None:
+				message =  'Error: only one argument can specify a timeout '
+				message += 'amount\n'
+				eprint(message)
+				eprint(usage, do_color=False)
+				sys.exit(1)
+
+			try:
+				timeout = float(value)
+			except ValueError:
+				timeout = 0
+
+			if timeout <= 0:
+				message = 'Error: timeout amount must be numeric and '
+				message += 'positive, "' + str(value) + '" found\n'
+				eprint(message)
+				eprint(usage, do_color=False)
+				sys.exit(1)
+
+		elif option == '--concurrency':
+			if concurrency is not None:
+				message =  'Error: only one argument can specify a concurrency '
+				message += 'amount\n'
+				eprint(message)
+				eprint(usage, do_color=False)
+				sys.exit(1)
+
+			concurrency = parse_positive_int(value, 'concurrency amount')
+
+		elif option == '--per-host':
+			if per_host is not None:
+				message =  'Error: only one argument can specify a per-host '
+				message += 'amount\n'
+				eprint(message)
+				eprint(usage, do_color=False)
+				sys.exit(1)
+
+			per_host = parse_positive_int(value, 'per-host amount')
+
+		elif option == '--cache':
+			if cache_directory is not None:
+				message =  'Error: only one argument can specify a cache '
+				message += 'directory\n'
+				eprint(message)
+				eprint(usage, do_color=False)
+				sys.exit(1)
+
+			cache_directory = value
+
+		elif option == '--offline':
+			offline = True
+
+		elif option == '--pool-size':
+			if pool_size is not None:
+				message = 'Error: only one argument can specify a pool size\n'
+				eprint(message)
+				eprint(usage, do_color=False)
+				sys.exit(1)
+
+			pool_size = parse_positive_int(value, 'pool size')
+
+		elif option == '--stem-cache':
+			if stem_cache_file is not None:
+				message =  'Error: only one argument can specify a stem cache '
+				message += 'file\n'
+				eprint(message)
+				eprint(usage, do_color=False)
+				sys.exit(1)
+
+			stem_cache_file = value
+
+		elif option == '--verbose':
+			verbose = True
+
+	# Default values
+	if timeout is None:     timeout = 5
+	if concurrency is None: concurrency = 4
+	if per_host is None:    per_host = 2
+	if offline is None:     offline = False
+	if pool_size is None:   pool_size = default_pool_size
+	if verbose is None:     verbose = False
+	if offline and cache_directory is None:
+		cache_directory = default_cache_directory
+
+	if database is None: database = index.default_database_file
+	elif database.lower() == 'null': database = index.null_database_file
+
+	cache = None
+	if cache_directory is not None:
+		try:
+			cache = ResponseCache(cache_directory)
+		except (OSError, sqlite3.Error):
+			eprint(f'Error: cannot open cache directory "{cache_directory}"')
+			sys.exit(1)
+	fetcher = Fetcher(timeout, cache, offline, pool_size)
+
+	con = sqlite3.connect(database)
+	index.check_schema(con.cursor(), database)
+	stemmer = StemCache(index.load_stemmer(), path=stem_cache_file)
+	run_pipeline(con, database, start, limit, concurrency, per_host, fetcher, \
+	             stemmer, verbose)
+	fetcher.close()
+	try:
+		stemmer.save()
+	except OSError:
+		eprint(f'Error: cannot write stem cache file "{stem_cache_file}"')
+
+	cur = con.cursor()
+	index.check_valid_websites(cur)
+	website_size = cur.execute('SELECT COUNT(*) FROM website').fetchone()[0]
+	tokens_size = cur.execute('SELECT COUNT(*) FROM token').fetchone()[0]
+	print('Table(website) size:', website_size)
+	print('Table(token) size:', tokens_size)
+	if verbose:
+		print(fetcher.stats())
+		print(stemmer.stats())
+	con.close()
+
+	if database == index.null_database_file:
+		os.remove(index.null_database_file)
+
+
+# Boilerplate tests that verify command-line arguments, where the key is the
+# name of the test and the value is the arguments supplied.
+cla_tests = {                                                                  \
+'no_args':                                                                     \
+	'pipeline.py',                                                             \
+'missing_limit':                                                               \
+	'pipeline.py http://example.com/',                                         \
+'limit_not_numeric':                                                           \
+	'pipeline.py http://example.com/ many',                                    \
+'limit_negative':                                                              \
+	'pipeline.py http://example.com/ -10',                                     \
+'timeout_negative':                                                            \
+	'pipeline.py http://example.com/ 10 -t -3.14',                             \
+'concurrency_not_numeric':                                                     \
+	'pipeline.py http://example.com/ 10 --concurrency many',                   \
+'unknown_option':                                                              \
+	'pipeline.py http://example.com/ 10 -q test',                              \
+'multiple_database_specified':                                                 \
+	'pipeline.py http://example.com/ 10 -b null -b null'                       \
+}
+
+
+# Collection of simple tests that should all return SystemExit signals (due to
+# sys.exit(1) calls) due to poor formatting of the command-line arguments.
+class CommandLineArgumentTest(unittest.TestCase):
+	# Runs each test case in cla_tests
+	@parameterized.expand(cla_tests.items())
+	def test_cla(self, name, args):
+		with self.assertRaises(SystemExit) as cm:
+			main(args)
+
+
+# Tests for the whole pipeline against the local site crawl.py tests use.
+class PipelineTests(crawl.LocalSiteTest):
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		cls.test_table = os.path.join(cls.directory.name, 'pipeline.db')
+
+
+	def setUp(self):
+		super().setUp()
+		if os.path.isfile(self.test_table):
+			os.remove(self.test_table)
+
+
+	# Returns the urls indexed into the test database.
+	def indexed(self):
+		con = sqlite3.connect(self.test_table)
+		urls = [x[0] for x in con.execute('SELECT url FROM website')]
+		con.close()
+		return sorted(urls)
+
+
+	# Tests that every page the crawler would find gets indexed, and that each
+	# one is only downloaded once
+	def test_crawl_and_index(self):
+		links = self.crawl('20').split()
+		links.remove(self.url + '/missing.html')
+		self.requests.clear()
+
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
+			main(f'pipeline.py {self.url}/ 20 -b {self.test_table}')
+			out = fake_out.getvalue()
+
+		self.assertEqual(self.indexed(), sorted(links))
+		self.assertRegex(out, r'Table\(website\) size: 10')
+		downloads = [path for method, path in self.requests if method == 'GET']
+		self.assertEqual(len(downloads), len(set(downloads)))
+
+
+	# Tests that the pipeline builds the same index as crawling to a file and
+	# indexing that file
+	def test_same_as_index(self):
+		link_file = os.path.join(self.directory.name, 'links.txt')
+		self.crawl(f'20 -o {os.path.relpath(link_file)}')
+		separate_table = os.path.join(self.directory.name, 'separate.db')
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()):
+			index.main(f'index.py -w {link_file} -b {separate_table}')
+			main(f'pipeline.py {self.url}/ 20 -b {self.test_table} ' + \
+			     '--concurrency 3 --verbose')
+
+		tables = []
+		for name in (separate_table, self.test_table):
+			con = sqlite3.connect(name)
+			command = 'SELECT url, m, data FROM website ORDER BY url'
+			tables.append(con.execute(command).fetchall())
+			con.close()
+		os.remove(separate_table)
+		self.assertEqual(tables[0], tables[1])
+
+
+	# Tests that a page which cannot be read is skipped without stopping the
+	# crawl, which starts from a url with no path
+	def test_failed_page(self):
+		def add_links(queue, url, *args):
+			if url.endswith('/b.html'):
+				raise ValueError(url)
+			return real_add_links(queue, url, *args)
+
+		real_add_links = crawl.add_links
+		with unittest.mock.patch('crawl.add_links', new = add_links), \
+		     unittest.mock.patch('sys.stdout', new = io.StringIO()):
+			main(f'pipeline.py {self.url} 20 -b {self.test_table}')
+		self.assertEqual(self.indexed(), [self.url + x for x in
+		                 ['/', '/a.html', '/c.html', '/d.html', '/e.html',
+		                  '/g.html', '/h.html', '/i.html']])
+
+
+	# Tests that an error in a stage is raised instead of leaving the others
+	# waiting forever
+	def test_failed_stage(self):
+		def get_stem_dict(*args):
+			raise RuntimeError('stemmer failed')
+
+		with unittest.mock.patch('index.get_stem_dict', new = get_stem_dict), \
+		     unittest.mock.patch('sys.stdout', new = io.StringIO()):
+			with self.assertRaisesRegex(RuntimeError, 'stemmer failed'):
+				main(f'pipeline.py {self.url}/ 20 -b {self.test_table}')
+
+
+if __name__ == '__main__':
+	main(sys.argv)
@@ -0,0 +1,458 @@
+import sys
+import os
+import re
+import json
+import mmap
+import array
+import bisect
+import getopt
+import sqlite3
+import itertools
+from colorama import Fore, Style
+
+import index
+from index import encode_varint, iterate_varints, decode_varints
+from cache import LRUCache
+
+
+# Where a segment is usually written
+default_segment_file = 'data/table.seg'
+
+
+usage = f'''\
+Usage:
+    python3 segment.py <database> <segment> [--verbose]
+
+Writes the index in <database> into a segment: a single file that index.py
+can answer queries from (index.py --segment) without SQLite. A segment never
+changes once written and is mapped into memory instead of read, so it opens
+at once and every process querying it shares one copy. Export again after
+indexing more websites; processes still using the old segment keep answering
+from it until they are restarted.
+
+Options:
+    <database>: (string) File the database is in, e.g.
+        "{index.default_database_file}".
+    <segment>: (string) File to write the segment to, e.g.
+        "{default_segment_file}".
+    verbose: Prints each step to stdout.
+'''
+
+
+# A segment starts with these bytes, then the length of its header (8 bytes,
+# little-endian), then the header: JSON giving the format version, the byte
+# order of the arrays, the statistics of the index and where each section is
+# relative to the end of the header (rounded up to 8 bytes).
+magic = b'TSEG'
+format_version = 2
+
+# The sections of a segment, each an array of one type (as in the array
+# module). Stem numbers are those of the lexicon table and website numbers
+# their ids, and arrays "by stem" or "by website" have an entry for every
+# number up to the largest (0 where there is no such stem or website).
+#   stems: the text of every stem, one after another
+#   stem_offsets: where each stem's text starts in stems, by stem, then where
+#       the last one ends (so a stem's text ends where the next one starts)
+#   stem_order: the numbers of the stems, in order of their text
+#   df, bound: the token table's columns, by stem
+#   postings: every stem's postings, in order of stem: for each website the
+#       stem is in, the difference from the previous website's number (from 0
+#       for the first) and the stem's frequency in it, both as varints
+#   posting_offsets: where each stem's postings start, as stem_offsets
+#   positions: every stem's positions, in order of stem: for each website the
+#       stem is in (in order), how many positions are known, then the
+#       positions as the posting table stores them
+#   position_offsets: where each stem's positions start, as stem_offsets
+#   m, length: the website table's columns, by website
+#   urls, url_offsets: the url of every website, as stems and stem_offsets
+sections = {
+	'stems': 'B',
+	'stem_offsets': 'Q',
+	'stem_order': 'I',
+	'df': 'I',
+	'bound': 'd',
+	'postings': 'B',
+	'posting_offsets': 'Q',
+	'positions': 'B',
+	'position_offsets': 'Q',
+	'm': 'I',
+	'length': 'I',
+	'urls': 'B',
+	'url_offsets': 'Q',
+}
+
+
+# Prints to stderr instead of stdout.
+#   <do_color>: whether or not to color the output red. Default is True
+def eprint(*args, **kwargs):
+	if 'do_color' in kwargs:
+		do_color = kwargs['do_color']
+		kwargs.pop('do_color')
+	else:
+		do_color = True
+
+	if do_color:
+		print(Fore.RED, end='', flush=True) # Flushing required here
+
+	print(*args, file=sys.stderr, **kwargs)
+
+	if do_color:
+		print(Style.RESET_ALL, end='', flush=True)
+
+
+# Same as decode_varints, as a NumPy array, decoding every integer at once.
+def decode_varints_numpy(data):
+	import numpy as np
+	data = np.frombuffer(data, np.uint8)
+	if len(data) == 0:
+		return np.zeros(0, np.int64)
+	ends = np.flatnonzero(data < 0x80)
+	starts = np.concatenate(([0], ends[:-1] + 1))
+	shifts = 7 * (np.arange(len(data)) - np.repeat(starts, ends - starts + 1))
+	return np.add.reduceat((data & 0x7f).astype(np.int64) << shifts, starts)
+
+
+# Returns the bytes of <items>, (number, bytes) pairs in order of number, one
+# after another, and an array of where those of each number below <count>
+# start, followed by where the last ones end.
+def concatenate(items, count):
+	data = bytearray()
+	offsets = array.array('Q', [0]) * (count + 1)
+	number = 0
+	for item_number, value in items:
+		while number <= item_number:
+			offsets[number] = len(data)
+			number += 1
+		data += value
+	while number <= count:
+		offsets[number] = len(data)
+		number += 1
+	return data, offsets
+
+
+# Returns the postings of one stem, (stem, website, tf, positions) rows in
+# order of website, encoded as they are in a segment.
+def encode_postings(rows):
+	data = bytearray()
+	previous = 0
+	for _, website, tf, _ in rows:
+		encode_varint(website - previous, data)
+		encode_varint(tf, data)
+		previous = website
+	return data
+
+
+# Returns the positions of the same rows, encoded as they are in a segment.
+# They are kept as the posting table stores them, where every varint ends with
+# the one byte of it below 0x80, so those bytes count the positions.
+def encode_stem_positions(rows):
+	data = bytearray()
+	for _, _, _, positions in rows:
+		positions = b'' if positions is None else positions
+		encode_varint(sum(x < 0x80 for x in positions), data)
+		data += positions
+	return data
+
+
+# Writes the index in the database behind <cur> into a segment at <path>. The
+# segment is written next to <path> and then moved over it, so a process
+# reading an older segment at <path> is never left with half a file.
+def write_segment(cur, path):
+	stem_count = cur.execute('SELECT COALESCE(MAX(id), 0) + 1 '
+	                         'FROM lexicon').fetchone()[0]
+	website_count = index.website_next_id(cur)
+	data = {}
+
+	stems = {}
+	for stem_id, stem in cur.execute('SELECT id, stem FROM lexicon'):
+		stems[stem_id] = stem.encode('utf-8')
+	data['stems'], data['stem_offsets'] = \
+		concatenate(sorted(stems.items()), stem_count)
+	data['stem_order'] = array.array('I', sorted(stems, key=stems.get))
+
+	data['df'] = array.array('I', [0]) * stem_count
+	data['bound'] = array.array('d', [0]) * stem_count
+	for stem_id, df, bound in cur.execute('SELECT * FROM token'):
+		data['df'][stem_id] = df
+		data['bound'][stem_id] = bound
+
+	# Postings of deleted websites are left out, as if it had been compacted
+	rows = cur.execute('SELECT * FROM posting WHERE doc NOT IN '
+	                   '(SELECT id FROM tombstone) ORDER BY stem, doc')
+	postings = []
+	positions = []
+	for stem_id, stem_rows in itertools.groupby(rows, key=lambda x: x[0]):
+		stem_rows = list(stem_rows)
+		postings.append((stem_id, encode_postings(stem_rows)))
+		positions.append((stem_id, encode_stem_positions(stem_rows)))
+	data['postings'], data['posting_offsets'] = \
+		concatenate(postings, stem_count)
+	data['positions'], data['position_offsets'] = \
+		concatenate(positions, stem_count)
+
+	data['m'] = array.array('I', [0]) * website_count
+	data['length'] = array.array('I', [0]) * website_count
+	urls = []
+	command = 'SELECT id, url, m, length FROM website ORDER BY id'
+	for website, url, m, length in cur.execute(command):
+		data['m'][website] = m
+		data['length'][website] = length
+		urls.append((website, url.encode('utf-8')))
+	data['urls'], data['url_offsets'] = concatenate(urls, website_count)
+
+	header = {
+		'version': format_version,
+		'byteorder': sys.byteorder,
+		'statistics': {name: index.statistic_get(cur, name)
+		               for name in ('websites', 'length', 'generation')},
+		'sections': {},
+	}
+	offset = 0
+	for name in sections:
+		size = len(memoryview(data[name]).cast('B'))
+		header['sections'][name] = [offset, size]
+		offset += size + -size % 8
+	header = json.dumps(header).encode('utf-8')
+
+	temporary = path + '.tmp'
+	with open(temporary, 'wb') as segment_file:
+		segment_file.write(magic)
+		segment_file.write(len(header).to_bytes(8, 'little'))
+		segment_file.write(header)
+		segment_file.write(bytes(-(len(magic) + 8 + len(header)) % 8))
+		for name in sections:
+			values = memoryview(data[name]).cast('B')
+			segment_file.write(values)
+			segment_file.write(bytes(-len(values) % 8))
+	os.replace(temporary, path)
+
+
+# An index written by write_segment, mapped into memory. Queries are answered
+# from it as from the database: it is read by the scorers the same way as an
+# index.TableReader, and numbers stems like an index.Lexicon (with the
+# database's numbers). Nothing is read until it is used, and postings are
+# decoded straight out of the mapped file. Raises ValueError if <path> is not
+# a segment this version can read.
+class Segment:
+	def __init__(self, path):
+		with open(path, 'rb') as segment_file:
+			self._map = mmap.mmap(segment_file.fileno(), 0,
+			                      access=mmap.ACCESS_READ)
+		view = memoryview(self._map)
+		self._views = [view]
+		try:
+			if view[:len(magic)] != magic:
+				raise ValueError('not a segment')
+			start = len(magic) + 8
+			size = int.from_bytes(view[len(magic):start], 'little')
+			header = json.loads(bytes(view[start:start + size]))
+			if header['version'] != format_version:
+				raise ValueError(f'format version {header["version"]}, '
+				                 f'expected {format_version}')
+			if header['byteorder'] != sys.byteorder:
+				raise ValueError(f'written on a {header["byteorder"]}-endian '
+				                 f'machine')
+
+			start += size + -(start + size) % 8
+			self._statistics = header['statistics']
+			for name, typecode in sections.items():
+				offset, size = header['sections'][name]
+				section = view[start + offset:start + offset + size]
+				self._views.append(section.cast(typecode))
+				setattr(self, '_' + name, self._views[-1])
+		except (ValueError, KeyError, TypeError) as ex:
+			self.close()
+			raise ValueError(str(ex))
+
+		# Postings decoded for looking websites up in, as MaxScore does for
+		# a few stems many times each
+		self._decoded = LRUCache(16)
+
+
+	# Unmaps the file. Nothing can be read from the segment afterwards.
+	def close(self):
+		for view in reversed(self._views):
+			view.release()
+		self._views.clear()
+		self._map.close()
+
+
+	def check(self):
+		if self.statistic('websites') == 0:
+			index.eprint('Error: no websites indexed. Index at least one valid '
+			             'website.')
+			sys.exit(1)
+
+
+	def lexicon(self):
+		return self
+
+
+	def statistic(self, name):
+		return self._statistics.get(name, 0)
+
+
+	# Returns the text of the stem numbered <stem_id>.
+	def _stem(self, stem_id):
+		start, end = self._stem_offsets[stem_id:stem_id + 2]
+		return bytes(self._stems[start:end])
+
+
+	# Returns the number of <stem>, or None if it was never indexed. Stems are
+	# found by binary search in stem_order.
+	def find(self, stem):
+		key = stem.encode('utf-8')
+		low, high = 0, len(self._stem_order)
+		while low < high:
+			middle = (low + high) // 2
+			if self._stem(self._stem_order[middle]) < key:
+				low = middle + 1
+			else:
+				high = middle
+		if low < len(self._stem_order) and \
+		   self._stem(self._stem_order[low]) == key:
+			return self._stem_order[low]
+		return None
+
+
+	def ids(self, stems):
+		stem_ids = (self.find(stem) for stem in stems)
+		return sorted(set(x for x in stem_ids if x is not None))
+
+
+	def __len__(self):
+		return len(self._stem_order)
+
+
+	def tokens(self, stem_ids):
+		return {x: (self._df[x], self._bound[x]) for x in stem_ids
+		        if 0 <= x < len(self._df) and self._df[x] > 0}
+
+
+	# Returns the encoded postings of <stem_id>, as a view of the file.
+	def _encoded(self, stem_id):
+		start, end = self._posting_offsets[stem_id:stem_id + 2]
+		return self._postings[start:end]
+
+
+	# Returns the websites <stem_id> appears in, in order, and how many times
+	# it appears in each, as two lists.
+	def postings(self, stem_id):
+		values = decode_varints(self._encoded(stem_id))
+		return list(itertools.accumulate(values[0::2])), values[1::2]
+
+
+	def websites(self, stem_id):
+		return self.postings(stem_id)[0]
+
+
+	# Positions are found by reading through those of every website before,
+	# which is quick next to the postings themselves.
+	def positions(self, stem_id, websites):
+		wanted = set(websites)
+		start, end = self._position_offsets[stem_id:stem_id + 2]
+		values = iterate_varints(self._positions[start:end])
+		positions = {}
+		for website in self.websites(stem_id):
+			gaps = list(itertools.islice(values, next(values)))
+			if website in wanted:
+				positions[website] = list(itertools.accumulate(gaps))
+		return positions
+
+
+	# Postings are decoded as they are read, so those score_top_k stops
+	# reading are never decoded.
+	def weights(self, ranker, stem_id):
+		m = self._m
+		length = self._length
+		weigh = ranker.weigh
+		values = iterate_varints(self._encoded(stem_id))
+		website = 0
+		for difference, tf in zip(values, values):
+			website += difference
+			yield website, weigh(tf, m[website], length[website])
+
+
+	def weight(self, ranker, stem_id, website):
+		postings = self._decoded.get(stem_id)
+		if postings is None:
+			if index.have_numpy:
+				import numpy as np
+				values = decode_varints_numpy(self._encoded(stem_id))
+				postings = np.cumsum(values[0::2]), values[1::2]
+			else:
+				postings = self.postings(stem_id)
+			self._decoded.put(stem_id, postings)
+		websites, tfs = postings
+		i = bisect.bisect_left(websites, website)
+		if i == len(websites) or websites[i] != website:
+			return None
+		return ranker.weigh(int(tfs[i]), self._m[website], self._length[website])
+
+
+	def weight_arrays(self, ranker, stem_id):
+		import numpy as np
+		values = decode_varints_numpy(self._encoded(stem_id))
+		websites = np.cumsum(values[0::2])
+		m = np.asarray(self._m)[websites]
+		length = np.asarray(self._length)[websites]
+		return websites, ranker.weigh(values[1::2], m, length)
+
+
+	def urls(self, websites):
+		urls = {}
+		for website in websites:
+			start, end = self._url_offsets[website:website + 2]
+			urls[website] = bytes(self._urls[start:end]).decode('utf-8')
+		return urls
+
+
+def main(args):
+	# For ease of testing, this turns command-line arguments passed as a string
+	# into something more traditionally used with sys.argv
+	if isinstance(args, str):
+		args = re.findall(r'("[^"]+"|[^\s"]+)', args)
+		args = [
+			arg[1:-1] if arg[0] == arg[-1] and arg[0] in ('\'', '"')
+			else arg for arg in args
+		]
+
+	try:
+		options, rest = getopt.gnu_getopt(args[1:], '', ['verbose'])
+	except getopt.GetoptError as ex:
+		eprint(f'Error: unrecognized argument specified "{ex.opt}"\n')
+		eprint(usage, do_color=False)
+		sys.exit(1)
+
+	if len(rest) != 2:
+		eprint(f'Error: expected 2 arguments, found {len(rest)}\n')
+		eprint(usage, do_color=False)
+		sys.exit(1)
+
+	database, path = rest
+	verbose = any(option == '--verbose' for option, _ in options)
+	if not os.path.isfile(database):
+		eprint(f'Error: database "{database}" does not exist')
+		sys.exit(1)
+
+	con = sqlite3.connect(database)
+	cur = con.cursor()
+	index.check_schema(cur, database)
+	index.check_valid_websites(cur)
+	if verbose:
+		print(f'Writing {database} into {path} ... ', flush=True, end='')
+	try:
+		write_segment(cur, path)
+	except OSError as ex:
+		eprint(f'Error: cannot write segment "{path}" ({ex})')
+		sys.exit(1)
+	finally:
+		con.close()
+	if verbose:
+		print(Fore.CYAN + 'Done' + Style.RESET_ALL)
+		print(f'Segment size: {os.path.getsize(path)} bytes '
+		      f'(database: {os.path.getsize(database)} bytes)')
+
+
+if __name__ == '__main__':
+	main(sys.argv)
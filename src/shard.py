@@ -0,0 +1,242 @@
+import os
+import sys
+import hashlib
+import sqlite3
+import threading
+from collections import defaultdict
+
+import index
+
+
+# Splits the index across several databases (shards) of the same schema, each
+# holding the websites whose url hashes to it, so that websites are written
+# into and queries answered from all of them at once.
+#
+# A query is answered in two rounds over a pool of threads, one shard per task
+# (SQLite lets other threads run while it reads). The first gathers each
+# shard's totals and the df of the query's stems, which are added up into
+# those of the whole index. The second has every shard find its best websites
+# scored with those totals rather than its own, so that a stem gets the same
+# idf (and BM25 the same average length) in every shard, as it would in one
+# database holding every website. Each shard only needs to send back its best
+# k, as the best k of the whole index are among them.
+
+
+# Returns the file shard <number> of the database <database> is kept in, e.g.
+# data/table-0.db for data/table.db.
+def shard_file(database, number):
+	root, extension = os.path.splitext(database)
+	return f'{root}-{number}{extension}'
+
+
+# Returns which of <count> shards the website <url> is kept in. Hashed with
+# SHA-1 rather than hash(), which is different in every run.
+def shard_of(url, count):
+	digest = hashlib.sha1(url.encode('utf-8')).digest()
+	return int.from_bytes(digest[:8], 'big') % count
+
+
+# Websites are numbered across shards by interleaving: website <website> of
+# shard <number> of <count> is website * count + number, which keeps each
+# shard's order and gives every website a number of its own.
+def global_id(website, number, count):
+	return website * count + number
+
+
+# Returns (website, number) for the website numbered <website> by global_id.
+def local_id(website, count):
+	return divmod(website, count)
+
+
+# Same as index.BulkIndexer, for websites written into the shards behind
+# <connections> (one for each shard, in order), each into the one shard_of
+# gives it. Websites are given the numbers of global_id.
+class ShardedIndexer:
+	def __init__(self, connections, batch_size=index.default_batch_size):
+		self._indexers = [index.BulkIndexer(x, batch_size)
+		                  for x in connections]
+
+
+	def __contains__(self, url):
+		return url in self._indexers[shard_of(url, len(self._indexers))]
+
+
+	def add(self, url, stems, positions=None, text_hash=None):
+		count = len(self._indexers)
+		number = shard_of(url, count)
+		website = self._indexers[number].add(url, stems, positions, text_hash)
+		return None if website is None else global_id(website, number, count)
+
+
+	def flush(self):
+		for indexer in self._indexers:
+			indexer.flush()
+
+
+	def __len__(self):
+		return sum(len(x) for x in self._indexers)
+
+
+# Same as <reader> (a shard's index.TableReader), but with the totals of the
+# whole index in <statistics> and the df of the query's stems in <dfs> (by
+# the shard's stem numbers) in place of the shard's own.
+class GlobalReader:
+	def __init__(self, reader, statistics, dfs):
+		self._reader = reader
+		self._statistics = statistics
+		self._dfs = dfs
+
+
+	def statistic(self, name):
+		if name in self._statistics:
+			return self._statistics[name]
+		return self._reader.statistic(name)
+
+
+	def tokens(self, stem_ids):
+		return {stem_id: (self._dfs[stem_id], bound) for stem_id, (_, bound)
+		        in self._reader.tokens(stem_ids).items()}
+
+
+	# Everything else is read from the shard
+	def __getattr__(self, name):
+		return getattr(self._reader, name)
+
+
+# Same as <stemmer>, for several threads at once (StemCache isn't safe to use
+# from more than one).
+class LockedStemmer:
+	def __init__(self, stemmer):
+		self._stemmer = stemmer
+		self._lock = threading.Lock()
+
+
+	def stem(self, word):
+		with self._lock:
+			return self._stemmer.stem(word)
+
+
+# First round of a query: returns the totals of the shard behind <cur> and
+# {stem: df} for those of <stems> it has.
+def shard_statistics(cur, stems):
+	lexicon = index.Lexicon(cur)
+	stem_ids = {stem: lexicon.find(stem) for stem in stems}
+	tokens = index.token_rows(cur, [x for x in stem_ids.values()
+	                                if x is not None])
+	dfs = {stem: tokens[x][0] for stem, x in stem_ids.items() if x in tokens}
+	totals = {name: index.statistic_get(cur, name)
+	          for name in ('websites', 'length')}
+	return totals, dfs
+
+
+# Second round: returns the websites of the shard behind <cur> matching
+# <query>, as index.rank_websites does, scored with the totals and dfs of the
+# whole index.
+def shard_rank(cur, query, stop_words, stemmer, statistics, dfs, scorer, k,
+               ranker):
+	lexicon = index.Lexicon(cur)
+	stem_ids = {stem: lexicon.find(stem) for stem in dfs}
+	local_dfs = {stem_ids[stem]: df for stem, df in dfs.items()
+	             if stem_ids[stem] is not None}
+	reader = GlobalReader(index.TableReader(cur), statistics, local_dfs)
+	return index.rank_websites(reader, query, stop_words, stemmer, False,
+	                           scorer, k, ranker, lexicon)
+
+
+# Answers queries from the <count> shards of <database>, in a pool of
+# <workers> threads (one per shard if not given) started for the first query
+# and kept for the rest. With one worker, or one shard, queries are answered
+# in the calling thread instead.
+class ShardedIndex:
+	def __init__(self, database, count, workers=None):
+		self.paths = [shard_file(database, x) for x in range(count)]
+		self._connections = [None] * count
+		self._workers = min(workers or count, count)
+		self._executor = None
+
+
+	# Returns the cursor of shard <number>, opened when first needed. Only one
+	# thread uses a shard at a time, though not always the same one.
+	def _cursor(self, number):
+		if self._connections[number] is None:
+			self._connections[number] = sqlite3.connect(self.paths[number],
+			                                            check_same_thread=False)
+		return self._connections[number].cursor()
+
+
+	# Returns [function(cur, *args)] for the cursor cur of each shard, in
+	# order, running one task per shard.
+	def _each(self, function, *args):
+		cursors = [self._cursor(x) for x in range(len(self.paths))]
+		if self._workers == 1:
+			return [function(cur, *args) for cur in cursors]
+
+		if self._executor is None:
+			from concurrent.futures import ThreadPoolExecutor
+			self._executor = ThreadPoolExecutor(self._workers)
+		tasks = [self._executor.submit(function, cur, *args) for cur in cursors]
+		return [task.result() for task in tasks]
+
+
+	# Exits with an error message if a shard is missing or there are no
+	# websites to query in any of them.
+	def check(self):
+		for path in self.paths:
+			if not os.path.isfile(path):
+				index.eprint(f'Error: shard "{path}" not found. Index at least '
+				             'one valid website.')
+				sys.exit(1)
+		websites = sum(index.statistic_get(self._cursor(x), 'websites')
+		               for x in range(len(self.paths)))
+		if websites == 0:
+			index.eprint('Error: no websites indexed. Index at least one '
+			             'valid website.')
+			sys.exit(1)
+
+
+	# Same as index.rank_websites, with websites numbered by global_id.
+	def rank(self, query, stop_words, stemmer, scorer='python', k=None,
+	         ranker=None):
+		stems = list(index.get_stem_dict(query, stop_words, stemmer))
+		statistics = defaultdict(lambda: 0)
+		dfs = defaultdict(lambda: 0)
+		for totals, shard_dfs in self._each(shard_statistics, stems):
+			for name, value in totals.items():
+				statistics[name] += value
+			for stem, df in shard_dfs.items():
+				dfs[stem] += df
+
+		if self._workers > 1:
+			stemmer = LockedStemmer(stemmer)
+		count = len(self.paths)
+		results = self._each(shard_rank, query, stop_words, stemmer,
+		                     dict(statistics), dict(dfs), scorer, k, ranker)
+		websites = []
+		for number, result in enumerate(results):
+			websites.extend((global_id(website, number, count), score)
+			                for website, score in result)
+		websites.sort(key=lambda x: (-x[1], x[0]))
+		return websites[:k]
+
+
+	# Returns {website: url} for each of <websites> (numbered by global_id).
+	def urls(self, websites):
+		count = len(self.paths)
+		by_shard = defaultdict(list)
+		for website in websites:
+			local, number = local_id(website, count)
+			by_shard[number].append(local)
+		urls = {}
+		for number, local in by_shard.items():
+			reader = index.TableReader(self._cursor(number))
+			for website, url in reader.urls(local).items():
+				urls[global_id(website, number, count)] = url
+		return urls
+
+
+	def close(self):
+		if self._executor is not None:
+			self._executor.shutdown()
+		for con in self._connections:
+			if con is not None:
+				con.close()
@@ -0,0 +1,272 @@
+import os
+import sys
+import io
+import json
+import random
+import sqlite3
+import tempfile
+import unittest
+import unittest.mock
+from array import array
+from collections import defaultdict
+
+import index
+import stopwords
+from cache import *
+
+
+# Tests for the least recently used cache.
+class LRUCacheTests(unittest.TestCase):
+	# Tests that the least recently used item is the one forgotten, and that
+	# hits and misses are counted
+	def test_eviction(self):
+		cache = LRUCache(2)
+		cache.put('a', 1)
+		cache.put('b', 2)
+		self.assertEqual(cache.get('a'), 1)
+		cache.put('c', 3)
+		self.assertIsNone(cache.get('b'))
+		self.assertEqual(cache.get('c'), 3)
+		self.assertEqual(cache.items(), [('a', 1), ('c', 3)])
+		self.assertEqual((cache.hits, cache.misses), (2, 1))
+		self.assertEqual(cache.stats('Test', 'things'),
+		                 'Test: 2 hits, 1 misses (66.7% hit rate), 2 things '
+		                 'cached')
+
+
+# Tests for remembering stems, within a run and between runs.
+class StemCacheTests(unittest.TestCase):
+	words = ['running', 'runs', 'information', 'informational', 'dogs',
+	         'running', 'dogs', 'processing']
+
+
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		self.path = os.path.join(self.directory.name, 'stems.json')
+		self.stemmer = index.load_stemmer()
+
+
+	def tearDown(self):
+		self.directory.cleanup()
+
+
+	# Tests that cached stems are the stemmer's, and that a repeated word is
+	# only stemmed once
+	def test_same_stems(self):
+		cache = StemCache(self.stemmer)
+		self.assertEqual([cache.stem(x) for x in self.words],
+		                 [self.stemmer.stem(x) for x in self.words])
+		self.assertRegex(cache.stats(), '2 hits, 6 misses')
+
+
+	# Tests that stems saved by one run are used by the next
+	def test_persist(self):
+		cache = StemCache(self.stemmer, path=self.path)
+		for word in self.words:
+			cache.stem(word)
+		cache.save()
+
+		cache = StemCache(self.stemmer, path=self.path)
+		self.assertEqual([cache.stem(x) for x in self.words],
+		                 [self.stemmer.stem(x) for x in self.words])
+		self.assertRegex(cache.stats(), '8 hits, 0 misses')
+
+
+	# Tests that saved stems are ignored if they came from another stemmer or
+	# cannot be read
+	def test_ignore_saved(self):
+		with open(self.path, 'w') as cache_file:
+			json.dump({'stemmer': 'LancasterStemmer',
+			           'stems': [['running', 'wrong']]}, cache_file)
+		cache = StemCache(self.stemmer, path=self.path)
+		self.assertEqual(cache.stem('running'), 'run')
+
+		with open(self.path, 'w') as cache_file:
+			cache_file.write('{"stemmer": ')
+		cache = StemCache(self.stemmer, path=self.path)
+		self.assertEqual(cache.stem('running'), 'run')
+
+
+	# Tests that index.py writes the stem cache and ranks the same with it
+	def test_index(self):
+		database = os.path.join(self.directory.name, 'websites.db')
+		document = 'data/documents/information-processing.txt'
+
+		def run(args):
+			with unittest.mock.patch('sys.stdout', new = io.StringIO()) as out:
+				index.main(f'index.py {args} -b {database} '
+				           f'--stem-cache {self.path}')
+				return out.getvalue()
+
+		run(f'-d {document}')
+		self.assertTrue(os.path.isfile(self.path))
+		expected = run('-q information')
+		os.remove(database)
+		out = run(f'-d {document} --verbose')
+		self.assertRegex(out, r'Stem cache: \d+ hits, 0 misses')
+		self.assertEqual(run('-q information'), expected)
+
+
+# Tests for remembering the results of queries until the index changes.
+class ResultCacheTests(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		self.database = os.path.join(self.directory.name, 'results.db')
+
+
+	def tearDown(self):
+		self.directory.cleanup()
+
+
+	# Tests that results are only used for the generation they were found at,
+	# and not once they are older than the ttl
+	def test_invalid(self):
+		cache = ResultCache(ttl=10)
+		websites = [(0, 2.25), (1, 1.0)]
+		with unittest.mock.patch('time.time', return_value=100):
+			cache.put('key', 1, websites)
+		with unittest.mock.patch('time.time', return_value=105):
+			self.assertEqual(cache.get('key', 1), websites)
+			self.assertIsNone(cache.get('key', 2))
+			self.assertIsNone(cache.get('other', 1))
+		with unittest.mock.patch('time.time', return_value=111):
+			self.assertIsNone(cache.get('key', 1))
+		self.assertRegex(cache.stats(), '1 hits, 3 misses')
+
+
+	# Tests that results kept in a database are used by the next cache, and
+	# that only the newest results of the newest generation are kept
+	def test_persist(self):
+		con = sqlite3.connect(self.database)
+		cache = ResultCache(2, cur=con.cursor())
+		cache.put('old', 1, [(3, 1.0)])
+		for i in range(3):
+			cache.put(f'key{i}', 2, [(i, 0.5)])
+		con.commit()
+		count = con.execute('SELECT COUNT(*) FROM result').fetchone()[0]
+		self.assertEqual(count, 2)
+
+		cache = ResultCache(2, cur=con.cursor())
+		self.assertEqual(cache.get('key2', 2), [(2, 0.5)])
+		self.assertIsNone(cache.get('old', 1))
+		self.assertIsNone(cache.get('key2', 3))
+		con.close()
+
+
+	# Tests that a server answers repeated queries from the cache with what it
+	# would have found, and finds them again once a website is added
+	def test_server(self):
+		insert_args = 'index.py -d "%s" -b ' + self.database
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()):
+			index.main(insert_args % 'data/documents/nintendogs.txt')
+		con = sqlite3.connect(self.database)
+		stop_words = set(stopwords.words('english'))
+		stemmer = index.load_stemmer()
+		results = ResultCache()
+		server = index.QueryServer(con, stop_words, stemmer)
+		cached = index.QueryServer(con, stop_words, stemmer, results=results)
+
+		requests = [{'query': 'information dogs'},
+		            {'query': 'information dogs', 'k': 1}]
+		for _ in range(2):
+			for request in requests:
+				self.assertEqual(cached.answer(request), server.answer(request))
+		self.assertRegex(results.stats(), '2 hits, 2 misses')
+
+		# Scores from another ranker are not the same results
+		bm25 = index.BM25()
+		self.assertEqual(index.QueryServer(con, stop_words, stemmer,
+		                                   ranker=bm25, results=results)
+		                 .answer(requests[0]),
+		                 index.QueryServer(con, stop_words, stemmer,
+		                                   ranker=bm25).answer(requests[0]))
+		self.assertRegex(results.stats(), '2 hits, 3 misses')
+
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()):
+			index.main(insert_args % 'data/documents/information-processing.txt')
+		answer = cached.answer(requests[0])
+		self.assertEqual(len(answer['websites']), 2)
+		self.assertEqual(answer, server.answer(requests[0]))
+		con.close()
+
+# Tests for keeping the postings of common stems in memory.
+class PostingCacheTests(unittest.TestCase):
+	# Tests that postings are only kept once asked for often enough, that they
+	# are kept in the budget, and that postings asked for less often are the
+	# ones forgotten
+	def test_admission(self):
+		postings = (array('q', range(100)), array('d', [1.0] * 100))
+		size = sum(sys.getsizeof(x) for x in postings)
+		cache = PostingCache(2 * size, admit=2)
+		cache.check(1)
+		for key in ('a', 'b', 'c'):
+			self.assertIsNone(cache.get(key))
+			cache.put(key, postings)
+		self.assertEqual(len(cache), 0)
+
+		for key in ('a', 'a', 'b'):
+			cache.get(key)
+			cache.put(key, postings)
+		self.assertEqual(len(cache), 2)
+		self.assertEqual(cache.used, 2 * size)
+
+		# c has been asked for as often as b, which has been used least recently,
+		# but d less often than a
+		cache.get('a')
+		cache.get('c')
+		cache.put('c', postings)
+		self.assertIsNone(cache.peek('b'))
+		self.assertIs(cache.get('c'), postings)
+		for _ in range(3):
+			cache.get('d')
+		cache.put('d', postings)
+		self.assertIsNone(cache.peek('d'))
+		self.assertIsNotNone(cache.peek('a'))
+		self.assertEqual(cache.used, 2 * size)
+
+		cache.check(2)
+		self.assertEqual((len(cache), cache.used), (0, 0))
+
+
+	# Tests that every scorer gives the same scores with postings from the
+	# cache, including after websites are added
+	def test_same_ranking(self):
+		rng = random.Random(0)
+		words = [f'stem{i}' for i in range(100)]
+		con = sqlite3.connect(':memory:')
+		cur = con.cursor()
+		index.check_schema(cur, ':memory:')
+		cache = PostingCache()
+		reader = index.TableReader(cur, cache)
+
+		def add(first, count):
+			indexer = index.BulkIndexer(con)
+			for i in range(first, first + count):
+				stems = defaultdict(lambda: 0)
+				for word in rng.choices(words, [1 / (x + 1) for x in
+				                                range(100)], k=50):
+					stems[word] += 1
+				indexer.add(f'https://example.com/{i}', stems)
+			indexer.flush()
+
+		add(0, 200)
+		scorers = [index.score_python]
+		if index.have_numpy:
+			scorers.append(index.score_numpy)
+		for i in range(60):
+			if i == 30:
+				add(200, 50)
+			stem_ids = index.Lexicon(cur).ids(rng.sample(words[:10], 3))
+			for ranker in (index.TfIdf(), index.BM25()):
+				expected = index.score_python(cur, stem_ids, ranker)
+				for score in scorers:
+					self.assertEqual(score(reader, stem_ids, ranker), expected)
+				self.assertEqual(index.score_top_k(reader, stem_ids, 5, ranker),
+				                 index.score_top_k(cur, stem_ids, 5, ranker))
+		self.assertGreater(cache.hits, 0)
+		self.assertGreater(len(cache), 0)
+		con.close()
+
+
+if __name__ == '__main__':
+	unittest.main()
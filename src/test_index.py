@@ -0,0 +1,1097 @@
+import sys 
+import os 
+import io 
+import re 
+import json 
+import math 
+import sqlite3 
+import random 
+import tempfile 
+import subprocess 
+import threading 
+import unittest 
+import unittest.mock 
+from collections import defaultdict 
+from parameterized import parameterized 
+
+import crawl 
+import stopwords 
+import index 
+from index import * 
+
+
+# A stem number that no test gives a stem, for querying stems that were never
+# indexed 
+missing_stem_id = 10 ** 9 
+
+
+# Boilerplate tests that verify command-line arguments, where the key is the
+# name of the test and the value is the arguments supplied.
+cla_tests = {                                                                  \
+'no_args':                                                                     \
+	'index.py',                                                                \
+'no_main_direction':                                                           \
+	'index.py -t 5 -b output.txt',                                             \
+'multiple_main_direction':                                                     \
+	'index.py -w "http://example.com/" -q test',                               \
+'unknown_single_option_1':                                                     \
+	'index.py -z',                                                             \
+'unknown_single_option_2':                                                     \
+	'index.py --z',                                                            \
+'unknown_double_option':                                                       \
+	'index.py -z test',                                                        \
+'missing_document':                                                            \
+	'index.py -d "data/this-file-should-not-exist.txt"',                       \
+'missing_database':                                                            \
+	'index.py -q test -b data/this-database-should-not-exist.txt',             \
+'timeout_not_numeric':                                                         \
+	'index.py -w "http://example.com/" -t test',                               \
+'timeout_negative':                                                            \
+	'index.py -w "http://example.com/" -t -3.14',                              \
+'multiple_website_specified':                                                  \
+	'index.py -w "http://example.com/" -w "http://example.com/"',              \
+'multiple_query_specified':                                                    \
+	'index.py -q "test" -q "test"',                                            \
+'multiple_document_specified':                                                 \
+	'index.py -d "data/document-1.txt" -d "data/document-2.txt"',              \
+'multiple_database_specified':                                                 \
+	'index.py -w "http://example.com/" -b "null" -b "null"',                   \
+'multiple_timeout_specified':                                                  \
+	'index.py -w "http://example.com/" -t 5 -t 10',                            \
+'verbose_misspelled':                                                          \
+	'index.py -w "http://example.com/" --verbosee',                            \
+'pool_size_zero':                                                              \
+	'index.py -w "http://example.com/" --pool-size 0',                         \
+'batch_not_numeric':                                                           \
+	'index.py -w "http://example.com/" --batch many',                          \
+'unknown_scorer':                                                              \
+	'index.py -q test --scorer fortran',                                       \
+'k_zero':                                                                      \
+	'index.py -q test -k 0',                                                   \
+'unknown_ranker':                                                              \
+	'index.py -q test --ranker pagerank',                                      \
+'k1_negative':                                                                 \
+	'index.py -q test --ranker bm25 --k1 -1',                                  \
+'b_too_large':                                                                 \
+	'index.py -q test --ranker bm25 --b 2',                                    \
+'b_without_bm25':                                                              \
+	'index.py -q test --b 0.5',                                                \
+'serve_and_query':                                                             \
+	'index.py -q test --serve',                                                \
+'socket_without_serve':                                                        \
+	'index.py -q test --socket data/index.sock',                               \
+'multiple_stem_cache_specified':                                               \
+	'index.py -q test --stem-cache a.json --stem-cache b.json',                \
+'workers_zero':                                                                \
+	'index.py -w data/links/cnn-news.txt --workers 0',                         \
+'workers_with_document':                                                       \
+	'index.py -d data/documents/nintendogs.txt --workers 2',                   \
+'segment_with_website':                                                        \
+	'index.py -w data/links/cnn-news.txt --segment data/table.seg',            \
+'multiple_segment_specified':                                                  \
+	'index.py -q test --segment a.seg --segment b.seg',                        \
+'result_cache_with_website':                                                   \
+	'index.py -w data/links/cnn-news.txt --result-cache 10',                   \
+'negative_result_cache':                                                       \
+	'index.py --serve --result-cache -1',                                      \
+'multiple_result_cache_specified':                                             \
+	'index.py --serve --result-cache 1 --result-cache 2',                      \
+'zero_result_ttl':                                                             \
+	'index.py --serve --result-ttl 0',                                         \
+'multiple_result_ttl_specified':                                               \
+	'index.py --serve --result-ttl 1 --result-ttl 2',                          \
+'persist_results_with_segment':                                                \
+	'index.py -q test --segment a.seg --persist-results',                      \
+'posting_cache_with_query':                                                    \
+	'index.py -q test --posting-cache 1',                                      \
+'negative_posting_cache':                                                      \
+	'index.py --serve --posting-cache -1',                                     \
+'multiple_posting_cache_specified':                                            \
+	'index.py --serve --posting-cache 1 --posting-cache 2',                    \
+'posting_cache_with_segment':                                                  \
+	'index.py --serve --segment a.seg --posting-cache 1',                      \
+'update_with_query':                                                           \
+	'index.py -q test --update',                                               \
+'update_with_batch':                                                           \
+	'index.py -d a.txt --update --batch 10',                                   \
+'delete_with_query':                                                           \
+	'index.py -q test --delete a',                                             \
+'multiple_delete_specified':                                                   \
+	'index.py --delete a --delete b',                                          \
+'compact_with_website':                                                        \
+	'index.py -w a --compact',                                                 \
+'shards_zero':                                                                 \
+	'index.py -q test --shards 0',                                             \
+'multiple_shards_specified':                                                   \
+	'index.py -q test --shards 1 --shards 2',                                  \
+'shards_with_serve':                                                           \
+	'index.py --serve --shards 2',                                             \
+'shards_with_update':                                                          \
+	'index.py -d a.txt --update --shards 2'                                    \
+}
+
+
+# Collection of simple tests that should all return SystemExit signals (due to
+# sys.exit(1) calls) due to poor formatting of the command-line arguments. 
+class CommandLineArgumentTest(unittest.TestCase):
+	# Runs each test case in cla_tests
+	@parameterized.expand(cla_tests.items())
+	def test_cla(self, name, args): 
+		with self.assertRaises(SystemExit) as cm: 
+			main(args)
+
+
+# Collection of more complicated tests that have internal logic in them. 
+class UniqueTests(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls): 
+		cls.test_table = 'data/unit-test-table.db'
+	
+	
+	@classmethod
+	def remove_test_table(cls):
+		os.system('rm -f ' + cls.test_table)
+		
+		
+	@classmethod
+	def tearDownClass(cls):
+		cls.remove_test_table()
+	
+	
+	# Test that a null database does not create a table at the default location
+	def test_null_database(self): 
+		args = 'index.py -w "https://example.com/" -b null'
+		main(args)
+		self.assertFalse(os.path.isfile(null_database_file))
+	
+	
+	# Test that websites will correctly timeout
+	def test_timeout(self):
+		args = 'index.py -w "http://example.com/" -t 0.0001 -b null --verbose'
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
+			try:
+				main(args)
+				self.fail('No exception raised for empty database')
+			except SystemExit as ex: 
+				message = 'Network is unreachable' 
+				self.assertRegex(fake_out.getvalue(), message)
+		
+		
+	# Test that the size of the database changes after each indexing of a 
+	# document
+	def test_document_database_increase(self): 
+		args = 'index.py -d "%s" -b ' + self.test_table 
+		doc_1 = 'data/documents/information-processing.txt' 
+		doc_2 = 'data/documents/nintendogs.txt' 
+		website_regex = r'Table\(website\) size: ([0-9]+)'
+		token_regex = r'Table\(token\) size: ([0-9]+)'
+		
+		self.remove_test_table()
+		
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
+			main(args % doc_1)
+			out = fake_out.getvalue()
+			start_website_size = re.search(website_regex, out).group(1)
+			start_token_size = re.search(token_regex, out).group(1)
+			
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out: 
+			main(args % doc_2)
+			out = fake_out.getvalue() 
+			end_website_size = re.search(website_regex, out).group(1)
+			end_token_size = re.search(token_regex, out).group(1)
+					
+		try: 
+			start_website_size = int(start_website_size) 
+			start_token_size = int(start_token_size) 
+			end_website_size = int(end_website_size) 
+			end_token_size = int(end_token_size) 
+		except ValueError: 
+			self.fail('Website/token regex did not match')
+			
+		self.assertGreater(end_website_size, start_website_size) 
+		self.assertGreater(end_token_size, start_token_size)
+
+
+	# Test that a website-collection that contains both unique websites and 
+	# unique documents are each indexed. 
+	def test_index_document_multi(self): 
+		args = 'index.py -w "data/links/multi-document.txt" -b null' 
+		website_regex = r'Table\(website\) size: ([0-9]+)'
+		
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out: 
+			main(args)
+			out = fake_out.getvalue() 
+			website_size = re.search(website_regex, out).group(1) 
+			self.assertEquals(website_size, '3') # 3 docs in collection 
+
+
+	# Test that the size of the database changes after each indexing of a 
+	# website
+	def test_website_database_increase(self): 
+		args = 'index.py -w "%s" -b ' + self.test_table 
+		link_1 = 'https://en.wikipedia.org/wiki/Computer_science' 
+		link_2 = 'https://en.wikipedia.org/wiki/Nintendogs' 
+		website_regex = r'Table\(website\) size: ([0-9]+)'
+		token_regex = r'Table\(token\) size: ([0-9]+)'
+		
+		self.remove_test_table()
+		
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
+			main(args % link_1)
+			out = fake_out.getvalue()
+			start_website_size = re.search(website_regex, out).group(1)
+			start_token_size = re.search(token_regex, out).group(1)
+			
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out: 
+			main(args % link_2)
+			out = fake_out.getvalue() 
+			end_website_size = re.search(website_regex, out).group(1)
+			end_token_size = re.search(token_regex, out).group(1)
+					
+		try: 
+			start_website_size = int(start_website_size) 
+			start_token_size = int(start_token_size) 
+			end_website_size = int(end_website_size) 
+			end_token_size = int(end_token_size) 
+		except ValueError: 
+			self.fail('Website/token regex did not match')
+			
+		self.assertGreater(end_website_size, start_website_size) 
+		self.assertGreater(end_token_size, start_token_size)
+	
+	
+	# Tests that a query returns the expected documents
+	def test_document_query(self): 
+		insert_args = 'index.py -d "%s" -b ' + self.test_table 
+		query_args = 'index.py -q "%s" -b ' + self.test_table
+		doc_1 = 'data/documents/information-processing.txt'
+		doc_2 = 'data/documents/nintendogs.txt'
+		doc_1_unique_query = 'telecommunications' 
+		doc_2_unique_query = 'dog' 
+		doc_general_query = 'microphone'
+		website_regex = r'Table\(website\) size: ([0-9]+)'
+		
+		self.remove_test_table() 
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
+			main(insert_args % doc_1) 
+			out = fake_out.getvalue() 
+			doc_1_index = re.search(website_regex, out).group(1)
+		
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
+			main(insert_args % doc_2) 
+			out = fake_out.getvalue() 
+			doc_2_index = re.search(website_regex, out).group(1)
+			
+		try: 
+			doc_1_index = str(int(doc_1_index) - 1)
+			doc_2_index = str(int(doc_2_index) - 1)
+		except ValueError: 
+			self.fail('Website/token regex did not match')
+			
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
+			main(query_args % doc_1_unique_query)
+			out = fake_out.getvalue().strip()
+			self.assertTrue(doc_1_index in out.split(';'))
+		
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
+			main(query_args % doc_2_unique_query) 
+			out = fake_out.getvalue().strip() 
+			self.assertTrue(doc_2_index in out.split(';'))
+			
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
+			main(query_args % doc_general_query) 
+			out = fake_out.getvalue().strip()
+			indices = out.split(';') 
+			self.assertTrue(doc_1_index in indices and doc_2_index in indices)
+	
+	
+	# Tests that documents are ranked in the correct order given single-word 
+	# queries
+	def test_document_rank_single(self): 
+		insert_args = 'index.py -d "%s" -b ' + self.test_table 
+		query_args = 'index.py -q "%s" -b ' + self.test_table
+		doc_1 = 'data/documents/information-processing.txt'
+		doc_2 = 'data/documents/nintendogs.txt'
+		doc_1_relevancy_query = 'information'
+		doc_2_relevancy_query = 'microphone'
+		website_regex = r'Table\(website\) size: ([0-9]+)'
+		
+		self.remove_test_table() 
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
+			main(insert_args % doc_1) 
+			out = fake_out.getvalue() 
+			doc_1_index = re.search(website_regex, out).group(1)
+		
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
+			main(insert_args % doc_2) 
+			out = fake_out.getvalue()
+			doc_2_index = re.search(website_regex, out).group(1)
+		
+		try: 
+			doc_1_index = str(int(doc_1_index) - 1)
+			doc_2_index = str(int(doc_2_index) - 1)
+		except ValueError: 
+			self.fail('Website/token regex did not match')
+		
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
+			main(query_args % doc_1_relevancy_query)
+			out = fake_out.getvalue().strip()
+			indices = out.split(';') 
+			self.assertTrue(doc_1_index in indices and doc_2_index in indices)
+			self.assertLess(out.index(doc_1_index), out.index(doc_2_index)) 
+		
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
+			main(query_args % doc_2_relevancy_query)
+			out = fake_out.getvalue().strip() 
+			indices = out.split(';') 
+			self.assertTrue(doc_1_index in indices and doc_2_index in indices)
+			self.assertLess(out.index(doc_2_index), out.index(doc_1_index))
+			
+			
+	# Tests that documents are ranked in the correct order given multi-word 
+	# queries
+	def test_document_rank_multi(self): 
+		insert_args = 'index.py -d "%s" -b ' + self.test_table 
+		query_args = 'index.py -q "%s" -b ' + self.test_table
+		doc_1 = 'data/documents/information-processing.txt'
+		doc_2 = 'data/documents/nintendogs.txt'
+		doc_1_relevancy_query = 'what is the study of information and algorithm'
+		doc_2_relevancy_query = 'what information gets me better dogs'
+		website_regex = r'Table\(website\) size: ([0-9]+)'
+		
+		self.remove_test_table() 
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
+			main(insert_args % doc_1) 
+			out = fake_out.getvalue() 
+			doc_1_index = re.search(website_regex, out).group(1)
+		
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
+			main(insert_args % doc_2) 
+			out = fake_out.getvalue()
+			doc_2_index = re.search(website_regex, out).group(1)
+		
+		try: 
+			doc_1_index = str(int(doc_1_index) - 1)
+			doc_2_index = str(int(doc_2_index) - 1)
+		except ValueError: 
+			self.fail('Website/token regex did not match')
+		
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
+			main(query_args % doc_1_relevancy_query)
+			out = fake_out.getvalue().strip()
+			indices = out.split(';') 
+			self.assertTrue(doc_1_index in indices and doc_2_index in indices)
+			self.assertLess(out.index(doc_1_index), out.index(doc_2_index)) 
+		
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
+			main(query_args % doc_2_relevancy_query)
+			out = fake_out.getvalue().strip() 
+			indices = out.split(';') 
+			self.assertTrue(doc_1_index in indices and doc_2_index in indices)
+			self.assertLess(out.index(doc_2_index), out.index(doc_1_index))
+	
+
+
+# Tests for the totals kept alongside the index so queries don't have to work
+# them out. 
+class StatisticTests(unittest.TestCase): 
+	# Tests that the totals match what counting from scratch gives, whether 
+	# websites are written one at a time or in batches 
+	def test_totals(self): 
+		documents = ['data/documents/information-processing.txt', 
+		             'data/documents/nintendogs.txt'] 
+		with tempfile.TemporaryDirectory() as directory: 
+			links = os.path.join(directory, 'links.txt') 
+			with open(links, 'w') as links_file: 
+				links_file.write('\n'.join(documents)) 
+			
+			for args in ('', '--batch 1', '--batch 10'): 
+				database = os.path.join(directory, 'totals.db') 
+				with unittest.mock.patch('sys.stdout', new = io.StringIO()): 
+					main(f'index.py -d {documents[0]} -b {database}') 
+					main(f'index.py -w {links} -b {database} {args}') 
+				
+				cur = sqlite3.connect(database).cursor() 
+				self.assertEqual(statistic_get(cur, 'websites'), 2) 
+				command =  'SELECT token.df, COUNT(*) FROM token ' 
+				command += 'JOIN posting ON posting.stem = token.stem ' 
+				command += 'GROUP BY token.stem' 
+				for df, count in cur.execute(command).fetchall(): 
+					self.assertEqual(df, count) 
+				cur.connection.close() 
+				os.remove(database) 
+
+
+# Tests for numbering stems with the lexicon. 
+class LexiconTests(unittest.TestCase): 
+	# Tests that every stem gets a number of its own, handed out in order 
+	# whichever way websites are written, and that queries find them again 
+	def test_numbers(self): 
+		con = sqlite3.connect(':memory:') 
+		cur = con.cursor() 
+		create_tables(cur) 
+		index_document(cur, 'memory', 'a', {'dog': 2, 'cat': 1}, False) 
+		indexer = BulkIndexer(con) 
+		indexer.add('b', {'cat': 1, 'bird': 3}) 
+		indexer.flush() 
+		index_document(cur, 'memory', 'c', {'fish': 1, 'dog': 1}, False) 
+		
+		rows = cur.execute('SELECT stem, id FROM lexicon').fetchall() 
+		self.assertEqual(dict(rows), {'dog': 1, 'cat': 2, 'bird': 3, 
+		                              'fish': 4}) 
+		command = 'SELECT stem, df FROM token ORDER BY stem' 
+		self.assertEqual(cur.execute(command).fetchall(), 
+		                 [(1, 2), (2, 2), (3, 1), (4, 1)]) 
+		
+		lexicon = Lexicon(cur) 
+		self.assertEqual(lexicon.ids(['fish', 'missing', 'cat']), [2, 4]) 
+		self.assertIsNone(lexicon.find('missing')) 
+		lexicon.load() 
+		self.assertEqual(len(lexicon), 4) 
+		con.close() 
+
+
+# Tests for the different ways of scoring websites for a query. 
+@unittest.skipIf(not have_numpy, 'NumPy is not installed') 
+class ScorerTests(unittest.TestCase): 
+	# Tests that every scorer gives exactly the same scores, in the same order,
+	# on an index of made-up websites 
+	def test_same_ranking(self): 
+		rng = random.Random(0) 
+		words = [f'stem{i}' for i in range(300)] 
+		con = sqlite3.connect(':memory:') 
+		indexer = BulkIndexer(con) 
+		for i in range(500): 
+			stems = defaultdict(lambda: 0) 
+			for word in rng.choices(words, [1 / (x + 1) for x in range(300)], 
+			                        k=rng.randint(1, 100)): 
+				stems[word] += 1 
+			indexer.add(f'https://example.com/{i}', stems) 
+		indexer.flush() 
+		
+		cur = con.cursor() 
+		for _ in range(50): 
+			query = rng.sample(words, rng.randint(1, 6)) + ['missing'] 
+			stem_ids = Lexicon(cur).ids(query) 
+			for ranker in (TfIdf(), BM25(), BM25(0, 1)): 
+				expected = score_python(cur, stem_ids, ranker) 
+				self.assertGreater(len(expected), 0) 
+				self.assertEqual(score_numpy(cur, stem_ids, ranker), expected)
+		self.assertEqual(score_numpy(cur, [missing_stem_id]), []) 
+		con.close() 
+	
+	
+	# Tests that the scorer can be chosen from the command line 
+	def test_command_line(self): 
+		insert_args = 'index.py -d "%s" -b %s' 
+		query_args = 'index.py -q "information dogs" -b %s --scorer %s' 
+		with tempfile.TemporaryDirectory() as directory: 
+			database = os.path.join(directory, 'scorer.db') 
+			results = [] 
+			with unittest.mock.patch('sys.stdout', new = io.StringIO()): 
+				main(insert_args % ('data/documents/nintendogs.txt', database)) 
+				main(insert_args % ('data/documents/information-processing.txt',
+				                    database)) 
+			for scorer in scorers: 
+				with unittest.mock.patch('sys.stdout', new = io.StringIO()) \
+				     as fake_out: 
+					main(query_args % (database, scorer)) 
+					results.append(fake_out.getvalue()) 
+			self.assertEqual(results[0], results[1]) 
+			self.assertEqual(results[0].strip().split(';'), ['0', '1']) 
+
+
+# Tests for yielding only the best websites of a query with -k. 
+class TopKTests(unittest.TestCase): 
+	# Returns a connection to an index of made-up websites, the first half 
+	# written in batches and the rest one at a time. 
+	def make_index(self, rng, words): 
+		con = sqlite3.connect(':memory:') 
+		cur = con.cursor() 
+		indexer = BulkIndexer(con) 
+		for i in range(400): 
+			stems = defaultdict(lambda: 0) 
+			for word in rng.choices(words, [1 / (x + 1) for x in range(300)], 
+			                        k=rng.randint(1, 100)): 
+				stems[word] += 1 
+			if i < 200: 
+				indexer.add(f'https://example.com/{i}', stems) 
+			else: 
+				indexer.flush() 
+				index_document(cur, None, f'https://example.com/{i}', stems, 
+				               False) 
+		con.commit() 
+		return con 
+	
+	
+	# Tests that each stem's bound is the largest tf/m it has 
+	def test_bounds(self): 
+		rng = random.Random(1) 
+		con = self.make_index(rng, [f'stem{i}' for i in range(300)]) 
+		command =  'SELECT token.bound, MAX(CAST(posting.tf AS REAL) / website.m) '
+		command += 'FROM token JOIN posting ON posting.stem = token.stem ' 
+		command += 'JOIN website ON website.id = posting.doc GROUP BY token.stem'
+		for bound, expected in con.execute(command): 
+			self.assertEqual(bound, expected) 
+		con.close() 
+	
+	
+	# Tests that the best k websites are exactly the first k of the full 
+	# ranking, and that common stems are not read in full 
+	def test_same_ranking(self): 
+		rng = random.Random(0) 
+		words = [f'stem{i}' for i in range(300)] 
+		con = self.make_index(rng, words) 
+		cur = con.cursor() 
+		for _ in range(50): 
+			query = rng.sample(words, rng.randint(1, 6)) + ['missing'] 
+			stem_ids = Lexicon(cur).ids(query) 
+			for ranker in (TfIdf(), BM25()): 
+				expected = score_python(cur, stem_ids, ranker) 
+				for k in (1, 3, 10, len(expected), len(expected) + 5): 
+					websites, _ = score_top_k(cur, stem_ids, k, ranker) 
+					self.assertEqual(websites, expected[:k]) 
+		
+		stem_ids = Lexicon(cur).ids(['stem0', 'stem1', 'stem150'])
+		total = cur.execute('SELECT COUNT(*) FROM posting WHERE stem IN ' 
+		                    '(?, ?, ?)', stem_ids).fetchone()[0] 
+		self.assertLess(score_top_k(cur, stem_ids, 5)[1], total / 2) 
+		self.assertEqual(score_top_k(cur, [missing_stem_id], 5), 
+		                 ([], 0)) 
+		con.close() 
+	
+	
+	# Tests that -k cuts the websites yielded by a query 
+	def test_command_line(self): 
+		insert_args = 'index.py -d "%s" -b %s' 
+		query_args = 'index.py -q "information dogs" -b %s' 
+		with tempfile.TemporaryDirectory() as directory: 
+			database = os.path.join(directory, 'top.db') 
+			with unittest.mock.patch('sys.stdout', new = io.StringIO()): 
+				main(insert_args % ('data/documents/nintendogs.txt', database)) 
+				main(insert_args % ('data/documents/information-processing.txt',
+				                    database)) 
+			results = [] 
+			for extra in ('', ' -k 1', ' -k 5'): 
+				with unittest.mock.patch('sys.stdout', new = io.StringIO()) \
+				     as fake_out: 
+					main(query_args % database + extra) 
+					results.append(fake_out.getvalue().strip().split(';')) 
+			self.assertEqual(results, [['0', '1'], ['0'], ['0', '1']]) 
+
+
+# Tests for ranking websites with --ranker. 
+class RankerTests(unittest.TestCase): 
+	# Tests that BM25 scores are worked out from the lengths stored for each 
+	# website as the formula says 
+	def test_bm25(self): 
+		websites = [{'dog': 3, 'cat': 1}, {'dog': 1, 'bird': 4, 'fish': 5}, 
+		            {'cat': 2}] 
+		con = sqlite3.connect(':memory:') 
+		cur = con.cursor() 
+		for i, stems in enumerate(websites): 
+			index_document(cur, None, f'https://example.com/{i}', stems, False)
+		average = sum(sum(x.values()) for x in websites) / len(websites) 
+		
+		ranker = BM25(1.5, 0.5) 
+		expected = defaultdict(lambda: 0) 
+		for stem in ('dog', 'cat'): 
+			df = sum(stem in x for x in websites) 
+			idf = math.log(1 + (3 - df + 0.5) / (df + 0.5)) 
+			for i, stems in enumerate(websites): 
+				tf = stems.get(stem, 0) 
+				length = sum(stems.values()) 
+				if tf > 0: 
+					expected[i] += tf * 2.5 / \
+					               (tf + 1.5 * (0.5 + 0.5 * length / average)) \
+					               * idf 
+		stem_ids = Lexicon(cur).ids(['dog', 'cat']) 
+		scores = dict(score_python(cur, stem_ids, ranker)) 
+		self.assertEqual(scores.keys(), expected.keys()) 
+		for website, score in expected.items(): 
+			self.assertAlmostEqual(scores[website], score) 
+		con.close() 
+	
+	
+	# Tests that the ranker can be chosen from the command line, and that 
+	# tfidf stays the default 
+	def test_command_line(self): 
+		insert_args = 'index.py -d "%s" -b %s' 
+		query_args = 'index.py -q "information dogs" -b %s' 
+		with tempfile.TemporaryDirectory() as directory: 
+			database = os.path.join(directory, 'ranker.db') 
+			with unittest.mock.patch('sys.stdout', new = io.StringIO()): 
+				main(insert_args % ('data/documents/nintendogs.txt', database)) 
+				main(insert_args % ('data/documents/information-processing.txt',
+				                    database)) 
+			results = [] 
+			for extra in ('', ' --ranker tfidf', ' --ranker bm25', 
+			              ' --ranker bm25 --k1 2 --b 0 -k 1'): 
+				with unittest.mock.patch('sys.stdout', new = io.StringIO()) \
+				     as fake_out: 
+					main(query_args % database + extra) 
+					results.append(fake_out.getvalue().strip().split(';')) 
+			self.assertEqual(results[0], results[1]) 
+			self.assertEqual(sorted(results[2]), ['0', '1']) 
+			self.assertEqual(results[3], results[2][:1]) 
+
+
+# Tests for queries with phrases, AND and NOT. 
+class BooleanTests(unittest.TestCase): 
+	words = ['dog', 'cat', 'the', 'runs', 'fast', 'of', 'game', 'news'] 
+
+
+	# Tests that queries are split into the clauses websites must match 
+	def test_parse(self): 
+		clauses = parse_query('"the dogs run" AND cats -games NOT "fast news" ' 
+		                      'running AND', set(stopwords.words('english')), 
+		                      load_stemmer()) 
+		self.assertEqual(clauses, [('required', [(0, 'dog'), (1, 'run')]), 
+		                           ('required', [(0, 'cat')]), 
+		                           ('excluded', [(0, 'game')]), 
+		                           ('excluded', [(0, 'fast'), (1, 'news')]), 
+		                           ('required', [(0, 'run')])]) 
+
+
+	# Tests that intersecting and subtracting lists by galloping gives what 
+	# sets do 
+	def test_gallop(self): 
+		rng = random.Random(0) 
+		for _ in range(200): 
+			lists = [sorted(rng.sample(range(1000), rng.randint(0, 300))) 
+			         for _ in range(rng.randint(1, 4))] 
+			self.assertEqual(intersect(lists), 
+			                 sorted(set(lists[0]).intersection(*lists))) 
+			self.assertEqual(subtract(lists[0], lists[-1]), 
+			                 sorted(set(lists[0]) - set(lists[-1]))) 
+			for target in (-1, 0, 500, 1000): 
+				i = gallop(lists[0], target, rng.randint(0, len(lists[0]))) 
+				self.assertTrue(all(x >= target for x in lists[0][i:i + 1])) 
+
+
+	# Tests that websites match phrases, AND and NOT exactly as their words 
+	# say, and are scored as they would be without them 
+	def test_match(self): 
+		rng = random.Random(1) 
+		con = sqlite3.connect(':memory:') 
+		cur = con.cursor() 
+		stop_words = set(stopwords.words('english')) 
+		stemmer = load_stemmer() 
+		texts = [' '.join(rng.choices(self.words, k=rng.randint(1, 30))) 
+		         for _ in range(200)] 
+		indexer = BulkIndexer(con) 
+		for i, text in enumerate(texts): 
+			positions = defaultdict(list) 
+			stems = get_stem_dict(text, stop_words, stemmer, positions) 
+			if len(stems) > 0: 
+				indexer.add(str(i), stems, positions) 
+		indexer.flush() 
+		urls = dict(cur.execute('SELECT id, url FROM website')) 
+
+		# Whether the words of <phrase> are in <text>, one after another, where 
+		# stop words (which are not indexed) can be any word, or left out at 
+		# either end 
+		def contains(text, phrase): 
+			words = phrase.split() 
+			while words[0] in stop_words: 
+				words.pop(0) 
+			while words[-1] in stop_words: 
+				words.pop() 
+			words = [r'\w+' if x in stop_words else x for x in words] 
+			return re.search(fr'\b{" ".join(words)}\b', text) is not None 
+
+		queries = { 
+			'"the dog"': lambda x: contains(x, 'the dog'), 
+			'"dog of the game"': lambda x: contains(x, 'dog of the game'), 
+			'cat AND news': lambda x: 'cat' in x and 'news' in x, 
+			'"fast dog" AND cat -news': lambda x: contains(x, 'fast dog') and 
+			                             'cat' in x and 'news' not in x, 
+			'game NOT "runs fast"': lambda x: 'game' in x and 
+			                        not contains(x, 'runs fast'), 
+			'"game cat"': lambda x: contains(x, 'game cat'), 
+			'"dog zebra"': lambda x: False, 
+		} 
+		for query, matches in queries.items(): 
+			websites = rank_websites(cur, query, stop_words, stemmer) 
+			expected = [str(i) for i, x in enumerate(texts) if matches(x)] 
+			self.assertEqual(sorted(urls[x] for x, _ in websites), 
+			                 sorted(expected, key=str), query) 
+
+			# The scores are those of the words not excluded, without operators
+			plain = ' '.join(stem for kind, terms in parse_query(query, 
+			                 stop_words, stemmer) if kind != 'excluded' 
+			                 for _, stem in terms) 
+			scores = dict(rank_websites(cur, plain, stop_words, stemmer)) 
+			self.assertEqual(websites, sorted(((x, scores[x]) for x, _ in 
+			                                   websites), 
+			                                  key=lambda x: (-x[1], x[0]))) 
+			self.assertEqual(rank_websites(cur, query, stop_words, stemmer, 
+			                               k=3), websites[:3]) 
+		con.close() 
+
+
+# Tests for answering queries from a process that keeps running with --serve.
+class ServeTests(unittest.TestCase): 
+	def setUp(self): 
+		self.directory = tempfile.TemporaryDirectory() 
+		self.database = os.path.join(self.directory.name, 'serve.db') 
+		insert_args = 'index.py -d "%s" -b ' + self.database 
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()): 
+			main(insert_args % 'data/documents/nintendogs.txt') 
+			main(insert_args % 'data/documents/information-processing.txt') 
+	
+	
+	def tearDown(self): 
+		self.directory.cleanup() 
+	
+	
+	# Returns what index.py -q gives for <query>, as a list of ids. 
+	def query(self, query): 
+		query_args = 'index.py -q "%s" -b %s' 
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
+			main(query_args % (query, self.database)) 
+			return [int(x) for x in fake_out.getvalue().strip().split(';')] 
+	
+	
+	# Tests that queries read from stdin get the same answers as -q, and that
+	# bad requests get errors without stopping the server 
+	def test_stdin(self): 
+		requests = ['{"query": "information dogs"}', '', 'not json', 
+		            '{"query": "information dogs", "k": 1}', '{"k": 1}', 
+		            '{"query": "dogs", "k": 0}', '{"query": "zzzzzz"}'] 
+		with unittest.mock.patch('sys.stdin', new = io.StringIO( 
+		                         '\n'.join(requests) + '\n')), \
+		     unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
+			main(f'index.py --serve -b {self.database}') 
+			answers = [json.loads(x) for x in fake_out.getvalue().splitlines()]
+		
+		self.assertEqual(len(answers), 6) 
+		expected = self.query('information dogs') 
+		self.assertEqual([x[0] for x in answers[0]['websites']], expected) 
+		self.assertEqual(answers[2]['websites'], answers[0]['websites'][:1]) 
+		self.assertEqual(sorted(x[1] for x in answers[0]['websites']), 
+		                 ['data/documents/information-processing.txt', 
+		                  'data/documents/nintendogs.txt']) 
+		for answer in (answers[1], answers[3], answers[4]): 
+			self.assertIn('error', answer) 
+		self.assertEqual(answers[5], {'websites': []}) 
+	
+	
+	# Tests that a client connected to the socket gets the same answers as 
+	# the server gives in the same process 
+	def test_socket(self): 
+		path = os.path.join(self.directory.name, 'index.sock') 
+		con = sqlite3.connect(self.database, check_same_thread=False) 
+		server = QueryServer(con, set(stopwords.words('english')), 
+		                     load_stemmer()) 
+		listener = server.listen(path) 
+		thread = threading.Thread(target=listener.serve_forever) 
+		thread.start() 
+		try: 
+			client = QueryClient(path) 
+			for request in ({'query': 'information dogs'}, 
+			                {'query': 'microphone', 'k': 1}, {'k': 'x'}): 
+				self.assertEqual(client.answer(request), server.answer(request))
+			client.close() 
+		finally: 
+			listener.shutdown() 
+			listener.server_close() 
+			thread.join() 
+			con.close() 
+
+
+# Tests for starting index.py quickly. 
+class StartupTests(unittest.TestCase): 
+	# Tests that the bundled stop words are the ones nltk downloads, so 
+	# websites are indexed the same as before 
+	def test_stop_words(self): 
+		try: 
+			from nltk.corpus import stopwords as nltk_stopwords 
+			expected = nltk_stopwords.words('english') 
+		except LookupError: 
+			self.skipTest('the nltk stopwords corpus is not downloaded') 
+		self.assertEqual(stopwords.words('english'), expected) 
+	
+	
+	# Tests that importing index.py leaves out the modules that are slow to 
+	# import until they are needed 
+	def test_lazy_imports(self): 
+		command =  'import sys, index; ' 
+		command += 'print(" ".join(sorted(x for x in sys.modules ' 
+		command += 'if x.split(".")[0] in ("nltk", "numpy", "unittest", ' 
+		command += '"parameterized", "extract", "crawl", "bs4", "lxml"))))' 
+		directory = os.path.dirname(os.path.abspath(index.__file__)) 
+		result = subprocess.run([sys.executable, '-c', command], check=True, 
+		                        cwd=directory, capture_output=True, text=True)
+		self.assertEqual(result.stdout.strip(), '') 
+
+
+# Tests for writing many websites at once with --batch. 
+class BatchTests(unittest.TestCase): 
+	def setUp(self): 
+		self.directory = tempfile.TemporaryDirectory() 
+		self.links = os.path.join(self.directory.name, 'links.txt') 
+		with open(self.links, 'w') as links: 
+			links.write('data/documents/information-processing.txt\n') 
+			links.write('data/documents/nintendogs.txt\n') 
+			links.write('data/documents/information-processing.txt\n') 
+	
+	
+	def tearDown(self): 
+		self.directory.cleanup() 
+	
+	
+	# Indexes the links file with <args> into a new database, returning the 
+	# contents of its tables 
+	def index(self, name, args): 
+		database = os.path.join(self.directory.name, name) 
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()): 
+			main(f'index.py -w {self.links} -b {database} {args}') 
+		con = sqlite3.connect(database) 
+		websites = con.execute('SELECT * FROM website ORDER BY id').fetchall()
+		tokens = con.execute('SELECT * FROM token ORDER BY stem').fetchall() 
+		con.close() 
+		return websites, tokens 
+	
+	
+	# Tests that writing in batches gives the same tables as writing each 
+	# website on its own, including skipping the duplicate 
+	def test_same_tables(self): 
+		expected = self.index('single.db', '') 
+		self.assertEqual(len(expected[0]), 2) 
+		for size in (1, 2, 100): 
+			self.assertEqual(self.index(f'batch-{size}.db', f'--batch {size}'),
+			                 expected) 
+	
+	
+	# Tests that batches add on to a database that already has websites in it
+	def test_append(self): 
+		document = 'data/documents/nintendogs.txt' 
+		results = [] 
+		for name, args in (('single.db', ''), ('batch.db', '--batch 10')): 
+			database = os.path.join(self.directory.name, name) 
+			with unittest.mock.patch('sys.stdout', new = io.StringIO()): 
+				main(f'index.py -d {document} -b {database}') 
+			results.append(self.index(name, args)) 
+		
+		self.assertEqual(results[0], results[1]) 
+		self.assertEqual(results[1][0][0][1], document) 
+	
+	
+	# Tests that stemming in worker processes gives the same tables 
+	def test_workers(self): 
+		expected = self.index('single.db', '') 
+		for workers, batch_size in ((1, 100), (2, 100), (2, 1)): 
+			name = f'workers-{workers}-{batch_size}.db' 
+			args = f'--workers {workers} --batch {batch_size}' 
+			self.assertEqual(self.index(name, args), expected) 
+
+
+# Tests for changing and deleting websites that were already indexed. 
+class UpdateTests(unittest.TestCase): 
+	words = ['dog', 'cat', 'the', 'runs', 'fast', 'of', 'game', 'news', 
+	         'bird', 'fish', 'information', 'processing', 'red', 'blue'] 
+	
+	
+	# Indexes <text> as <url> into the database behind <cur> with <write> 
+	# (index_document or update_document). 
+	def write(self, write, cur, url, text): 
+		positions = defaultdict(list) 
+		stems = get_stem_dict(text, self.stop_words, self.stemmer, positions) 
+		write(cur, 'memory', url, stems, False, positions=positions, 
+		      text_hash=content_hash(text)) 
+	
+	
+	# Returns the contents of the index behind <cur> with stems and websites 
+	# named rather than numbered: {(stem, url): (tf, positions)}, 
+	# {stem: (df, bound)} and the websites and length statistics. 
+	def contents(self, cur): 
+		command =  'SELECT lexicon.stem, website.url, tf, positions ' 
+		command += 'FROM posting JOIN website ON website.id = posting.doc ' 
+		command += 'JOIN lexicon ON lexicon.id = posting.stem' 
+		postings = {(x[0], x[1]): x[2:] for x in cur.execute(command)} 
+		command =  'SELECT lexicon.stem, df, bound FROM token ' 
+		command += 'JOIN lexicon ON lexicon.id = token.stem' 
+		tokens = {x[0]: x[1:] for x in cur.execute(command)} 
+		totals = [statistic_get(cur, x) for x in ('websites', 'length')] 
+		return postings, tokens, totals 
+	
+	
+	# Returns {url: score} of the websites found for <words> under <ranker>. 
+	def scores(self, cur, words, ranker): 
+		urls = dict(cur.execute('SELECT id, url FROM website')) 
+		scores = score_python(cur, Lexicon(cur).ids(words), ranker) 
+		return {urls[x]: round(y, 9) for x, y in scores} 
+	
+	
+	def setUp(self): 
+		self.stop_words = set(stopwords.words('english')) 
+		self.stemmer = load_stemmer() 
+	
+	
+	# Tests that changing, deleting and adding websites gives the index that 
+	# writing the websites as they end up from scratch gives, but for bounds 
+	# which are only ever raised until the index is compacted 
+	def test_same_index(self): 
+		rng = random.Random(3) 
+		def text(): 
+			return ' '.join(rng.choices(self.words, k=rng.randint(1, 40))) 
+		texts = {f'https://example.com/{i}': text() for i in range(60)} 
+		
+		updated = sqlite3.connect(':memory:').cursor() 
+		create_tables(updated) 
+		for url, website_text in texts.items(): 
+			self.write(index_document, updated, url, website_text) 
+		for i in rng.sample(range(60), 20): 
+			texts[f'https://example.com/{i}'] = text() 
+		for i in range(60, 65): 
+			texts[f'https://example.com/{i}'] = text() 
+		texts['https://example.com/3'] = 'the of' 
+		for url, website_text in texts.items(): 
+			self.write(update_document, updated, url, website_text) 
+		for i in (5, 7, 11): 
+			self.assertTrue(website_delete(updated, f'https://example.com/{i}'))
+			del texts[f'https://example.com/{i}'] 
+		del texts['https://example.com/3'] 
+		self.assertFalse(website_delete(updated, 'https://example.com/5')) 
+		
+		fresh = sqlite3.connect(':memory:').cursor() 
+		create_tables(fresh) 
+		for url, website_text in texts.items(): 
+			self.write(index_document, fresh, url, website_text) 
+		
+		expected = self.contents(fresh) 
+		postings, tokens, totals = self.contents(updated) 
+		self.assertEqual(postings, expected[0]) 
+		self.assertEqual(totals, expected[2]) 
+		self.assertEqual(tokens.keys(), expected[1].keys()) 
+		for stem, (df, bound) in tokens.items(): 
+			self.assertEqual(df, expected[1][stem][0]) 
+			self.assertGreaterEqual(bound, expected[1][stem][1]) 
+		for _ in range(20): 
+			words = rng.sample(self.words, rng.randint(1, 4)) 
+			stems = [self.stemmer.stem(x) for x in words] 
+			for ranker in (TfIdf(), BM25()): 
+				self.assertEqual(self.scores(updated, stems, ranker), 
+				                 self.scores(fresh, stems, ranker)) 
+		
+		self.assertFalse(compaction_due(updated)) 
+		self.assertTrue(compaction_due(updated, 0.05)) 
+		compact(updated) 
+		self.assertEqual(self.contents(updated), expected) 
+		count = 'SELECT COUNT(*) FROM posting' 
+		self.assertEqual(updated.execute(count).fetchone(), 
+		                 fresh.execute(count).fetchone()) 
+		self.assertFalse(compaction_due(updated)) 
+		updated.connection.close() 
+		fresh.connection.close() 
+	
+	
+	# Tests that --update skips documents that haven't changed, and that 
+	# --delete takes a document out of the results of queries 
+	def test_command_line(self): 
+		documents = ['data/documents/information-processing.txt', 
+		             'data/documents/nintendogs.txt'] 
+		with tempfile.TemporaryDirectory() as directory: 
+			database = os.path.join(directory, 'update.db') 
+			def run(args): 
+				out = io.StringIO() 
+				with unittest.mock.patch('sys.stdout', new = out): 
+					main(f'index.py {args} -b {database}') 
+				return out.getvalue() 
+			
+			for document in documents: 
+				run(f'-d {document}') 
+			con = sqlite3.connect(database) 
+			generation = statistic_get(con.cursor(), 'generation') 
+			out = run(f'-d {documents[0]} --update --verbose') 
+			self.assertRegex(out, 'Unchanged') 
+			self.assertEqual(statistic_get(con.cursor(), 'generation'), 
+			                 generation) 
+			
+			self.assertRegex(run('-q information'), '0;1') 
+			# A file of websites to delete, as with -w 
+			links = os.path.join(directory, 'links.txt') 
+			with open(links, 'w') as links_file: 
+				links_file.write(documents[0] + '\n') 
+			run(f'--delete {links}') 
+			self.assertRegex(run('-q information'), '^1$') 
+			# Half of the websites are deleted, so the index was compacted 
+			command = 'SELECT COUNT(*) FROM posting WHERE doc = 0' 
+			self.assertEqual(con.execute(command).fetchone()[0], 0) 
+			
+			# Indexed again, it gets a new id 
+			run(f'-d {documents[0]}') 
+			self.assertRegex(run('-q information'), '^2;1$') 
+			con.close() 
+	
+	
+	# Tests that a document is deleted by its name, even when it is the last 
+	# website in the database (which also compacts it) 
+	def test_delete_last(self): 
+		document = 'data/documents/nintendogs.txt' 
+		with tempfile.TemporaryDirectory() as directory: 
+			database = os.path.join(directory, 'delete.db') 
+			with unittest.mock.patch('sys.stdout', new = io.StringIO()): 
+				main(f'index.py -d {document} -b {database}') 
+			with unittest.mock.patch('sys.stdout', new = io.StringIO()) as out:
+				main(f'index.py --delete {document} -b {database} --verbose') 
+				self.assertRegex(out.getvalue(), f'Deleting "{document}" ... ')
+				self.assertRegex(out.getvalue(), 'Compacting') 
+				self.assertNotRegex(out.getvalue(), 'Table') 
+			
+			con = sqlite3.connect(database) 
+			for table in ('website', 'posting', 'tombstone'): 
+				command = f'SELECT COUNT(*) FROM {table}' 
+				self.assertEqual(con.execute(command).fetchone()[0], 0) 
+			con.close() 
+
+
+# Tests for indexing websites from a local server with --cache. 
+class CacheTests(crawl.LocalSiteTest): 
+	def setUp(self): 
+		super().setUp() 
+		self.cache = tempfile.TemporaryDirectory() 
+		self.database = os.path.join(self.cache.name, 'websites.db') 
+	
+	
+	def tearDown(self): 
+		self.cache.cleanup() 
+	
+	
+	# Runs main with <args> (anything after "index.py") and returns what it 
+	# printed. 
+	def index(self, args): 
+		args = f'index.py -b {self.database} --cache {self.cache.name} {args}'
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()) as fake_out:
+			main(args) 
+			return fake_out.getvalue() 
+	
+	
+	# Tests that a website which hasn't changed since it was indexed is not 
+	# parsed again 
+	def test_unchanged(self): 
+		url = self.url + '/a.html' 
+		out = self.index(f'-w {url} --verbose') 
+		self.assertRegex(out, 'Done') 
+		out = self.index(f'-w {url} --verbose') 
+		self.assertRegex(out, 'Unchanged') 
+		self.assertNotRegex(out, 'Inserting') 
+	
+	
+	# Tests that cached websites can be indexed and searched without 
+	# contacting the server 
+	def test_offline(self): 
+		url = self.url + '/b.html' 
+		self.index(f'-w {url}') 
+		os.remove(self.database) 
+		self.requests.clear() 
+		
+		out = self.index(f'-w {url} --offline --verbose')
+		self.assertRegex(out, 'Done') 
+		self.assertEqual(self.requests, []) 
+		self.assertEqual(self.index('-q welcome').strip(), '0') 
+
+
+if __name__ == '__main__': 
+	unittest.main() 
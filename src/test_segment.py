@@ -0,0 +1,200 @@
+import os
+import io
+import random
+import sqlite3
+import tempfile
+import unittest
+import unittest.mock
+from collections import defaultdict
+from parameterized import parameterized
+
+import index
+import stopwords
+from segment import *
+
+
+# Boilerplate tests that verify command-line arguments, where the key is the
+# name of the test and the value is the arguments supplied.
+cla_tests = {                                                                  \
+'no_args':                                                                     \
+	'segment.py',                                                              \
+'no_segment':                                                                  \
+	'segment.py data/table.db',                                                \
+'too_many_args':                                                               \
+	'segment.py data/table.db data/table.seg data/null.seg',                   \
+'unknown_option':                                                              \
+	'segment.py data/table.db data/table.seg -q',                              \
+'missing_database':                                                            \
+	'segment.py data/this-database-should-not-exist.db data/table.seg'         \
+}
+
+
+# Collection of simple tests that should all return SystemExit signals (due to
+# sys.exit(1) calls) due to poor formatting of the command-line arguments.
+class CommandLineArgumentTest(unittest.TestCase):
+	# Runs each test case in cla_tests
+	@parameterized.expand(cla_tests.items())
+	def test_cla(self, name, args):
+		with self.assertRaises(SystemExit) as cm:
+			main(args)
+
+
+# Tests for writing indexes into segments and answering queries from them.
+class SegmentTests(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		self.database = os.path.join(self.directory.name, 'index.db')
+		self.segment = os.path.join(self.directory.name, 'index.seg')
+
+
+	def tearDown(self):
+		self.directory.cleanup()
+
+
+	# Indexes 300 made-up websites of <words>, some repeated many times, and
+	# writes them into a segment.
+	def make_index(self, rng, words):
+		con = sqlite3.connect(self.database)
+		indexer = index.BulkIndexer(con)
+		for i in range(300):
+			stems = defaultdict(lambda: 0)
+			for word in rng.choices(words, [1 / (x + 1) for x in range(300)],
+			                        k=rng.randint(1, 100)):
+				stems[word] += 1
+			indexer.add(f'https://example.com/{i}', stems)
+		indexer.flush()
+		con.close()
+		main(f'segment.py {self.database} {self.segment}')
+
+
+	# Tests that varints are decoded to what was encoded, however long
+	def test_varints(self):
+		values = [0, 1, 127, 128, 300, 16383, 16384, 2 ** 40, 5]
+		data = bytearray()
+		for value in values:
+			encode_varint(value, data)
+		self.assertEqual(len(data), 19)
+		self.assertEqual(decode_varints(data), values)
+		if index.have_numpy:
+			self.assertEqual(decode_varints_numpy(data).tolist(), values)
+
+
+	# Tests that a segment numbers stems as the database does and that every
+	# scorer gives exactly the same scores from it as from the database
+	def test_same_ranking(self):
+		rng = random.Random(0)
+		words = [f'stem{i}' for i in range(300)]
+		self.make_index(rng, words)
+		con = sqlite3.connect(self.database)
+		cur = con.cursor()
+		segment = Segment(self.segment)
+
+		lexicon = index.Lexicon(cur)
+		self.assertEqual(segment.ids(words + ['missing']), lexicon.ids(words))
+		self.assertEqual(segment.urls([0, 299]), {0: 'https://example.com/0',
+		                 299: 'https://example.com/299'})
+		scorers = [index.score_python]
+		if index.have_numpy:
+			scorers.append(index.score_numpy)
+		for _ in range(30):
+			stem_ids = lexicon.ids(rng.sample(words, rng.randint(1, 6)))
+			for ranker in (index.TfIdf(), index.BM25()):
+				expected = index.score_python(cur, stem_ids, ranker)
+				for score in scorers:
+					self.assertEqual(score(segment, stem_ids, ranker), expected)
+				for k in (1, 10):
+					self.assertEqual(index.score_top_k(segment, stem_ids, k,
+					                                   ranker),
+					                 index.score_top_k(cur, stem_ids, k, ranker))
+		segment.close()
+		con.close()
+
+
+	# Tests that queries with phrases, AND and NOT get the same websites from
+	# a segment as from the database
+	def test_boolean(self):
+		rng = random.Random(2)
+		words = ['dog', 'cat', 'the', 'runs', 'fast', 'of', 'game', 'news']
+		stop_words = set(stopwords.words('english'))
+		stemmer = index.load_stemmer()
+		con = sqlite3.connect(self.database)
+		indexer = index.BulkIndexer(con)
+		for i in range(200):
+			text = ' '.join(rng.choices(words, k=rng.randint(1, 300)))
+			positions = defaultdict(list)
+			stems = index.get_stem_dict(text, stop_words, stemmer, positions)
+			indexer.add(f'https://example.com/{i}', stems, positions)
+		indexer.add('https://example.com/old', {'dog': 1, 'cat': 1})
+		indexer.flush()
+		main(f'segment.py {self.database} {self.segment}')
+
+		segment = Segment(self.segment)
+		cur = con.cursor()
+		for query in ('"the dog runs"', 'cat AND "fast news"', 'game -cat',
+		              '"dog cat" NOT "runs of the game"', 'dog AND cat'):
+			self.assertEqual(index.rank_websites(segment, query, stop_words,
+			                                     stemmer),
+			                 index.rank_websites(cur, query, stop_words,
+			                                     stemmer), query)
+		segment.close()
+		con.close()
+
+
+	# Tests that index.py answers queries from a segment as from the database,
+	# without needing the database
+	def test_query(self):
+		insert_args = 'index.py -d "%s" -b ' + self.database
+		with unittest.mock.patch('sys.stdout', new = io.StringIO()):
+			index.main(insert_args % 'data/documents/nintendogs.txt')
+			index.main(insert_args % 'data/documents/information-processing.txt')
+		main(f'segment.py {self.database} {self.segment}')
+
+		results = []
+		for source in (f'-b {self.database}', f'--segment {self.segment}'):
+			with unittest.mock.patch('sys.stdout', new = io.StringIO()) as out:
+				index.main(f'index.py -q "information dogs" {source} --verbose')
+				results.append(out.getvalue())
+			if os.path.exists(self.database):
+				os.remove(self.database)
+		self.assertRegex(results[0], 'nintendogs')
+		self.assertEqual(results[0], results[1])
+		self.assertFalse(os.path.exists(self.database))
+
+		segment = Segment(self.segment)
+		server = index.QueryServer(None, set(stopwords.words('english')),
+		                           index.load_stemmer(), segment=segment)
+		answer = server.answer({'query': 'information dogs', 'k': 1})
+		self.assertEqual(answer['websites'][0][0],
+		                 int(results[0].split(';')[0]))
+		segment.close()
+
+
+	# Tests that files which are not segments are refused
+	def test_not_segment(self):
+		for contents in (b'', b'SQLite format 3\0', magic + bytes(8)):
+			with open(self.segment, 'wb') as segment_file:
+				segment_file.write(contents)
+			with self.assertRaises(ValueError):
+				Segment(self.segment)
+		with self.assertRaises(SystemExit):
+			index.main(f'index.py -q test --segment {self.segment}')
+
+
+	# Tests that writing a segment again leaves processes reading the old one
+	# answering from it
+	def test_replace(self):
+		rng = random.Random(1)
+		words = [f'stem{i}' for i in range(300)]
+		self.make_index(rng, words)
+		segment = Segment(self.segment)
+		before = segment.urls([5])
+		os.remove(self.database)
+		self.make_index(rng, ['other' + x for x in words])
+		self.assertEqual(segment.urls([5]), before)
+		self.assertIsNone(segment.find('otherstem0'))
+		self.assertIsNotNone(Segment(self.segment).find('otherstem0'))
+		segment.close()
+
+
+if __name__ == '__main__':
+	unittest.main()
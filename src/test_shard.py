@@ -0,0 +1,145 @@
+import os
+import io
+import random
+import sqlite3
+import tempfile
+import unittest
+import unittest.mock
+from collections import defaultdict
+
+import index
+import stopwords
+from shard import *
+
+
+# Tests for splitting the index into shards and querying all of them at once.
+class ShardTests(unittest.TestCase):
+	words = ['dog', 'cat', 'the', 'runs', 'fast', 'of', 'game', 'news',
+	         'bird', 'fish', 'information', 'processing', 'red', 'blue']
+
+
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		self.database = os.path.join(self.directory.name, 'index.db')
+		self.stop_words = set(stopwords.words('english'))
+		self.stemmer = index.load_stemmer()
+
+
+	def tearDown(self):
+		self.directory.cleanup()
+
+
+	# Tests that websites are spread evenly over the shards, always into the
+	# same one, and numbered apart
+	def test_partition(self):
+		urls = [f'https://example.com/{i}' for i in range(400)]
+		counts = defaultdict(lambda: 0)
+		for url in urls:
+			counts[shard_of(url, 4)] += 1
+		self.assertEqual(sorted(counts), [0, 1, 2, 3])
+		for count in counts.values():
+			self.assertTrue(70 <= count <= 130, counts)
+		self.assertEqual(shard_file('data/table.db', 2), 'data/table-2.db')
+
+		connections = [sqlite3.connect(':memory:') for _ in range(4)]
+		indexer = ShardedIndexer(connections, 7)
+		ids = [indexer.add(url, {'dog': 1}) for url in urls]
+		self.assertIsNone(indexer.add(urls[0], {'cat': 1}))
+		indexer.flush()
+		self.assertEqual(len(set(ids)), len(urls))
+		for url, website in zip(urls, ids):
+			self.assertIn(url, indexer)
+			local, number = local_id(website, 4)
+			self.assertEqual(number, shard_of(url, 4))
+			command = 'SELECT url FROM website WHERE id = ?'
+			self.assertEqual(connections[number].execute(command, (local,))
+			                 .fetchone()[0], url)
+
+
+	# Tests that shards find the websites one database holding all of them
+	# finds, with the same scores, for every kind of query, whether they are
+	# queried in a pool of threads or one after the other
+	def test_same_ranking(self):
+		rng = random.Random(4)
+		con = sqlite3.connect(self.database)
+		connections = [sqlite3.connect(shard_file(self.database, x))
+		               for x in range(3)]
+		indexers = [index.BulkIndexer(con), ShardedIndexer(connections)]
+		urls = {}
+		for i in range(300):
+			text = ' '.join(rng.choices(self.words, k=rng.randint(1, 200)))
+			positions = defaultdict(list)
+			stems = index.get_stem_dict(text, self.stop_words, self.stemmer,
+			                            positions)
+			url = f'https://example.com/{i}'
+			urls[indexers[1].add(url, stems, positions)] = url
+			indexers[0].add(url, stems, positions)
+		for indexer in indexers:
+			indexer.flush()
+		for shard_con in connections:
+			shard_con.close()
+
+		cur = con.cursor()
+		expected_urls = dict(cur.execute('SELECT id, url FROM website'))
+		for workers in (1, 2):
+			sharded = ShardedIndex(self.database, 3, workers)
+			sharded.check()
+			self.check_ranking(sharded, cur, urls, expected_urls)
+			sharded.close()
+		con.close()
+
+
+	# Checks that <sharded> ranks websites as the database behind <cur> does,
+	# where <urls> and <expected_urls> are {id: url} of each
+	def check_ranking(self, sharded, cur, urls, expected_urls):
+		for query in ('dog cat', 'information fish red', '"the dog runs"',
+		              'game AND news -bird', 'blue NOT "fast cat"'):
+			for ranker in (index.TfIdf(), index.BM25()):
+				for k in (None, 5):
+					expected = index.rank_websites(cur, query, self.stop_words,
+					                               self.stemmer, k=k,
+					                               ranker=ranker)
+					websites = sharded.rank(query, self.stop_words,
+					                        self.stemmer, 'python', k, ranker)
+					self.assertEqual([round(x[1], 9) for x in websites],
+					                 [round(x[1], 9) for x in expected], query)
+					if k is None:
+						self.assertEqual({urls[x]: round(y, 9) for x, y
+						                  in websites},
+						                 {expected_urls[x]: round(y, 9) for x, y
+						                  in expected}, query)
+		self.assertEqual(sharded.urls(list(urls)[:5]),
+		                 {x: urls[x] for x in list(urls)[:5]})
+
+
+	# Tests that index.py writes websites into shards and answers queries
+	# from them as from one database
+	def test_command_line(self):
+		links = os.path.join(self.directory.name, 'links.txt')
+		with open(links, 'w') as links_file:
+			links_file.write('data/documents/information-processing.txt\n')
+			links_file.write('data/documents/nintendogs.txt\n')
+		single = os.path.join(self.directory.name, 'single.db')
+
+		def run(args):
+			out = io.StringIO()
+			with unittest.mock.patch('sys.stdout', new = out):
+				index.main(f'index.py {args}')
+			return out.getvalue()
+
+		run(f'-w {links} -b {self.database} --shards 2')
+		run(f'-w {links} -b {single}')
+		self.assertFalse(os.path.exists(self.database))
+		for x in range(2):
+			self.assertTrue(os.path.isfile(shard_file(self.database, x)))
+
+		query = '-q "information dogs" --verbose'
+		expected = run(f'{query} -b {single}').split('\n')[1:]
+		self.assertEqual(run(f'{query} -b {self.database} --shards 2')
+		                 .split('\n')[1:], expected)
+		with self.assertRaises(SystemExit):
+			run(f'{query} -b {self.database} --shards 3')
+
+
+if __name__ == '__main__':
+	unittest.main()